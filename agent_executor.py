@@ -1,37 +1,136 @@
+import re
 import time
 import json
-from typing import Dict, Any, List
+import contextvars
+from typing import Dict, Any, List, Optional
 from langchain.agents import AgentExecutor, create_react_agent
 from langchain_core.tools import BaseTool
-from langchain_openai import ChatOpenAI
+from langchain_core.language_models import BaseChatModel
 from prompts import agent_system_prompt
-from agent_tools import JDAnalysisTool, InterviewScheduleTool, KnowledgeBaseQueryTool, ProgressTrackingTool
+from utils import init_moonshot_llm
+from retry_policy import is_rate_limit_error
+from tracing import TracingCallbackHandler, span, trace
+from agent_tools import JDAnalysisTool, InterviewScheduleTool, KnowledgeBaseQueryTool, ProgressTrackingTool, is_tool_error
 import os
+from concurrent.futures import ThreadPoolExecutor
+
+# 执行方式："pipeline" 按固定流程直接调用工具（JD 分析 -> 冲刺计划 + 知识库查询），每次运行只调用 2 次 LLM；
+# "react" 由 ReAct Agent 自行决定调用哪些工具，每一步推理都是一次额外的 LLM 调用
+AGENT_RUN_MODES = ("pipeline", "react")
+AGENT_RUN_MODE = os.getenv("AGENT_RUN_MODE", "pipeline")
+STEP_PREVIEW_CHARS = 200  # 执行步骤中每个工具输出的预览长度
+KB_QUERY_MAX_CHARS = 300  # 流水线模式下知识库查询内容的最大长度
+AGENT_MAX_CONCURRENCY = int(os.getenv("AGENT_MAX_CONCURRENCY", 4))  # 并发执行的互不依赖的工具调用数
 
 class JobSearchAgent:
-    def __init__(self, llm: ChatOpenAI, tools: List[BaseTool]):
+    def __init__(self, llm: BaseChatModel, tools: List[BaseTool], mode: str = AGENT_RUN_MODE):
+        if mode not in AGENT_RUN_MODES:
+            raise ValueError(f"未知的执行方式: {mode}（可选 {', '.join(AGENT_RUN_MODES)}）")
         self.llm = llm
         self.tools = tools
+        self.mode = mode
+        self._tools_by_name = {tool.name: tool for tool in tools}
         
-        # 获取工具名称列表
-        tool_names = [tool.name for tool in tools]
+        if mode == "react":
+            # create_react_agent 会自行填充 tools 和 tool_names
+            self.agent = create_react_agent(llm, tools, agent_system_prompt)
+            self.agent_executor = AgentExecutor(
+                agent=self.agent, 
+                tools=tools, 
+                verbose=True, 
+                max_iterations=10,  # 增加最大迭代次数
+                handle_parsing_errors=True,  # 处理解析错误
+                return_intermediate_steps=True  # 返回中间步骤
+            )
+    
+    def analyze_jd_and_generate_plan(self, jd_content: str, resume_content: str, interview_date: str) -> Dict[str, Any]:
+        """
+        分析JD并生成计划，按执行方式走固定流水线或 ReAct 循环，返回结构相同
+        """
+        with trace(f"agent_{self.mode}") as request_trace:
+            if self.mode == "pipeline":
+                result = self._run_pipeline(jd_content, resume_content, interview_date)
+            else:
+                result = self._run_react(jd_content, resume_content, interview_date)
+            if not result["success"]:
+                request_trace.error = result["error"]
+            return result
+
+    def _call_tool(self, name: str, tool_input: Dict[str, Any]) -> tuple[str, str]:
+        """直接调用工具，返回 (输出, 执行步骤描述)"""
+        start = time.perf_counter()
+        with span(f"tool.{name}") as tool_span:
+            output = str(self._tools_by_name[name].invoke(tool_input))
+            if is_tool_error(output):
+                tool_span["error"] = output[:STEP_PREVIEW_CHARS]
+        preview = output if len(output) <= STEP_PREVIEW_CHARS else output[:STEP_PREVIEW_CHARS] + "…"
+        return output, f"{name}（{time.perf_counter() - start:.1f}s） -> {preview}"
+
+    def _fan_out(self, calls: List[tuple[str, Dict[str, Any]]]) -> List[tuple[str, str]]:
+        """
+        并发执行互不依赖的工具调用，结果按 calls 的顺序返回
         
-        # 创建带有tool_names的prompt
-        agent_prompt = agent_system_prompt.partial(tool_names=tool_names)
+        LLM 调用共享进程内的限流额度（见 rate_limiter），并发不会超出 RPM / TPM 配额；
+        总耗时约等于最慢的一个分支。每个分支在调用方上下文的副本中运行，span 仍记入同一个请求追踪。
+        """
+        if len(calls) <= 1:
+            return [self._call_tool(name, tool_input) for name, tool_input in calls]
+        with ThreadPoolExecutor(max_workers=min(AGENT_MAX_CONCURRENCY, len(calls))) as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, self._call_tool, name, tool_input)
+                for name, tool_input in calls
+            ]
+            return [future.result() for future in futures]
+
+    def _run_pipeline(self, jd_content: str, resume_content: str, interview_date: str) -> Dict[str, Any]:
+        """
+        固定流程：jd_analysis -> interview_schedule、knowledge_base_query、progress_tracking（并发）
         
-        self.agent = create_react_agent(llm, tools, agent_prompt)
-        self.agent_executor = AgentExecutor(
-            agent=self.agent, 
-            tools=tools, 
-            verbose=True, 
-            max_iterations=10,  # 增加最大迭代次数
-            handle_parsing_errors=True,  # 处理解析错误
-            return_intermediate_steps=True  # 返回中间步骤
+        不经过 Agent 推理，LLM 调用次数固定为 2 次（JD 分析、冲刺计划），命中响应缓存时更少；
+        知识库查询直接检索向量索引，不调用 LLM。JD 分析之后的三个工具只依赖分析结果，并发执行。
+        """
+        start = time.perf_counter()
+        analysis, analysis_step = self._call_tool(
+            "jd_analysis", {"jd_content": jd_content, "resume_content": resume_content}
         )
-    
-    def analyze_jd_and_generate_plan(self, jd_content: str, resume_content: str, interview_date: str) -> Dict[str, Any]:
+        if is_tool_error(analysis):
+            if "API限流" in analysis:
+                return {
+                    "success": False,
+                    "error": "API限流，请使用离线测试模式或稍后重试。",
+                    "suggestion": "推荐使用离线测试模式，可立即查看完整分析结果"
+                }
+            return {
+                "success": False,
+                "error": f"JD分析失败: {analysis}",
+                "suggestion": "请检查输入内容或使用传统模式"
+            }
+
+        # 分析之后的分支：(报告标题, 工具名, 输入)，只保留当前工具集中存在的工具
+        branches = [
+            ("## 📅 面试冲刺计划", "interview_schedule", {"jd_analysis_result": analysis, "interview_date": interview_date}),
+            ("## 📚 知识库参考", "knowledge_base_query", {"query": _knowledge_query(jd_content, analysis)}),
+            ("## 📈 进度建议", "progress_tracking", {"current_progress": f"已完成JD匹配度分析，面试日期 {interview_date}，开始按冲刺计划准备"}),
+        ]
+        branches = [branch for branch in branches if branch[1] in self._tools_by_name]
+        outputs = self._fan_out([(name, tool_input) for _, name, tool_input in branches])
+
+        sections = ["## 📊 JD 分析\n\n" + analysis]
+        sections += [f"{title}\n\n{output}" for (title, _, _), (output, _) in zip(branches, outputs)]
+        steps = [analysis_step] + [step for _, step in outputs]
+        steps = [f"步骤{i}: {step}" for i, step in enumerate(steps, 1)]
+        print(f"流水线执行完成：{len(steps)} 次工具调用，耗时 {time.perf_counter() - start:.1f}s")
+        result = "\n\n".join(sections)
+        return {
+            "success": True,
+            "result": result,
+            "iterations": len(steps),
+            "steps": steps
+        }
+
+    def _run_react(self, jd_content: str, resume_content: str, interview_date: str) -> Dict[str, Any]:
         """
-        分析JD并生成计划，包含智能限流处理
+        由 ReAct Agent 决定工具调用，包含智能限流处理
         """
         # 构建更明确的输入，减少内容长度
         user_input = f"""
@@ -43,27 +142,31 @@ class JobSearchAgent:
 请提供详细的分析结果。
 """
         
-        max_retries = 2  # 减少重试次数
-        retry_delay = 15  # 增加初始延迟
-        
-        for attempt in range(max_retries):
-            try:
-                print(f"Agent执行尝试 {attempt + 1}/{max_retries}")
-                
-                # 在每次尝试前添加延迟
-                if attempt > 0:
-                    print(f"等待 {retry_delay} 秒后重试...")
-                    time.sleep(retry_delay)
-                    retry_delay *= 2  # 指数退避
-                
-                # 执行Agent
-                result = self.agent_executor.invoke({"input": user_input})
-                
-                # 检查结果是否完整
-                output = result.get("output", "")
-                if "Agent stopped due to iteration limit" in output or len(output.strip()) < 50:
-                    # 如果结果不完整，返回基本信息
-                    output = f"""
+        # 重试、退避和熔断由 LLM 客户端的统一重试层负责，这里只执行一次
+        try:
+            # 模型调用由 ChatOpenAI 自带的回调记录，这里只补充工具调用的 span
+            result = self.agent_executor.invoke(
+                {"input": user_input}, config={"callbacks": [TracingCallbackHandler(llm=False, tools=True)]}
+            )
+        except Exception as e:
+            print(f"Agent执行失败: {e}")
+            if is_rate_limit_error(e):
+                return {
+                    "success": False,
+                    "error": f"API限流，自动重试后仍未成功：{e}",
+                    "suggestion": "推荐使用离线测试模式，可立即查看完整分析结果"
+                }
+            return {
+                "success": False,
+                "error": f"Agent执行错误: {e}",
+                "suggestion": "请检查输入内容或使用传统模式"
+            }
+
+        # 检查结果是否完整
+        output = result.get("output", "")
+        if "Agent stopped due to iteration limit" in output or len(output.strip()) < 50:
+            # 如果结果不完整，返回基本信息
+            output = f"""
 ## 📊 Agent 分析结果
 
 ### 职位描述分析
@@ -80,65 +183,60 @@ class JobSearchAgent:
 ### 当前分析结果
 {output}
 """
-                
-                # 如果成功，返回结果
-                return {
-                    "success": True,
-                    "result": output,
-                    "iterations": len(result.get("intermediate_steps", [])),
-                    "steps": [f"步骤{i+1}: {step}" for i, step in enumerate(result.get("intermediate_steps", []))]
-                }
-                
-            except Exception as e:
-                error_str = str(e)
-                print(f"尝试 {attempt + 1} 失败: {error_str}")
-                
-                # 检查是否是限流错误
-                if "429" in error_str or "rate_limit" in error_str:
-                    if attempt < max_retries - 1:
-                        print(f"检测到API限流，将在 {retry_delay} 秒后重试...")
-                        continue
-                    else:
-                        return {
-                            "success": False,
-                            "error": f"API限流，已重试{max_retries}次。请使用离线测试模式或等待10分钟后重试。",
-                            "suggestion": "推荐使用离线测试模式，可立即查看完整分析结果"
-                        }
-                else:
-                    # 其他错误，直接返回
-                    return {
-                        "success": False,
-                        "error": f"Agent执行错误: {error_str}",
-                        "suggestion": "请检查输入内容或使用传统模式"
-                    }
-        
+
         return {
-            "success": False,
-            "error": "API调用失败",
-            "suggestion": "请使用离线测试模式或传统模式"
+            "success": True,
+            "result": output,
+            "iterations": len(result.get("intermediate_steps", [])),
+            "steps": [f"步骤{i+1}: {step}" for i, step in enumerate(result.get("intermediate_steps", []))]
         }
 
-def create_job_search_agent(temperature: float = 0.7) -> JobSearchAgent:
+def _knowledge_query(jd_content: str, analysis: str) -> str:
+    """
+    流水线模式下的知识库查询内容：优先取分析结果中"技能差距"相关的条目，没有时退回到 JD 开头
+    """
+    lines = analysis.splitlines()
+    for i, line in enumerate(lines):
+        if re.search(r"技能差距|需要补充", line):
+            # 该行及其后紧跟的列表项
+            picked = [line]
+            for following in lines[i + 1:]:
+                if not following.strip().startswith(("-", "*", "•")) and not re.match(r"\s*\d+[.、]", following):
+                    break
+                picked.append(following)
+            picked[0] = re.split(r"[：:]", line, maxsplit=1)[-1]  # 去掉"需要补充的技能："这类标签
+            query = " ".join(re.sub(r"^[\s\-*•#\d.、]+", "", item) for item in picked).strip()
+            if query:
+                return query[:KB_QUERY_MAX_CHARS]
+    return jd_content.strip()[:KB_QUERY_MAX_CHARS]
+
+def create_job_search_agent(
+    temperature: float = 0.7,
+    mode: Optional[str] = None,
+    backend: Optional[str] = None
+) -> JobSearchAgent:
     """
     创建求职搜索Agent，包含智能限流处理
+    
+    Args:
+        temperature: LLM 温度
+        mode: 执行方式，"pipeline" 或 "react"；为 None 时使用 AGENT_RUN_MODE
+        backend: 对话模型后端，"moonshot" 或 "fake"（本地确定性模型）；为 None 时使用 LLM_BACKEND，
+            Agent 自身和工具内部的模型调用使用同一个后端
     """
-    # 初始化LLM，增加重试和超时设置
-    llm = ChatOpenAI(
-        temperature=temperature,
-        model_name="moonshot-v1-8k",
-        openai_api_key=os.getenv("MOONSHOT_API_KEY"),
-        openai_api_base="https://api.moonshot.cn/v1",
-        max_tokens=4096,
-        request_timeout=180,  # 增加超时时间到3分钟
-        max_retries=3  # 增加重试次数
+    # 复用进程内的LLM客户端和连接池，重试由统一重试层负责
+    llm = init_moonshot_llm(
+        temperature,
+        backend,
+        request_timeout=180  # 增加超时时间到3分钟
     )
     
     # 创建工具
     tools = [
-        JDAnalysisTool(),
-        InterviewScheduleTool(),
-        KnowledgeBaseQueryTool(),
-        ProgressTrackingTool()
+        JDAnalysisTool(llm_backend=backend),
+        InterviewScheduleTool(llm_backend=backend),
+        KnowledgeBaseQueryTool(llm_backend=backend),
+        ProgressTrackingTool(llm_backend=backend)
     ]
     
-    return JobSearchAgent(llm, tools) 
\ No newline at end of file
+    return JobSearchAgent(llm, tools, mode or AGENT_RUN_MODE) 
\ No newline at end of file
@@ -1,10 +1,25 @@
 import streamlit as st
 from dotenv import load_dotenv
 import os
+import time
+import uuid
 import datetime
 from prompts import jd_analysis_prompt, task_generation_prompt
-from utils import analyze_job_description, validate_inputs, generate_interview_schedule
-from agent_executor import create_job_search_agent, JobSearchAgent
+from utils import (
+    stream_job_description_analysis, stream_interview_schedule, analysis_error_message,
+    validate_inputs, get_response_cache, LLM_BACKEND
+)
+from job_queue import get_job_queue
+
+JOB_STREAM_INTERVAL = 0.2  # 有任务未结束时，刷新其输出区域的间隔（秒）；只更新占位区，不重跑整个页面
+JOB_HISTORY_SIZE = 10  # 侧边栏列出的历史任务数
+JOB_KIND_LABELS = {
+    "jd_analysis": "JD 分析",
+    "interview_schedule": "冲刺计划",
+    "agent_pipeline": "Agent（固定流程）",
+    "agent_react": "Agent（ReAct）",
+}
+JOB_STATUS_ICONS = {"queued": "⏳", "running": "🔄", "succeeded": "✅", "failed": "❌"}
 
 # --- .env 文件加载与调试 ---
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -26,6 +41,60 @@ if 'agent_mode' not in st.session_state:
     st.session_state.agent_mode = False
 if 'agent_instance' not in st.session_state:
     st.session_state.agent_instance = None
+if 'agent_config' not in st.session_state:
+    st.session_state.agent_config = None
+if 'last_trace' not in st.session_state:
+    st.session_state.last_trace = None
+# 各区域当前显示的后台任务 ID：JD 分析、冲刺计划、Agent 运行
+if 'jobs' not in st.session_state:
+    st.session_state.jobs = {"jd_analysis": None, "interview_schedule": None, "agent": None}
+# 提交者标识写在 URL 中，刷新页面或之后用同一链接打开仍能看到自己的历史任务
+if 'client_id' not in st.session_state:
+    st.session_state.client_id = st.query_params.get("client") or uuid.uuid4().hex[:12]
+st.query_params["client"] = st.session_state.client_id
+
+job_queue = get_job_queue()
+# 本次运行中未结束任务的输出占位区：任务 ID -> st.empty()，页面末尾持续刷新
+pending_panels = {}
+
+def job_slot(kind: str) -> str:
+    """任务类型对应的显示区域"""
+    return "agent" if kind.startswith("agent_") else kind
+
+def render_job(slot: str):
+    """
+    显示区域内当前任务的状态：未结束时显示进度和已输出的部分内容，结束后返回任务快照由调用方展示结果
+    """
+    job_id = st.session_state.jobs[slot]
+    if job_id is None:
+        return None
+    job = job_queue.get(job_id)
+    if job is None:
+        st.warning("任务记录已过期，请重新提交。")
+        st.session_state.jobs[slot] = None
+        return None
+    if job["status"] in ("queued", "running"):
+        pending_panels[job_id] = st.empty()
+        render_progress(pending_panels[job_id], job)
+    elif job["trace"]:
+        st.session_state.last_trace = job["trace"]
+    return job
+
+def render_progress(placeholder, job: dict):
+    """在占位区内显示未结束任务的状态和已输出的部分内容"""
+    with placeholder.container():
+        if job["status"] == "queued":
+            st.info("⏳ 任务排队中，可以继续操作页面，开始后会自动显示进度。")
+        else:
+            elapsed = time.time() - job["started_at"]
+            st.info(f"🔄 正在生成（已用时 {elapsed:.0f} 秒），可以继续操作页面，结果会自动显示。")
+            if job["output"]:
+                st.markdown(job["output"])
+
+def job_pending(slot: str) -> bool:
+    job_id = st.session_state.jobs[slot]
+    job = job_queue.get(job_id) if job_id else None
+    return job is not None and job["status"] in ("queued", "running")
 
 # --- 侧边栏 ---
 with st.sidebar:
@@ -43,8 +112,14 @@ with st.sidebar:
     if api_key_loaded:
         st.success("✅ API Key 已加载")
     else:
-        st.error("❌ API Key 未加载")
-        st.stop()
+        st.warning("⚠️ API Key 未加载，仅可使用离线测试模式")
+    
+    cache_stats = get_response_cache().stats()
+    st.caption(f"响应缓存：命中 {cache_stats['hits']} 次 / 未命中 {cache_stats['misses']} 次，共 {cache_stats['size']} 条")
+    queue_stats = job_queue.stats()
+    st.caption(f"后台任务：执行中 {queue_stats['running']} 个 / 排队 {queue_stats['queued']} 个")
+    # 最近一次请求的分阶段耗时，在页面末尾填充（本次运行中刚完成的请求也能立即显示）
+    trace_panel = st.container()
     
     # 模式选择
     st.divider()
@@ -55,9 +130,26 @@ with st.sidebar:
         help="Agent模式将自动完成所有任务，包括JD分析、计划生成和知识库查询"
     )
     st.session_state.agent_mode = agent_mode
+
+    # 离线测试模式：用本地确定性模型代替 Moonshot，检索、Prompt、Agent 和工具走与在线模式相同的流程
+    offline_mode = st.checkbox(
+        "🔧 离线测试模式（不调用API）",
+        value=not api_key_loaded or LLM_BACKEND == "fake",
+        disabled=not api_key_loaded,
+        help="使用本地模型按固定规则生成结构相同的结果，不受API限流影响，适合体验功能和调试"
+    )
+    llm_backend = "fake" if offline_mode else "moonshot"
+    if offline_mode:
+        st.info("🔧 离线测试模式已启用，分析结果由本地模型生成，仅供参考。")
     
     if agent_mode:
         st.info("Agent模式已启用！系统将自动完成所有任务。")
+        agent_run_mode = st.radio(
+            "执行方式",
+            ["pipeline", "react"],
+            format_func=lambda mode: "⚡ 固定流程（2 次模型调用）" if mode == "pipeline" else "🧠 ReAct 推理（自主选择工具）",
+            help="固定流程直接依次调用 JD 分析、计划生成和知识库查询；ReAct 由模型逐步推理决定调用哪些工具，调用次数更多"
+        )
     else:
         st.info("传统模式：手动分步骤执行。")
     
@@ -68,6 +160,25 @@ with st.sidebar:
         "AI分析灵活度", 0.0, 1.0, 0.7,
         help="值越低，输出越稳定；值越高，越有创意。"
     )
+    bypass_cache = st.checkbox(
+        "🔄 跳过响应缓存",
+        help="勾选后忽略已缓存的结果，重新调用模型生成（新结果仍会写入缓存）"
+    )
+
+    # 历史任务：点击后在对应区域重新显示结果
+    recent_jobs = job_queue.list_jobs(st.session_state.client_id, JOB_HISTORY_SIZE)
+    if recent_jobs:
+        st.divider()
+        st.subheader("📂 历史任务")
+        for item in recent_jobs:
+            submitted = datetime.datetime.fromtimestamp(item["created_at"]).strftime("%m-%d %H:%M")
+            label = (f"{JOB_STATUS_ICONS[item['status']]} {submitted} "
+                     f"{JOB_KIND_LABELS.get(item['kind'], item['kind'])} {item['title']}")
+            if st.button(label, key=f"open_job_{item['id']}", use_container_width=True):
+                slot = job_slot(item["kind"])
+                st.session_state.jobs[slot] = item["id"]
+                st.session_state.agent_mode = slot == "agent"
+                st.rerun()
 
 # --- 主界面：标签页布局 ---
 if agent_mode:
@@ -75,97 +186,20 @@ if agent_mode:
     st.title("🤖 智能求职助手 Agent")
     st.markdown("**Agent模式**：输入信息后，AI将自动完成所有分析、规划和推荐任务！")
     
-    # Agent状态显示
-    if st.session_state.agent_instance is None:
+    # Agent 依赖 langchain.agents，只在启用 Agent 模式时才导入，加快传统模式的首次渲染
+    from agent_executor import create_job_search_agent
+
+    # Agent状态显示（切换执行方式或模型后端时重新创建）
+    agent_config = (agent_run_mode, llm_backend)
+    if st.session_state.agent_instance is None or st.session_state.agent_config != agent_config:
         try:
-            st.session_state.agent_instance = create_job_search_agent(temperature)
+            st.session_state.agent_instance = create_job_search_agent(temperature, agent_run_mode, llm_backend)
+            st.session_state.agent_config = agent_config
             st.success("✅ Agent 初始化成功！")
         except Exception as e:
             st.error(f"❌ Agent 初始化失败：{str(e)}")
             st.stop()
     
-    # 离线测试选项
-    offline_mode = st.checkbox(
-        "🔧 离线测试模式（不调用API）",
-        help="启用此模式将使用模拟数据，避免API限流问题"
-    )
-    
-    if offline_mode:
-        st.info("🔧 离线测试模式已启用，将使用模拟数据")
-        
-        # 模拟Agent执行
-        if st.button("🚀 模拟Agent工作", key="mock_agent_work", type="primary"):
-            with st.spinner("🤖 模拟Agent正在工作中..."):
-                # 模拟结果
-                mock_result = f"""
-## 📊 模拟Agent分析结果
-
-### 1. 岗位匹配度分析
-- **技能匹配度评分：85/100**
-- **匹配的关键技能：**
-  - 机器学习基础（统计机器学习、在线机器学习课程）
-  - 技术背景（电子与计算机工程硕士）
-  - 团队协作能力（Unity实习经验）
-
-- **需要补充的技能差距：**
-  - 大模型实践经验
-  - 数据标注和评测集构建
-  - 产品策略制定经验
-
-### 2. 推荐重点准备的项目经验
-- **Unity实习项目：** 重点准备UI设计改进和需求文档撰写经验
-- **机器学习课程项目：** 准备统计机器学习和在线机器学习的实际应用案例
-
-### 3. 面试重点准备方向
-#### 3.1 技术面试考点
-- 机器学习算法原理
-- 大模型基础知识
-- 数据分析方法
-
-#### 3.2 软实力面试
-- 团队协作经历
-- 需求分析和文档撰写
-- 学习能力和适应能力
-
-### 4. 学习资源推荐
-#### 4.1 技术栈资料
-- 《深度学习》（Goodfellow et al.）
-- 《统计学习方法》（李航）
-- 斯坦福CS231n课程
-
-#### 4.2 面试题库
-- LeetCode机器学习相关题目
-- 产品经理面试常见问题
-- 大模型应用案例分析
-
-### 5. 差异化竞争建议
-- 突出机器学习背景优势
-- 准备具体的技术项目案例
-- 展示快速学习能力
-
----
-**模拟执行步骤：**
-1. ✅ 分析职位描述和简历匹配度
-2. ✅ 生成个性化学习计划
-3. ✅ 查询知识库推荐资料
-4. ✅ 整合最终报告
-
-**执行了 3 个步骤**
-"""
-                
-                st.success("✅ 模拟Agent任务完成！")
-                st.markdown(mock_result)
-                
-                # 下载按钮
-                st.download_button(
-                    "📥 下载模拟报告", 
-                    mock_result, 
-                    f"mock_agent_report_{datetime.date.today().strftime('%Y-%m-%d')}.md",
-                    "text/markdown"
-                )
-        
-        st.stop()  # 停止后续执行
-    
     # 输入区域
     col1, col2 = st.columns(2)
     with col1:
@@ -183,65 +217,68 @@ if agent_mode:
         help="选择你的最终面试日期"
     )
     
-    # Agent执行按钮
-    if st.button("🚀 Agent 开始工作", key="agent_work", type="primary"):
+    # Agent执行按钮：提交后台任务，运行期间页面仍可操作
+    if st.button("🚀 Agent 开始工作", key="agent_work", type="primary", disabled=job_pending("agent")):
         if not jd_content.strip() or not resume_content.strip():
             st.error("请填写完整的职位描述和简历内容")
         else:
-            with st.spinner("🤖 Agent 正在智能分析中，请稍候..."):
-                try:
-                    # 执行Agent
-                    result = st.session_state.agent_instance.analyze_jd_and_generate_plan(
-                        jd_content, 
-                        resume_content, 
-                        interview_date.strftime("%Y-%m-%d")
-                    )
-                    
-                    if result["success"]:
-                        st.success("✅ Agent 任务完成！")
-                        
-                        # 显示结果
-                        st.markdown("## 📊 Agent 执行结果")
-                        st.markdown(result["result"])
-                        
-                        # 显示执行步骤
-                        with st.expander("🔍 查看 Agent 执行步骤"):
-                            st.write(f"执行了 {result['iterations']} 个步骤")
-                            for i, step in enumerate(result['steps'], 1):
-                                st.write(f"**步骤 {i}:** {step}")
-                        
-                        # 下载按钮
-                        st.download_button(
-                            "📥 下载完整报告", 
-                            result["result"], 
-                            f"agent_report_{datetime.date.today().strftime('%Y-%m-%d')}.md",
-                            "text/markdown"
-                        )
-                    else:
-                        st.error(f"❌ Agent 执行失败：{result['error']}")
-                        
-                        # 如果是限流错误，提供详细解决方案
-                        if "API限流" in result['error']:
-                            st.warning("🚨 API限流解决方案：")
-                            st.markdown("""
-                            **方案1：使用离线测试模式**
-                            - 勾选"🔧 离线测试模式（不调用API）"
-                            - 点击"🚀 模拟Agent工作"
-                            
-                            **方案2：等待重试**
-                            - 等待10-15分钟让API限流重置
-                            - 重新点击"🚀 Agent 开始工作"
-                            
-                            **方案3：使用传统模式**
-                            - 取消勾选"🤖 启用 Agent 模式"
-                            - 使用分步骤的传统模式
-                            """)
-                        
-                        if "suggestion" in result:
-                            st.info(f"💡 建议：{result['suggestion']}")
-                        
-                except Exception as e:
-                    st.error(f"❌ Agent 执行异常：{str(e)}")
+            agent = st.session_state.agent_instance
+            run_args = (jd_content, resume_content, interview_date.strftime("%Y-%m-%d"))
+            st.session_state.jobs["agent"] = job_queue.submit(
+                f"agent_{agent.mode}",
+                lambda job, agent=agent, run_args=run_args: agent.analyze_jd_and_generate_plan(*run_args),
+                title=jd_content.strip()[:20],
+                owner=st.session_state.client_id,
+                error_message=lambda e: f"❌ Agent 执行异常：{str(e)}"
+            )
+
+    job = render_job("agent")
+    if job is not None and job["status"] == "failed":
+        st.error(job["error"])
+    elif job is not None and job["status"] == "succeeded":
+        result = job["result"]
+        if result["success"]:
+            st.success("✅ Agent 任务完成！")
+            
+            # 显示结果
+            st.markdown("## 📊 Agent 执行结果")
+            st.markdown(result["result"])
+            
+            # 显示执行步骤
+            with st.expander("🔍 查看 Agent 执行步骤"):
+                st.write(f"执行了 {result['iterations']} 个步骤")
+                for i, step in enumerate(result['steps'], 1):
+                    st.write(f"**步骤 {i}:** {step}")
+            
+            # 下载按钮
+            st.download_button(
+                "📥 下载完整报告", 
+                result["result"], 
+                f"agent_report_{datetime.date.today().strftime('%Y-%m-%d')}.md",
+                "text/markdown"
+            )
+        else:
+            st.error(f"❌ Agent 执行失败：{result['error']}")
+            
+            # 如果是限流错误，提供详细解决方案
+            if "API限流" in result['error']:
+                st.warning("🚨 API限流解决方案：")
+                st.markdown("""
+                **方案1：使用离线测试模式**
+                - 在侧边栏勾选"🔧 离线测试模式（不调用API）"
+                - 重新点击"🚀 Agent 开始工作"
+                
+                **方案2：等待重试**
+                - 等待10-15分钟让API限流重置
+                - 重新点击"🚀 Agent 开始工作"
+                
+                **方案3：使用传统模式**
+                - 取消勾选"🤖 启用 Agent 模式"
+                - 使用分步骤的传统模式
+                """)
+            
+            if "suggestion" in result:
+                st.info(f"💡 建议：{result['suggestion']}")
 
 else:
     # 传统模式：双标签页
@@ -258,21 +295,32 @@ else:
             st.subheader("📝 个人简历")
             resume_content = st.text_area("粘贴简历", height=300, key="resume_input", help="建议包含：技术栈、项目经验、教育背景等")
 
-        if st.button("🚀 开始分析", key="analyze_jd", type="primary"):
+        if st.button("🚀 开始分析", key="analyze_jd", type="primary", disabled=job_pending("jd_analysis")):
             is_valid, error_msg = validate_inputs(jd_content, resume_content)
             if not is_valid:
                 st.error(error_msg)
             else:
-                with st.spinner("🤔 正在深入分析中（知识库已启用），请稍候..."):
-                    result, error = analyze_job_description(jd_content, resume_content, temperature)
-                    if error:
-                        st.error(error)
-                    else:
-                        st.success("✅ 分析完成！现在可以去\"生成冲刺计划\"标签页，为你量身定制学习计划了。")
-                        # 将结果存入 session_state
-                        st.session_state.jd_analysis_result = result
-                        st.markdown(result)
-                        st.download_button("📥 下载分析报告", result, "jd_analysis_report.md", "text/markdown")
+                # 生成器在后台线程中消费，已输出的内容随页面刷新逐步显示
+                pieces = stream_job_description_analysis(
+                    jd_content, resume_content, temperature, use_cache=not bypass_cache, backend=llm_backend
+                )
+                st.session_state.jobs["jd_analysis"] = job_queue.submit(
+                    "jd_analysis",
+                    lambda job, pieces=pieces: job.stream(pieces),
+                    title=jd_content.strip()[:20],
+                    owner=st.session_state.client_id,
+                    error_message=analysis_error_message
+                )
+
+        job = render_job("jd_analysis")
+        if job is not None and job["status"] == "failed":
+            st.error(job["error"])
+        elif job is not None and job["status"] == "succeeded":
+            st.markdown(job["result"])
+            st.success("✅ 分析完成！现在可以去\"生成冲刺计划\"标签页，为你量身定制学习计划了。")
+            # 将结果存入 session_state
+            st.session_state.jd_analysis_result = job["result"]
+            st.download_button("📥 下载分析报告", job["result"], "jd_analysis_report.md", "text/markdown")
 
     # --- 标签页2: 面试任务规划 ---
     with tab2:
@@ -292,29 +340,43 @@ else:
                 help="选择你的最终面试日期，系统将为你生成从今天到面试前一天的每日计划。"
             )
 
-            if st.button("🚀 生成个性化冲刺计划", key="generate_schedule", type="primary"):
-                with st.spinner("📅 正在为你规划学习路径，请稍候..."):
-                    # 传入JD分析结果
-                    result, error = generate_interview_schedule(
-                        task_generation_prompt, 
-                        interview_date, 
-                        st.session_state.jd_analysis_result,  # 从session_state获取
-                        temperature
-                    )
-                    if error:
-                        st.error(error)
-                    else:
-                        st.success("✅ 个性化冲刺计划生成完毕！")
-                        st.markdown(result)
-                        st.download_button(
-                            "📥 下载冲刺计划", result, 
-                            f"interview_schedule_to_{interview_date.strftime('%Y-%m-%d')}.md",
-                            "text/markdown", key="download_schedule"
-                        )
+            if st.button(
+                "🚀 生成个性化冲刺计划", key="generate_schedule", type="primary",
+                disabled=job_pending("interview_schedule")
+            ):
+                # 传入JD分析结果，在后台线程中逐 token 生成
+                pieces = stream_interview_schedule(
+                    task_generation_prompt, 
+                    interview_date, 
+                    st.session_state.jd_analysis_result,  # 从session_state获取
+                    temperature,
+                    use_cache=not bypass_cache,
+                    backend=llm_backend
+                )
+                st.session_state.jobs["interview_schedule"] = job_queue.submit(
+                    "interview_schedule",
+                    lambda job, pieces=pieces: job.stream(pieces),
+                    title=f"面试日期 {interview_date.strftime('%Y-%m-%d')}",
+                    owner=st.session_state.client_id,
+                    error_message=lambda e: str(e) if isinstance(e, ValueError) else analysis_error_message(e, "任务生成")
+                )
         else:
             st.warning("⚠️ 请先在\"第一步: JD 分析\"标签页中完成一次成功的分析，才能生成个性化的冲刺计划。")
             st.image("https://img.icons8.com/plasticine/100/000000/arrow.png", width=100)
 
+        # 从历史任务打开的计划不依赖当前的分析报告，放在判断之外显示
+        job = render_job("interview_schedule")
+        if job is not None and job["status"] == "failed":
+            st.error(job["error"])
+        elif job is not None and job["status"] == "succeeded":
+            st.markdown(job["result"])
+            st.success("✅ 个性化冲刺计划生成完毕！")
+            st.download_button(
+                "📥 下载冲刺计划", job["result"], 
+                f"interview_schedule_{job['id']}.md",
+                "text/markdown", key="download_schedule"
+            )
+
 # --- 页脚信息 ---
 st.divider()
 st.markdown("""
@@ -322,4 +384,28 @@ st.markdown("""
     <p>🤖 智能求职助手 Agent | 基于 Moonshot + LangChain + RAG 技术构建</p>
     <p>💡 提示：启用 Agent 模式可获得更智能的一站式服务体验</p>
 </div>
-""", unsafe_allow_html=True) 
\ No newline at end of file
+""", unsafe_allow_html=True) 
+
+# --- 侧边栏：最近一次请求的耗时拆分 ---
+if st.session_state.last_trace:
+    summary = st.session_state.last_trace
+    with trace_panel:
+        status = "❌ 失败" if summary["error"] else "✅ 完成"
+        st.caption(
+            f"最近一次请求：{summary['name']} {status}，总耗时 {summary['duration']:.2f}s，"
+            f"tokens {summary['prompt_tokens']} + {summary['completion_tokens']}，约 ¥{summary['cost']:.4f}"
+        )
+        rows = "\n".join(
+            f"| {stage} | {stats['count']} | {stats['seconds']:.3f} |" for stage, stats in summary["stages"].items()
+        )
+        st.markdown("| 阶段 | 次数 | 耗时(s) |\n|---|---:|---:|\n" + rows)
+
+# --- 有后台任务未结束时只刷新各自的占位区，逐步显示最新输出；任务结束后重跑一次页面显示结果 ---
+# 用户在此期间操作页面时，Streamlit 会在下一次更新占位区时中断这个循环并重新运行脚本
+while pending_panels:
+    time.sleep(JOB_STREAM_INTERVAL)
+    for job_id, placeholder in pending_panels.items():
+        job = job_queue.get(job_id)
+        if job is None or job["status"] not in ("queued", "running"):
+            st.rerun()
+        render_progress(placeholder, job)
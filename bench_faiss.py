@@ -0,0 +1,190 @@
+"""
+向量索引类型基准：对比 flat / ivf / hnsw / pq / fp16 的索引体积、内存占用、构建耗时、查询延迟和召回率
+
+召回率以 flat 精确检索的 top-k 为基准（recall@k = 与 flat 结果重合的比例）。
+查询向量由两个随机文档块向量按 0.7 / 0.3 混合后归一化得到，模拟落在主题之间的真实查询，不需要调用 embedding 接口。
+每种索引在全新子进程中以只读内存映射方式加载，内存为加载后和查询后进程常驻内存（RSS）的增量。
+
+用法：
+    python bench_faiss.py                                    # 使用 vector_store/ 中最新版本的向量
+    python bench_faiss.py --index-dir vector_store/<版本>     # 指定索引目录
+    python bench_faiss.py --synthetic 200000 --dim 1024      # 合成数据，模拟知识库增长后的规模
+    python bench_faiss.py --types flat hnsw pq --queries 500 --k 4 --json faiss.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+
+import utils
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 子进程：内存映射加载索引，执行查询，输出 RSS 增量、逐条延迟和结果 ID
+CHILD_CODE = """
+import sys, json, time
+import numpy as np
+import faiss
+import utils
+from langchain_community.vectorstores import FAISS  # 先导入，避免把模块导入的内存算进索引
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * 4096 / 1024 / 1024
+
+index_dir, index_type, queries_path, k = sys.argv[1], sys.argv[2], sys.argv[3], int(sys.argv[4])
+queries = np.load(queries_path)
+before = rss_mb()
+start = time.perf_counter()
+store = utils.load_search_vector_store(index_dir, None, index_type)
+load_seconds = time.perf_counter() - start
+loaded = rss_mb()
+latencies, ids = [], []
+for query in queries:
+    start = time.perf_counter()
+    _, result = store.index.search(query[None, :], k)
+    latencies.append(time.perf_counter() - start)
+    ids.append(result[0].tolist())
+print(json.dumps({
+    "load_seconds": load_seconds,
+    "rss_load_mb": loaded - before,
+    "rss_query_mb": rss_mb() - before,
+    "latencies": latencies,
+    "ids": ids,
+}))
+"""
+
+
+def latest_index_dir() -> str:
+    """当前配置下最新的索引版本目录"""
+    embeddings = utils._create_embeddings()
+    if embeddings is None:
+        raise SystemExit("无法确定 embedding 模型，请用 --index-dir 指定索引目录")
+    manifest = utils.find_latest_manifest(utils._index_settings(getattr(embeddings, "model_name", utils.EMBEDDING_MODEL)))
+    if manifest is None:
+        raise SystemExit(f"'{utils.INDEX_ROOT}' 中没有可用的索引，请先启动应用构建索引或使用 --synthetic")
+    return os.path.join(utils.INDEX_ROOT, manifest["kb_version"])
+
+
+def load_vectors(index_dir: str) -> np.ndarray:
+    import faiss
+
+    index = faiss.read_index(os.path.join(index_dir, "index.faiss"))
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def synthetic_vectors(count: int, dim: int, seed: int = 0) -> np.ndarray:
+    """围绕若干主题中心生成的单位向量，比均匀随机数据更接近真实文本向量的聚类结构"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, count // 200), dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), count)] + 0.6 * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_queries(vectors: np.ndarray, count: int, seed: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    a = vectors[rng.integers(0, len(vectors), count)]
+    b = vectors[rng.integers(0, len(vectors), count)]
+    queries = 0.7 * a + 0.3 * b
+    return (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+
+def write_index_dir(vectors: np.ndarray, index_dir: str) -> None:
+    """按应用的保存格式写出 flat 索引和一个空 docstore，供子进程用 load_search_vector_store 加载"""
+    import pickle
+    import faiss
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+
+    faiss.write_index(utils.build_search_index(vectors, "flat"), os.path.join(index_dir, "index.faiss"))
+    with open(os.path.join(index_dir, "index.pkl"), "wb") as f:
+        pickle.dump((InMemoryDocstore({}), {i: str(i) for i in range(len(vectors))}), f)
+
+
+def run_child(index_dir: str, index_type: str, queries_path: str, k: int) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD_CODE, index_dir, index_type, queries_path, str(k)],
+        cwd=PROJECT_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{index_type} 查询失败：\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="对比不同 FAISS 索引类型的体积、内存、构建耗时、查询延迟和召回率")
+    parser.add_argument("--types", nargs="*", default=list(utils.FAISS_INDEX_TYPES), help="要对比的索引类型")
+    parser.add_argument("--index-dir", help="索引版本目录，默认取 vector_store/ 中最新的版本")
+    parser.add_argument("--synthetic", type=int, help="改用该数量的合成向量")
+    parser.add_argument("--dim", type=int, default=utils.LOCAL_EMBEDDING_DIM, help="合成向量的维度")
+    parser.add_argument("--queries", type=int, default=200, help="查询条数")
+    parser.add_argument("--k", type=int, default=utils.RETRIEVER_K, help="每次查询返回的条数")
+    parser.add_argument("--json", dest="json_path", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    unknown = [index_type for index_type in args.types if index_type not in utils.FAISS_INDEX_TYPES]
+    if unknown:
+        parser.error(f"未知索引类型：{', '.join(unknown)}（可选 {', '.join(utils.FAISS_INDEX_TYPES)}）")
+    types = ["flat"] + [index_type for index_type in args.types if index_type != "flat"]
+
+    with tempfile.TemporaryDirectory(prefix="bench_faiss_") as work_dir:
+        if args.synthetic:
+            vectors = synthetic_vectors(args.synthetic, args.dim)
+            source = f"合成向量 {args.synthetic} x {args.dim}"
+        else:
+            index_dir = args.index_dir or latest_index_dir()
+            vectors = load_vectors(index_dir)
+            source = f"{index_dir}（{vectors.shape[0]} x {vectors.shape[1]}）"
+        print(f"数据：{source}，查询 {args.queries} 条，k={args.k}\n")
+
+        write_index_dir(vectors, work_dir)
+        queries_path = os.path.join(work_dir, "queries.npy")
+        np.save(queries_path, make_queries(vectors, args.queries))
+
+        results = {}
+        baseline = None
+        for index_type in types:
+            start = time.perf_counter()
+            utils.write_search_index(work_dir, index_type)
+            build_seconds = time.perf_counter() - start if index_type != "flat" else 0.0
+            child = run_child(work_dir, index_type, queries_path, args.k)
+            if baseline is None:
+                baseline = child["ids"]
+            recall = np.mean([
+                len(set(ids) & set(expected)) / args.k for ids, expected in zip(child["ids"], baseline)
+            ])
+            latencies = np.array(child["latencies"]) * 1000
+            results[index_type] = {
+                "factory": utils.faiss_factory_string(index_type, len(vectors), vectors.shape[1]),
+                "index_bytes": os.path.getsize(utils._search_index_path(work_dir, index_type)),
+                "build_seconds": build_seconds,
+                "load_seconds": child["load_seconds"],
+                "rss_load_mb": child["rss_load_mb"],
+                "rss_query_mb": child["rss_query_mb"],
+                "latency_p50_ms": float(np.percentile(latencies, 50)),
+                "latency_p95_ms": float(np.percentile(latencies, 95)),
+                f"recall@{args.k}": float(recall),
+            }
+            r = results[index_type]
+            print(
+                f"{index_type:5s} {r['factory']:12s} 索引 {r['index_bytes'] / 1024 / 1024:8.2f} MB  "
+                f"RSS 加载 +{r['rss_load_mb']:6.1f} MB / 查询后 +{r['rss_query_mb']:6.1f} MB  "
+                f"构建 {build_seconds:6.2f}s  p50 {r['latency_p50_ms']:7.3f}ms  p95 {r['latency_p95_ms']:7.3f}ms  "
+                f"recall@{args.k} {r[f'recall@{args.k}']:.3f}"
+            )
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"source": source, "queries": args.queries, "k": args.k, "results": results},
+                f, ensure_ascii=False, indent=2
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
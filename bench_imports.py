@@ -0,0 +1,122 @@
+"""
+导入耗时基准：在全新的 Python 进程中测量 utils.py、agent_tools.py 的导入时间，以及 app.py 的首次渲染时间
+
+用法：
+    python bench_imports.py                                  # 每个目标测 5 次，打印统计
+    python bench_imports.py --repeat 10 --json imports.json  # 结果另存为 JSON，便于跨提交对比
+    python bench_imports.py --budget utils=1.5 --budget app=4  # 中位数超出预算时以非零状态码退出
+    python bench_imports.py --profile utils                  # 列出 -X importtime 中最耗时的模块
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 每个目标在子进程中执行的代码，最后一行输出耗时（秒）；只计导入/渲染本身，不含解释器启动
+TARGETS = {
+    "utils": "import utils",
+    "agent_tools": "import agent_tools",
+    # 用 Streamlit 的 AppTest 完整执行一次 app.py 脚本，即用户打开页面时的首次渲染
+    "app": (
+        "from streamlit.testing.v1 import AppTest\n"
+        "AppTest.from_file('app.py', default_timeout=120).run()"
+    ),
+}
+
+TIMER_TEMPLATE = """
+import time
+_start = time.perf_counter()
+{code}
+print(time.perf_counter() - _start)
+"""
+
+
+def measure(target: str, repeat: int) -> list:
+    """在 repeat 个全新进程中执行目标，返回每次的耗时（秒）"""
+    code = TIMER_TEMPLATE.format(code=TARGETS[target])
+    runs = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=PROJECT_DIR, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"{target} 执行失败：\n{result.stderr}")
+        runs.append(float(result.stdout.strip().splitlines()[-1]))
+    return runs
+
+
+def profile(target: str, top: int = 20) -> None:
+    """用 -X importtime 打印累计耗时最多的模块"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", TARGETS[target]],
+        cwd=PROJECT_DIR, capture_output=True, text=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|", 2)
+        if cumulative.strip().isdigit():
+            rows.append((int(cumulative), module.rstrip()))
+    print(f"\n{target}: 累计导入耗时最多的 {top} 个模块")
+    for cumulative, module in sorted(rows, reverse=True)[:top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {module}")
+
+
+def parse_budgets(items: list) -> dict:
+    budgets = {}
+    for item in items:
+        name, _, seconds = item.partition("=")
+        if name not in TARGETS or not seconds:
+            raise SystemExit(f"无效的预算参数：{item}（格式：目标=秒数，目标可选 {', '.join(TARGETS)}）")
+        budgets[name] = float(seconds)
+    return budgets
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="测量 app.py / utils.py / agent_tools.py 的冷启动耗时")
+    parser.add_argument("targets", nargs="*", help=f"要测量的目标，默认全部：{', '.join(TARGETS)}")
+    parser.add_argument("--repeat", type=int, default=5, help="每个目标的测量次数")
+    parser.add_argument("--json", dest="json_path", help="把结果写入 JSON 文件")
+    parser.add_argument("--budget", action="append", default=[], help="耗时预算，格式 目标=秒数，可重复")
+    parser.add_argument("--profile", choices=list(TARGETS), help="打印该目标的导入耗时明细")
+    args = parser.parse_args()
+
+    budgets = parse_budgets(args.budget)
+    unknown = [target for target in args.targets if target not in TARGETS]
+    if unknown:
+        parser.error(f"未知目标：{', '.join(unknown)}")
+    results = {}
+    failed = False
+    for target in args.targets or list(TARGETS):
+        runs = measure(target, args.repeat)
+        results[target] = {
+            "median": statistics.median(runs),
+            "min": min(runs),
+            "max": max(runs),
+            "runs": runs,
+        }
+        line = f"{target:12s} 中位数 {results[target]['median']:.3f}s  最小 {min(runs):.3f}s  最大 {max(runs):.3f}s"
+        if target in budgets:
+            over = results[target]["median"] > budgets[target]
+            failed = failed or over
+            line += f"  预算 {budgets[target]:.2f}s {'❌ 超出' if over else '✅'}"
+        print(line)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "repeat": args.repeat, "results": results}, f, indent=2)
+
+    if args.profile:
+        profile(args.profile)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
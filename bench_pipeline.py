@@ -0,0 +1,292 @@
+"""
+分阶段性能基准：在本地假 OpenAI 兼容服务（fake_openai_server.py）上测量各阶段耗时，不消耗 Moonshot / OpenAI 额度
+
+阶段：
+    load             解析知识库文件
+    split            文档分块
+    embed            文档块向量化（经 ConcurrentEmbeddings 请求假服务，不读 embedding 缓存）
+    index            构建 FAISS 向量索引和关键词索引
+    retrieve         逐条执行标注查询集（eval_chunking.LABELLED_QUERIES）的混合检索
+    e2e_traditional  传统模式的一次完整 JD 分析（analyze_job_description，每次使用空的响应缓存）
+    e2e_agent        Agent 模式的一次完整运行（JobSearchAgent.analyze_jd_and_generate_plan）
+
+索引、embedding 缓存和响应缓存都写在临时目录中，不影响项目目录下的真实缓存。
+端到端阶段附带追踪得到的分阶段耗时和 token 数，以及假服务收到的请求数和注入的 429 次数。
+
+用法：
+    python bench_pipeline.py                                          # 全部阶段，每个阶段 3 次
+    python bench_pipeline.py --stages retrieve e2e_traditional --repeat 5
+    python bench_pipeline.py --latency 0.5 --tokens-per-second 40 --error-rate 0.1 --json bench.json
+    python bench_pipeline.py --max-files 5 --agent-mode react         # 只用前 5 个知识库文件
+    python bench_pipeline.py --stages e2e_traditional e2e_agent --llm-backend fake  # 对话走本地模型，只测框架开销
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+STAGES = ("load", "split", "embed", "index", "retrieve", "e2e_traditional", "e2e_agent")
+
+SAMPLE_JD = """岗位：大模型算法工程师
+职责：负责基于大模型的检索增强问答系统研发，包括知识库构建、文本分块、向量检索、重排和生成效果评测；
+参与 LoRA 等参数高效微调方案的设计与落地，持续优化模型在垂直领域的表现。
+要求：熟悉 Transformer 结构和 self-attention 原理；熟悉 PyTorch、transformers、LangChain；
+有 RAG、Agent 或 Function Call 项目经验者优先；具备良好的工程能力和沟通能力。"""
+
+SAMPLE_RESUME = """教育背景：某大学计算机科学硕士，研究方向为自然语言处理。
+项目经验：1. 基于 BERT 的文本分类系统，负责数据清洗、模型训练与上线，准确率提升 6%；
+2. 命名实体识别项目，使用 BiLSTM-CRF 与 BERT-CRF 对比实验，完成模型蒸馏部署。
+实习经历：某互联网公司 NLP 算法实习生，参与搜索 query 理解与召回优化。
+技能：Python、PyTorch、transformers、Linux、SQL。"""
+
+
+def git_commit() -> str:
+    result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_DIR, capture_output=True, text=True)
+    return result.stdout.strip() or "unknown"
+
+
+def prepare_kb(kb_path: str, max_files: int, work_dir: str) -> str:
+    """只取前 max_files 个知识库文件时，用软链接组成一个临时知识库目录"""
+    if not max_files:
+        return kb_path
+    names = sorted(name for name in os.listdir(kb_path) if name.endswith((".pdf", ".md")))[:max_files]
+    subset = os.path.join(work_dir, "knowledge_base")
+    os.makedirs(subset, exist_ok=True)
+    for name in names:
+        os.symlink(os.path.abspath(os.path.join(kb_path, name)), os.path.join(subset, name))
+    return subset
+
+
+def configure(base_url: str, kb_path: str, work_dir: str) -> None:
+    """让 utils 的 chat / embedding 请求都发往假服务，索引和缓存写入临时目录"""
+    os.environ["MOONSHOT_API_KEY"] = "fake"
+    os.environ["OPENAI_API_KEY"] = "fake"
+    os.environ["OPENAI_BASE_URL"] = base_url
+
+    import utils
+    import tracing
+
+    utils.MOONSHOT_API_BASE = base_url
+    utils.EMBEDDING_BACKEND = "openai"
+    utils.KB_PATH = kb_path
+    utils.INDEX_ROOT = os.path.join(work_dir, "vector_store")
+    utils.EMBEDDING_CACHE_DIR = os.path.join(work_dir, "embedding_cache")
+    utils.RESPONSE_CACHE_PATH = os.path.join(work_dir, "response_cache.sqlite3")
+    tracing.TRACING_ENABLED = False  # 分阶段数据直接从 Trace 对象读取，不写 traces.jsonl
+
+
+def summarize(seconds: list) -> dict:
+    return {
+        "runs": len(seconds),
+        "median_seconds": statistics.median(seconds),
+        "min_seconds": min(seconds),
+        "max_seconds": max(seconds),
+    }
+
+
+def timed(func, repeat: int) -> tuple[list, object]:
+    """执行 repeat 次，返回 (每次耗时, 最后一次的结果)"""
+    seconds, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        seconds.append(time.perf_counter() - start)
+    return seconds, result
+
+
+def run_end_to_end(name: str, func, repeat: int, server, work_dir: str) -> dict:
+    """
+    端到端阶段：每次运行在一个请求追踪中执行，汇总追踪里的分阶段耗时、token 数和假服务的请求数
+
+    每次运行前换一个空的响应缓存，Agent 的工具调用也不会命中上一次的结果。
+    """
+    import utils
+    import tracing
+
+    seconds, stages, errors = [], {}, 0
+    tokens = {"prompt": 0, "completion": 0}
+    stats_before = dict(server.stats)
+    for i in range(repeat):
+        utils.RESPONSE_CACHE_PATH = os.path.join(work_dir, f"response_cache_{name}_{i}.sqlite3")
+        utils._response_cache = None
+        start = time.perf_counter()
+        with tracing.trace(name) as request_trace:
+            func()
+        seconds.append(time.perf_counter() - start)
+        summary = request_trace.summary()
+        errors += summary["error"] is not None
+        tokens["prompt"] += summary["prompt_tokens"]
+        tokens["completion"] += summary["completion_tokens"]
+        for stage, stats in summary["stages"].items():
+            stages.setdefault(stage, []).append(stats["seconds"])
+        first_tokens = [span["first_token_seconds"] for span in request_trace.spans if "first_token_seconds" in span]
+        if first_tokens:
+            stages.setdefault("first_token", []).append(first_tokens[0])
+    return {
+        **summarize(seconds),
+        "errors": errors,
+        "stage_median_seconds": {stage: statistics.median(values) for stage, values in stages.items()},
+        "tokens_per_run": {kind: count / repeat for kind, count in tokens.items()},
+        "server_requests": {key: server.stats[key] - stats_before[key] for key in server.stats},
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="在本地假 OpenAI 兼容服务上测量各阶段耗时")
+    parser.add_argument("--stages", nargs="*", default=list(STAGES), help="要测量的阶段")
+    parser.add_argument("--repeat", type=int, default=3, help="每个阶段的重复次数")
+    parser.add_argument("--kb-path", default=os.path.join(PROJECT_DIR, "knowledge_base"), help="知识库目录")
+    parser.add_argument("--max-files", type=int, default=0, help="只使用前 N 个知识库文件（0 表示全部）")
+    parser.add_argument("--agent-mode", choices=["pipeline", "react"], default="pipeline", help="e2e_agent 的执行方式")
+    parser.add_argument(
+        "--llm-backend", choices=["moonshot", "fake"], default="moonshot",
+        help="对话模型后端：moonshot 请求假服务，fake 使用进程内的本地确定性模型（embedding 仍请求假服务）"
+    )
+    parser.add_argument("--latency", type=float, default=0.2, help="假服务 chat 首 token 延迟（秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="假服务 chat 输出速度")
+    parser.add_argument("--completion-tokens", type=int, default=200, help="假服务每次回答的 token 数")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="假服务 embedding 请求延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="假服务返回 429 的概率")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429 响应的 Retry-After（秒）")
+    parser.add_argument("--seed", type=int, default=0, help="错误注入的随机数种子")
+    parser.add_argument("--json", dest="json_path", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    unknown = [stage for stage in args.stages if stage not in STAGES]
+    if unknown:
+        parser.error(f"未知阶段：{', '.join(unknown)}（可选 {', '.join(STAGES)}）")
+
+    from fake_openai_server import FakeOpenAIServer
+
+    server = FakeOpenAIServer(
+        latency=args.latency, tokens_per_second=args.tokens_per_second, completion_tokens=args.completion_tokens,
+        embed_latency=args.embed_latency, error_rate=args.error_rate, retry_after=args.retry_after, seed=args.seed
+    ).start()
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="bench_pipeline_") as work_dir:
+        kb_path = prepare_kb(args.kb_path, args.max_files, work_dir)
+        configure(server.base_url, kb_path, work_dir)
+
+        import utils
+        utils.LLM_BACKEND = args.llm_backend
+        from eval_chunking import LABELLED_QUERIES
+
+        embeddings = utils._create_embeddings()
+        # 直接使用缓存层下面的并发 embedding，每次都真正请求假服务
+        raw_embeddings = embeddings.embeddings
+        print(f"假服务：{server.base_url}，知识库：{kb_path}，每个阶段 {args.repeat} 次\n")
+
+        # 后面的阶段依赖前面阶段的产出，未选中的前置阶段只执行一次、不计时
+        needs = set(args.stages)
+        documents = chunks = vectors = vector_store = keyword_index = None
+
+        def stage(name: str, func, **extra):
+            if name in needs:
+                seconds, result = timed(func, args.repeat)
+                results[name] = {**summarize(seconds), **{key: value(result) for key, value in extra.items()}}
+                print(f"{name:16s} 中位数 {results[name]['median_seconds']:8.3f}s  "
+                      f"最小 {results[name]['min_seconds']:8.3f}s  最大 {results[name]['max_seconds']:8.3f}s")
+                return result
+            return func()
+
+        if needs & {"load", "split", "embed", "index", "retrieve"}:
+            documents = stage("load", lambda: utils.load_knowledge_base(kb_path), documents=len)
+        if needs & {"split", "embed", "index", "retrieve"}:
+            chunks = stage(
+                "split",
+                lambda: utils.split_documents(documents, utils.CHUNK_SPLITTER, utils.CHUNK_SIZE, utils.CHUNK_OVERLAP),
+                chunks=len
+            )
+            chunk_ids = [f"{os.path.basename(doc.metadata.get('source', ''))}::{i}" for i, doc in enumerate(chunks)]
+            for doc, chunk_id in zip(chunks, chunk_ids):
+                doc.metadata["chunk_id"] = chunk_id
+            texts = [doc.page_content for doc in chunks]
+        if needs & {"embed", "index", "retrieve"}:
+            vectors = stage("embed", lambda: raw_embeddings.embed_documents(texts), vectors=len)
+        if needs & {"index", "retrieve"}:
+            from langchain_community.vectorstores import FAISS
+
+            def build_index():
+                store = FAISS.from_embeddings(
+                    list(zip(texts, vectors)), raw_embeddings, metadatas=[doc.metadata for doc in chunks], ids=chunk_ids
+                )
+                return store, utils.KeywordIndex.build(chunk_ids, texts)
+
+            vector_store, keyword_index = stage("index", build_index)
+        if "retrieve" in needs:
+            retriever = utils.HybridRetriever(vector_store=vector_store, keyword_index=keyword_index)
+            queries = [query for query, _ in LABELLED_QUERIES]
+            latencies = []
+
+            def retrieve_all():
+                for query in queries:
+                    start = time.perf_counter()
+                    retriever.invoke(query)
+                    latencies.append(time.perf_counter() - start)
+
+            stage("retrieve", retrieve_all)
+            results["retrieve"].update(
+                queries=len(queries),
+                query_p50_ms=statistics.median(latencies) * 1000,
+                query_p95_ms=statistics.quantiles(latencies, n=20)[-1] * 1000,
+            )
+
+        if needs & {"e2e_traditional", "e2e_agent"}:
+            # 首次调用时构建持久化索引，不计入端到端耗时
+            start = time.perf_counter()
+            utils.get_retriever()
+            warmup = time.perf_counter() - start
+            print(f"{'(索引预热)':16s} {warmup:8.3f}s")
+
+        if "e2e_traditional" in needs:
+            # 失败时错误记在请求追踪上，由 run_end_to_end 计数
+            def analyze():
+                utils.analyze_job_description(SAMPLE_JD, SAMPLE_RESUME)
+
+            results["e2e_traditional"] = run_end_to_end("e2e_traditional", analyze, args.repeat, server, work_dir)
+        if "e2e_agent" in needs:
+            from datetime import date, timedelta
+            from agent_executor import create_job_search_agent
+
+            agent = create_job_search_agent(mode=args.agent_mode)
+            interview_date = (date.today() + timedelta(days=14)).isoformat()
+
+            def run_agent():
+                agent.analyze_jd_and_generate_plan(SAMPLE_JD, SAMPLE_RESUME, interview_date)
+
+            results["e2e_agent"] = run_end_to_end("e2e_agent", run_agent, args.repeat, server, work_dir)
+            results["e2e_agent"]["mode"] = args.agent_mode
+
+        for name in ("e2e_traditional", "e2e_agent"):
+            if name in results:
+                r = results[name]
+                breakdown = "  ".join(f"{stage} {seconds:.3f}s" for stage, seconds in r["stage_median_seconds"].items())
+                print(f"{name:16s} 中位数 {r['median_seconds']:8.3f}s  失败 {r['errors']} 次  "
+                      f"请求 chat {r['server_requests']['chat_requests']} / 429 {r['server_requests']['rate_limited']}\n"
+                      f"{'':16s} {breakdown}")
+    server.stop()
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "commit": git_commit(),
+                "created_at": time.time(),
+                "repeat": args.repeat,
+                "llm_backend": args.llm_backend,
+                "server": {
+                    "latency": args.latency, "tokens_per_second": args.tokens_per_second,
+                    "completion_tokens": args.completion_tokens, "embed_latency": args.embed_latency,
+                    "error_rate": args.error_rate, "retry_after": args.retry_after, "seed": args.seed,
+                },
+                "results": results,
+            }, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
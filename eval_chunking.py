@@ -0,0 +1,178 @@
+"""
+分块方式离线评测：对每种分割配置重建索引，报告块数、索引体积、构建耗时和 recall@k
+
+全程使用本地 CPU embedding（HashedNgramEmbeddings），不需要网络和 API Key；知识库文件只解析一次。
+
+用法：
+    python eval_chunking.py                                     # 评测默认的几组配置
+    python eval_chunking.py --config zh:800:100 --config default:1000:200 --k 4
+    python eval_chunking.py --retrieval dense --json chunking.json
+    python eval_chunking.py --tolerance 0.02                    # 召回率不低于最优值 0.02 时选最小的索引
+
+配置格式为 分割方式:块大小:重叠，分割方式可选 default、zh（见 utils.make_text_splitter）。
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+import utils
+
+DEFAULT_CONFIGS = [
+    "default:1000:200",
+    "zh:1000:200",
+    "zh:1000:100",
+    "zh:800:100",
+    "zh:600:50",
+]
+
+# 标注查询集：查询 -> 应当召回的知识库文件（任一块来自这些文件即算命中）
+LABELLED_QUERIES = [
+    ("什么是大模型 agent，由哪些部分组成", ["1大模型（LLMs）agent 面.pdf"]),
+    ("agent 的规划、记忆和工具使用", ["1大模型（LLMs）agent 面.pdf"]),
+    ("RAG-Fusion 的原理和多查询生成", ["10大模型（LLMs）RAG 优化策略 —— RAG-Fusion篇.pdf"]),
+    ("LoRA 的 lora_alpha 和 r 参数怎么设置", ["5如何使用 PEFT库 中 LoRA？.pdf"]),
+    ("参数高效微调 PEFT 有哪些方法", ["1大模型（LLMs）参数高效微调(PEFT) 面.pdf"]),
+    ("Adapter-tuning 适配器微调的结构", ["2适配器微调（Adapter-tuning）篇.pdf"]),
+    ("C++ 指针和引用的区别", ["代码随想录知识星球精华（最强八股文）第五版（C++篇）.pdf"]),
+    ("STL 常见容器 vector list deque", ["代码随想录知识星球精华（最强八股文）第五版（C++篇）.pdf"]),
+    ("self-attention 为什么要除以根号 dk", ["「代码随想录知识星球」NLP算法岗八股文.pdf"]),
+    ("大模型幻觉产生的原因", ["2大模型的幻觉问题篇.pdf", "1大模型幻觉（LLM Hallucination）面.pdf"]),
+    ("如何缓解大模型幻觉", ["3如何缓解大模型幻觉？.pdf", "2大模型的幻觉问题篇.pdf"]),
+    ("思维链 Chain-of-Thought 提示", ["1思维链 Chain-of-Thought（COT）篇.pdf"]),
+    ("Function Call 函数调用是怎么实现的", ["2AI Agent 面 —— 函数调用 Function Call 篇.pdf"]),
+    ("RAG 版面分析中的表格识别方法", ["3大模型（LLMs）RAG 版面分析——表格识别方法篇.pdf"]),
+    ("RAG 文本分块有哪些方法", ["4大模型（LLMs）RAG 版面分析——文本分块面.pdf"]),
+    ("外挂知识库负样本挖掘", ["6大模型外挂知识库优化——负样本样本挖掘篇.pdf"]),
+    ("命名实体识别常用模型", ["4命名实体识别常见面试篇.pdf"]),
+    ("文本摘要抽取式和生成式", ["3文本摘要常见面试篇.pdf"]),
+    ("文本分类常见面试题", ["2文本分类常见面试篇.pdf"]),
+    ("向量检索的常用算法", ["5向量检索常见面试篇.pdf"]),
+    ("Graph RAG 基于知识图谱的检索增强", ["11Graph RAG 面 — 一种 基于知识图谱的大模型检索增强实现策略.pdf"]),
+    ("多轮对话中保持长期记忆", ["2多轮对话中让AI保持长期记忆的8种优化方式篇.pdf"]),
+    ("RAG 系统怎么评测", ["7RAG（Retrieval-Augmented Generation）评测面.pdf"]),
+    ("RAG 的关键痛点及解决方案", ["9大模型（LLMs）RAG —— 关键痛点及对应解决方案.pdf"]),
+    ("PDF 解析的关键问题", ["2LLM文档对话 —— pdf解析关键问题.pdf"]),
+    ("langchain 有哪些核心组件", ["1大模型（LLMs）langchain 面.pdf", "3基于langchain RAG问答应用实战.pdf"]),
+    ("SFT 有哪些训练技巧", ["2大模型 SFT Trick 篇.pdf", "6大模型 SFT 方式对比篇.pdf"]),
+    ("RoPE 旋转位置编码的外推性", ["补充新题.pdf"]),
+]
+
+
+def parse_config(item: str) -> tuple:
+    splitter, _, rest = item.partition(":")
+    size, _, overlap = rest.partition(":")
+    if splitter not in ("default", "zh") or not size.isdigit() or not overlap.isdigit():
+        raise SystemExit(f"无效的配置：{item}（格式：分割方式:块大小:重叠，分割方式可选 default、zh）")
+    return splitter, int(size), int(overlap)
+
+
+def _dir_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def evaluate(documents: list, config: tuple, k: int, retrieval: str, queries: list) -> dict:
+    """用一组分割配置构建索引并评测检索效果"""
+    from langchain_community.vectorstores import FAISS
+
+    splitter, chunk_size, chunk_overlap = config
+    embeddings = utils.HashedNgramEmbeddings()
+
+    start = time.perf_counter()
+    chunks = utils.split_documents(documents, splitter, chunk_size, chunk_overlap)
+    chunk_ids = [f"{os.path.basename(doc.metadata.get('source', ''))}::{i}" for i, doc in enumerate(chunks)]
+    for doc, chunk_id in zip(chunks, chunk_ids):
+        doc.metadata["chunk_id"] = chunk_id
+    texts = [doc.page_content for doc in chunks]
+    vector_store = FAISS.from_embeddings(
+        list(zip(texts, embeddings.embed_documents(texts))), embeddings,
+        metadatas=[doc.metadata for doc in chunks], ids=chunk_ids
+    )
+    keyword_index = utils.KeywordIndex.build(chunk_ids, texts)
+    build_seconds = time.perf_counter() - start
+
+    index_dir = tempfile.mkdtemp(prefix="eval_chunking_")
+    try:
+        vector_store.save_local(index_dir)
+        keyword_index.save(index_dir)
+        index_bytes = _dir_bytes(index_dir)
+    finally:
+        shutil.rmtree(index_dir, ignore_errors=True)
+
+    if retrieval == "hybrid":
+        retriever = utils.HybridRetriever(vector_store=vector_store, keyword_index=keyword_index, k=k)
+    else:
+        retriever = vector_store.as_retriever(search_kwargs={"k": k})
+
+    recall = 0.0
+    hits = 0
+    misses = []
+    for query, relevant in queries:
+        sources = {os.path.basename(doc.metadata.get("source", "")) for doc in retriever.invoke(query)[:k]}
+        found = len(sources & set(relevant))
+        recall += found / len(relevant)
+        hits += found > 0
+        if not found:
+            misses.append(query)
+
+    return {
+        "config": f"{splitter}:{chunk_size}:{chunk_overlap}",
+        "chunks": len(chunks),
+        "avg_chunk_chars": sum(map(len, texts)) / max(len(texts), 1),
+        "index_bytes": index_bytes,
+        "build_seconds": build_seconds,
+        f"recall@{k}": recall / len(queries),
+        f"hit@{k}": hits / len(queries),
+        "misses": misses,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="离线评测不同分块配置的索引成本和召回率")
+    parser.add_argument("--config", action="append", default=[], help="分割配置，格式 分割方式:块大小:重叠，可重复")
+    parser.add_argument("--kb-path", default=utils.KB_PATH, help="知识库目录")
+    parser.add_argument("--k", type=int, default=utils.RETRIEVER_K, help="每个查询取回的文档块数")
+    parser.add_argument("--retrieval", choices=["hybrid", "dense"], default=utils.RETRIEVAL_MODE, help="检索方式")
+    parser.add_argument("--tolerance", type=float, default=0.0, help="推荐配置允许比最优召回率低多少")
+    parser.add_argument("--json", dest="json_path", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    configs = [parse_config(item) for item in args.config or DEFAULT_CONFIGS]
+    documents = utils.load_knowledge_base(args.kb_path)
+    if not documents:
+        print("知识库为空，无法评测")
+        return 1
+
+    recall_key = f"recall@{args.k}"
+    results = []
+    for config in configs:
+        result = evaluate(documents, config, args.k, args.retrieval, LABELLED_QUERIES)
+        results.append(result)
+        print(
+            f"{result['config']:18s} 块数 {result['chunks']:5d}  平均 {result['avg_chunk_chars']:6.0f} 字符  "
+            f"索引 {result['index_bytes'] / 1024 / 1024:6.2f} MB  构建 {result['build_seconds']:6.2f}s  "
+            f"{recall_key} {result[recall_key]:.3f}  hit@{args.k} {result[f'hit@{args.k}']:.3f}"
+        )
+
+    # 召回率在容差内的配置里选索引最小的
+    best_recall = max(result[recall_key] for result in results)
+    candidates = [result for result in results if result[recall_key] >= best_recall - args.tolerance]
+    choice = min(candidates, key=lambda result: result["index_bytes"])
+    print(f"\n推荐配置：{choice['config']}（{recall_key} {choice[recall_key]:.3f}，索引 {choice['index_bytes'] / 1024 / 1024:.2f} MB）")
+    if choice["misses"]:
+        print("未命中的查询：" + "；".join(choice["misses"]))
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"k": args.k, "retrieval": args.retrieval, "queries": len(LABELLED_QUERIES), "results": results},
+                f, ensure_ascii=False, indent=2
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
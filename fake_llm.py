@@ -0,0 +1,260 @@
+"""
+确定性的本地对话模型：按 prompt 类型生成与真实输出结构一致的内容，不发起任何网络请求
+
+- JD 分析 prompt：按“岗位匹配度分析 ... 差异化竞争建议”五个章节输出，技能匹配与差距由 JD 和简历中的技术关键词计算
+- 冲刺计划 prompt：以“### 🚨 面试倒计时：N 天 🚨”开头，按日期逐日列出围绕技能差距的任务
+- ReAct Agent prompt：先调用 jd_analysis，拿到 Observation 后给出 Final Answer
+相同输入总是得到相同输出，供离线模式、基准测试和压测走完真实的检索、prompt、Agent 和工具链路。
+"""
+import re
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from rate_limiter import estimate_tokens
+
+FAKE_CHAT_MODEL = "fake-chat"
+PLAN_MAX_DAYS = 30  # 冲刺计划最多展开的天数，更长的计划只列出前 PLAN_MAX_DAYS 天
+
+# 中文技术关键词；英文 / 数字术语（Python、C++、LoRA 等）直接按词提取
+SKILL_KEYWORDS = [
+    "大模型", "机器学习", "深度学习", "强化学习", "自然语言处理", "计算机视觉", "多模态", "推荐系统",
+    "微调", "检索", "向量检索", "知识库", "评测", "数据标注", "分布式", "高并发", "并发", "数据库",
+    "操作系统", "计算机网络", "数据结构", "算法", "系统设计", "部署", "架构", "产品",
+]
+_TERM_PATTERN = re.compile(r"[A-Za-z][A-Za-z0-9+#]*(?:[.\-][A-Za-z0-9+#]+)*")
+_TERM_STOPWORDS = {"and", "or", "the", "of", "to", "in", "with", "for", "a", "an", "is", "jd"}
+_WEEKDAYS = ["星期一", "星期二", "星期三", "星期四", "星期五", "星期六", "星期日"]
+_MOTTOS = [
+    "每天进步一点点，面试官看得见。",
+    "把差距变成亮点，从今天开始。",
+    "扎实的基础是最好的底气。",
+    "复盘比刷题更重要，想清楚再出发。",
+    "保持节奏，稳定发挥。",
+]
+
+
+def extract_skills(text: str) -> List[str]:
+    """按出现顺序提取技术关键词（英文术语忽略大小写去重）"""
+    found = []
+    seen = set()
+    for match in _TERM_PATTERN.finditer(text):
+        term = match.group()
+        if len(term) < 2 or term.lower() in _TERM_STOPWORDS or term.lower() in seen:
+            continue
+        seen.add(term.lower())
+        found.append((match.start(), term))
+    for keyword in SKILL_KEYWORDS:
+        position = text.find(keyword)
+        # 较长的关键词已覆盖时（如“向量检索”之于“检索”）不再重复
+        if position >= 0 and not any(keyword in other and keyword != other for _, other in found):
+            found.append((position, keyword))
+    return [term for _, term in sorted(found)]
+
+
+def _section(prompt: str, start: str, end: str) -> str:
+    match = re.search(re.escape(start) + r"(.*?)" + re.escape(end), prompt, re.S)
+    return match.group(1).strip() if match else ""
+
+
+def _skill_gaps(report: str) -> List[str]:
+    """JD 分析报告中“技能差距”之后紧跟的列表项"""
+    lines = report.splitlines()
+    for i, line in enumerate(lines):
+        if "技能差距" in line:
+            gaps = []
+            for following in lines[i + 1:]:
+                item = following.strip()
+                if not item.startswith(("-", "*", "•")):
+                    break
+                gaps.append(re.sub(r"^[\-*•\s]+", "", item))
+            return gaps
+    return []
+
+
+def jd_analysis_reply(prompt: str) -> str:
+    """JD 分析报告；prompt 中带有知识库片段时在学习资源中引用"""
+    if "【职位描述(JD)】" in prompt:
+        jd = _section(prompt, "【职位描述(JD)】", "### 【求职者简历】")
+        resume = _section(prompt, "【求职者简历】", "请严格按照")
+    else:
+        jd = _section(prompt, "职位描述(JD)：", "求职者简历：")
+        resume = _section(prompt, "求职者简历：", "请按照")
+    context = _section(prompt, "<context>", "</context>")
+
+    jd_skills = extract_skills(jd)
+    resume_lower = resume.lower()
+    matched = [skill for skill in jd_skills if skill.lower() in resume_lower]
+    gaps = [skill for skill in jd_skills if skill not in matched]
+    score = round(100 * len(matched) / len(jd_skills)) if jd_skills else 60
+    projects = [
+        line.strip().rstrip("。.，,") for line in re.split(r"[\n；;]", resume)
+        if re.search(r"项目|实习|负责", line) and line.strip()
+    ][:3] or ["简历中与岗位最相关的一段经历"]
+    references = [
+        re.sub(r"\s+", " ", chunk).strip()[:40] for chunk in context.split("\n\n") if chunk.strip()
+    ][:3]
+
+    lines = [
+        "## 1. 岗位匹配度分析",
+        f"- **技能匹配度评分：{score}/100**",
+        f"- **匹配的关键技能：** {'、'.join(matched) if matched else '暂无直接匹配的技术关键词'}",
+        "- **需要补充的技能差距：**",
+    ]
+    lines += [f"  - {gap}" for gap in gaps[:6]] or ["  - 暂无明显差距，建议深挖已有技能的原理与项目细节"]
+    lines += ["", "## 2. 推荐重点准备的项目经验"]
+    lines += [f"- {project}：梳理背景、难点、个人贡献和量化结果" for project in projects]
+    lines += [f"- 将项目经验与岗位要求中的 {'、'.join(jd_skills[:3]) or '核心职责'} 逐条对应"]
+    lines += [
+        "",
+        "## 3. 面试重点准备方向",
+        "### 3.1 技术面试考点",
+    ]
+    lines += [f"- {skill} 的核心原理与常见面试题" for skill in (gaps or matched)[:4]] or ["- 数据结构与算法基础"]
+    lines += [
+        "- 结合岗位场景的系统设计题",
+        "",
+        "### 3.2 软实力面试",
+        "- 项目推进中的优先级取舍与时间管理",
+        "- 跨团队协作与沟通的具体案例",
+        "- 技术选型时的权衡与决策依据",
+        "",
+        "## 4. 学习资源推荐",
+        "### 4.1 技术栈资料",
+    ]
+    lines += [f"- 知识库参考：{reference}" for reference in references]
+    lines += [f"- {skill} 官方文档与入门教程" for skill in (gaps or jd_skills)[:3]] or ["- 岗位相关技术的官方文档"]
+    lines += [
+        "",
+        "### 4.2 面试题库",
+        "- LeetCode 高频题（数组、链表、动态规划）",
+        "- 系统设计面试参考资料",
+        "",
+        "## 5. 差异化竞争建议",
+        f"- 突出 {'、'.join(matched[:2]) or '快速学习能力'} 方面的优势",
+        f"- 针对 {'、'.join(gaps[:2]) or '岗位核心技能'} 准备一个可演示的小项目",
+        "- 用数据说明项目成果，形成记忆点",
+    ]
+    return "\n".join(lines)
+
+
+def interview_plan_reply(prompt: str) -> str:
+    """逐日冲刺计划：前期补技能差距，中期项目复盘，后期模拟面试"""
+    days_match = re.search(r"距离面试还有:\s*(\d+)\s*天", prompt)
+    today_match = re.search(r"今天的日期是:\s*(\d{4})年(\d{2})月(\d{2})日", prompt)
+    days = int(days_match.group(1)) if days_match else 7
+    today = datetime(*map(int, today_match.groups())) if today_match else datetime(2024, 1, 1)
+    gaps = _skill_gaps(prompt) or ["岗位核心技能"]
+
+    plan_days = max(1, min(days - 1, PLAN_MAX_DAYS))
+    lines = [f"### 🚨 面试倒计时：{days} 天 🚨", ""]
+    for i in range(plan_days):
+        day = today + timedelta(days=i)
+        progress = (i + 1) / plan_days
+        gap = gaps[i % len(gaps)]
+        if progress <= 0.4:
+            phase, tasks = "基础与技能差距", [f"针对【技能差距：{gap}】系统学习核心概念并整理笔记", f"完成 2 道与 {gap} 相关的练习题"]
+        elif progress <= 0.8:
+            phase, tasks = "综合练习与项目复盘", [f"复盘项目经验，补充与 {gap} 相关的设计细节", "按 STAR 法则写出项目讲述稿"]
+        else:
+            phase, tasks = "模拟面试与状态调整", ["完成一次完整的模拟面试并记录问题", "早睡，保持良好状态"]
+        lines.append(f"#### {day.strftime('%Y年%m月%d日')} {_WEEKDAYS[day.weekday()]}（{phase}）")
+        lines.append(f"> {_MOTTOS[i % len(_MOTTOS)]}")
+        lines += [f"- [ ] {task}" for task in tasks]
+        lines.append("")
+    if days - 1 > plan_days:
+        lines.append(f"（之后的 {days - 1 - plan_days} 天按“模拟面试与状态调整”节奏重复）")
+    return "\n".join(lines).rstrip()
+
+
+def react_reply(prompt: str) -> Optional[str]:
+    """ReAct Agent 的回答：第一轮调用 jd_analysis，拿到 Observation 后给出最终答案；不是 Agent prompt 时返回 None"""
+    if "Action Input" not in prompt or "Final Answer" not in prompt:
+        return None
+    scratchpad = prompt.rsplit("Question:", 1)[-1]
+    if "Observation:" in scratchpad:
+        observation = scratchpad.rsplit("Observation:", 1)[-1].split("\nThought:", 1)[0].strip()
+        return f"Thought: 我现在知道最终答案了\nFinal Answer: {observation}"
+    jd = re.search(r"职位描述：(.*?)\n", prompt)
+    resume = re.search(r"简历内容：(.*?)\n", prompt)
+    action_input = json.dumps({
+        "jd_content": jd.group(1) if jd else "",
+        "resume_content": resume.group(1) if resume else "",
+    }, ensure_ascii=False)
+    return f"Thought: 我需要先分析 JD 和简历\nAction: jd_analysis\nAction Input: {action_input}"
+
+
+def fake_reply(prompt: str) -> str:
+    """按 prompt 类型生成回答"""
+    reply = react_reply(prompt)
+    if reply is not None:
+        return reply
+    if "面试倒计时" in prompt:
+        return interview_plan_reply(prompt)
+    if "岗位匹配度分析" in prompt:
+        return jd_analysis_reply(prompt)
+    return f"（离线模型）已收到约 {estimate_tokens(prompt)} 个 token 的请求。"
+
+
+def _apply_stop(text: str, stop: Optional[List[str]]) -> str:
+    for sequence in stop or []:
+        if sequence in text:
+            text = text[:text.index(sequence)]
+    return text
+
+
+class FakeChatModel(BaseChatModel):
+    """确定性的本地对话模型，与 ChatOpenAI 一样支持普通调用和逐行流式输出"""
+
+    model_name: str = FAKE_CHAT_MODEL
+    temperature: float = 0.7  # 仅用于与真实模型保持相同的参数，不影响输出
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name}
+
+    def _reply(self, messages: List[BaseMessage], stop: Optional[List[str]]) -> Tuple[str, str]:
+        prompt = "\n".join(message.content for message in messages if isinstance(message.content, str))
+        return prompt, _apply_stop(fake_reply(prompt), stop)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        prompt, text = self._reply(messages, stop)
+        prompt_tokens, completion_tokens = estimate_tokens(prompt), estimate_tokens(text)
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=text))],
+            llm_output={
+                "model_name": self.model_name,
+                "token_usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            },
+        )
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> Iterator[ChatGenerationChunk]:
+        _, text = self._reply(messages, stop)
+        for line in text.splitlines(keepends=True):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=line))
+            if run_manager:
+                run_manager.on_llm_new_token(line, chunk=chunk)
+            yield chunk
@@ -0,0 +1,278 @@
+"""
+本地假 OpenAI 兼容服务：实现 /v1/chat/completions（含流式）和 /v1/embeddings，用于基准测试和离线联调
+
+- 首 token 延迟、每秒输出 token 数、embedding 请求延迟均可配置
+- 按 error_rate 的概率随机返回 429（带 Retry-After），随机数种子固定，结果可复现
+- 回答是长度固定的分析报告；收到 ReAct Agent 的 prompt 时按 Thought / Action / Final Answer 格式回答（与 fake_llm 相同）
+- embedding 向量由输入内容的哈希确定，同一输入每次得到相同的向量
+
+用法：
+    python fake_openai_server.py --port 8900 --latency 0.5 --tokens-per-second 40 --error-rate 0.1
+    # 然后设置 MOONSHOT_API_BASE=http://127.0.0.1:8900/v1、OPENAI_BASE_URL=http://127.0.0.1:8900/v1
+"""
+import sys
+import json
+import time
+import base64
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+import numpy as np
+
+from fake_llm import react_reply
+
+# 每个 token 按 2 个字符切分输出，报告内容超出 completion_tokens 时截断、不足时重复
+TOKEN_CHARS = 2
+REPORT_TEMPLATE = """## 1. 岗位匹配度分析
+- **技能匹配度评分：78/100**
+- **匹配的关键技能：** Python、PyTorch、NLP 项目经验、Transformer 原理
+- **需要补充的技能差距：**
+  - RAG 检索增强生成的工程实践
+  - LoRA 等参数高效微调方法
+  - 向量检索与大模型评测
+
+## 2. 推荐重点准备的项目经验
+- 梳理 NLP 项目中的数据处理、模型选型和效果评估，准备可量化的结果
+- 补充一个基于 LangChain 的检索问答小项目，说明分块、召回和重排策略
+
+## 3. 高频面试题预测
+1. self-attention 为什么要除以根号 dk？
+2. LoRA 的秩 r 和 lora_alpha 如何影响训练？
+3. RAG 系统如何评测召回和生成质量？
+
+## 4. 每日学习安排
+- 第 1-3 天：复习 Transformer 与注意力机制
+- 第 4-6 天：完成 RAG 小项目并整理笔记
+- 第 7 天：模拟面试与查漏补缺
+"""
+
+
+def _tokens(text: str) -> List[str]:
+    return [text[i:i + TOKEN_CHARS] for i in range(0, len(text), TOKEN_CHARS)]
+
+
+def report_tokens(count: int) -> List[str]:
+    """count 个 token 的报告内容"""
+    tokens = _tokens(REPORT_TEMPLATE)
+    return [tokens[i % len(tokens)] for i in range(count)]
+
+
+def embedding_vector(item, dim: int) -> np.ndarray:
+    """由输入内容确定的单位向量（输入可能是文本，也可能是 tiktoken 编码后的 token 列表）"""
+    digest = hashlib.sha256(json.dumps(item, ensure_ascii=False).encode("utf-8")).digest()
+    vector = np.random.default_rng(int.from_bytes(digest[:8], "little")).standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class FakeOpenAIServer:
+    """
+    在后台线程中运行的假 OpenAI 兼容服务
+
+    Args:
+        latency: chat 请求的首 token 延迟（秒）
+        tokens_per_second: chat 输出速度
+        completion_tokens: 每次回答的 token 数
+        embed_latency: 每个 embedding 请求的延迟（秒）
+        embedding_dim: embedding 维度
+        error_rate: 每个请求返回 429 的概率
+        retry_after: 429 响应中 Retry-After 头的秒数
+        seed: 错误注入的随机数种子
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.2,
+        tokens_per_second: float = 200.0,
+        completion_tokens: int = 200,
+        embed_latency: float = 0.05,
+        embedding_dim: int = 1536,
+        error_rate: float = 0.0,
+        retry_after: float = 1.0,
+        seed: int = 0
+    ):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.embed_latency = embed_latency
+        self.embedding_dim = embedding_dim
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"chat_requests": 0, "embedding_requests": 0, "rate_limited": 0, "completion_tokens": 0}
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        """在当前线程中运行，直到被中断"""
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self._lock:
+            self.stats[key] += amount
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            return self.error_rate > 0 and self._random.random() < self.error_rate
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, payload: dict, headers: Optional[dict] = None) -> None:
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.path.endswith("/chat/completions"):
+                    server._count("chat_requests")
+                    endpoint = self._chat
+                elif self.path.endswith("/embeddings"):
+                    server._count("embedding_requests")
+                    endpoint = self._embeddings
+                else:
+                    self._send_json(404, {"error": {"message": f"unknown path {self.path}", "type": "invalid_request_error"}})
+                    return
+                if server._should_fail():
+                    server._count("rate_limited")
+                    self._send_json(
+                        429,
+                        {"error": {"message": "rate limit reached (injected)", "type": "rate_limit_reached_error"}},
+                        {"Retry-After": f"{server.retry_after:g}"}
+                    )
+                    return
+                endpoint(request)
+
+            def _chat(self, request: dict) -> None:
+                prompt = "\n".join(str(message.get("content", "")) for message in request.get("messages", []))
+                reply = react_reply(prompt)
+                tokens = _tokens(reply) if reply is not None else report_tokens(server.completion_tokens)
+                for stop in request.get("stop") or []:
+                    text = "".join(tokens)
+                    if stop in text:
+                        tokens = _tokens(text[:text.index(stop)])
+                server._count("completion_tokens", len(tokens))
+                model = request.get("model", "fake")
+                interval = 1.0 / server.tokens_per_second if server.tokens_per_second > 0 else 0.0
+                time.sleep(server.latency)
+
+                if not request.get("stream"):
+                    time.sleep(interval * len(tokens))
+                    self._send_json(200, {
+                        "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()), "model": model,
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}],
+                        "usage": {
+                            "prompt_tokens": len(prompt),
+                            "completion_tokens": len(tokens),
+                            "total_tokens": len(prompt) + len(tokens),
+                        },
+                    })
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                for i, token in enumerate(tokens):
+                    if i:
+                        time.sleep(interval)
+                    self._send_event({"content": token}, None, model)
+                self._send_event({}, "stop", model)
+                self.wfile.write(b"data: [DONE]\n\n")
+
+            def _send_event(self, delta: dict, finish_reason: Optional[str], model: str) -> None:
+                chunk = {
+                    "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+            def _embeddings(self, request: dict) -> None:
+                items = request.get("input", [])
+                if isinstance(items, str) or (items and isinstance(items[0], int)):
+                    items = [items]
+                time.sleep(server.embed_latency)
+                data = []
+                for i, item in enumerate(items):
+                    vector = embedding_vector(item, server.embedding_dim)
+                    if request.get("encoding_format") == "base64":
+                        embedding = base64.b64encode(vector.astype("<f4").tobytes()).decode("ascii")
+                    else:
+                        embedding = vector.tolist()
+                    data.append({"object": "embedding", "index": i, "embedding": embedding})
+                self._send_json(200, {
+                    "object": "list", "data": data, "model": request.get("model", "fake"),
+                    "usage": {"prompt_tokens": 0, "total_tokens": 0},
+                })
+
+        return Handler
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="启动本地假 OpenAI 兼容服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.2, help="chat 首 token 延迟（秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="chat 输出速度")
+    parser.add_argument("--completion-tokens", type=int, default=200, help="每次回答的 token 数")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="embedding 请求延迟（秒）")
+    parser.add_argument("--embedding-dim", type=int, default=1536, help="embedding 维度")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 429 的概率")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429 响应的 Retry-After（秒）")
+    parser.add_argument("--seed", type=int, default=0, help="错误注入的随机数种子")
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(
+        args.host, args.port, args.latency, args.tokens_per_second, args.completion_tokens,
+        args.embed_latency, args.embedding_dim, args.error_rate, args.retry_after, args.seed
+    )
+    print(f"假 OpenAI 服务已启动：{server.base_url}（Ctrl+C 退出）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
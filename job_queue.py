@@ -0,0 +1,231 @@
+"""
+进程内共享的后台任务队列：耗时的分析、计划生成和 Agent 运行交给工作线程池执行
+
+Streamlit 每次交互都会重跑脚本，在脚本线程里同步等待模型输出时，任何操作都会中断并丢弃正在进行的分析。
+改为提交任务：按钮点击只把任务放入队列并返回任务 ID，页面按 ID 轮询状态和已输出的部分内容；
+任务状态和最终结果写入 SQLite，刷新页面或进程重启后仍可查看历史结果。
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from tracing import trace
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))  # 同时执行的任务数，其余任务排队
+JOB_STORE_PATH = os.path.join(os.path.dirname(__file__), 'jobs.sqlite3')
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", 7 * 24 * 3600))  # 已结束任务的保留时长
+JOB_MAX_ENTRIES = int(os.getenv("JOB_MAX_ENTRIES", 500))  # 已结束任务的最多保留条数，超出时删除最早的
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+class Job:
+    """
+    一个后台任务；执行函数通过 write / stream 追加部分输出，页面轮询时读取 snapshot
+
+    result 为执行函数的返回值（需可 JSON 序列化），error 为展示给用户的错误信息。
+    """
+
+    def __init__(self, kind: str, title: str = "", owner: Optional[str] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.title = title
+        self.owner = owner
+        self.status = "queued"  # queued -> running -> succeeded / failed
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.trace = None
+        self._pieces: List[str] = []
+        self._lock = threading.Lock()
+
+    def write(self, text: str) -> None:
+        """追加一段部分输出"""
+        if text:
+            with self._lock:
+                self._pieces.append(text)
+
+    def stream(self, pieces: Iterable[str]) -> str:
+        """逐段消费流式输出并追加为部分输出，返回完整文本"""
+        for piece in pieces:
+            self.write(piece)
+        return self.output
+
+    @property
+    def output(self) -> str:
+        with self._lock:
+            return "".join(self._pieces)
+
+    def snapshot(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "title": self.title,
+            "owner": self.owner,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "output": self.output,
+            "result": self.result,
+            "error": self.error,
+            "trace": self.trace,
+        }
+
+
+class JobQueue:
+    """
+    固定大小的工作线程池 + SQLite 任务存储
+
+    排队和执行中的任务保存在内存里，页面可随时读取部分输出；结束后写入 SQLite 并从内存移除。
+    启动时仍处于排队 / 执行中的记录来自上一个进程，标记为失败。
+    """
+
+    def __init__(self, path: str = JOB_STORE_PATH, max_workers: int = JOB_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="job")
+        self._active: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, title TEXT NOT NULL, owner TEXT, status TEXT NOT NULL, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL, "
+            "output TEXT NOT NULL, result TEXT, error TEXT, trace TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_owner ON jobs (owner, created_at)")
+        self._conn.execute(
+            "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE status IN ('queued', 'running')",
+            ("服务已重启，任务未能完成，请重新提交", time.time())
+        )
+        self._prune()
+        self._conn.commit()
+
+    def submit(
+        self,
+        kind: str,
+        target: Callable[[Job], Any],
+        title: str = "",
+        owner: Optional[str] = None,
+        error_message: Callable[[Exception], str] = str
+    ) -> str:
+        """
+        提交任务，立即返回任务 ID
+
+        Args:
+            kind: 任务类型，同时作为请求追踪的名称（jd_analysis / interview_schedule / agent_pipeline 等）
+            target: 执行函数，参数为 Job，可调用 job.write / job.stream 输出部分结果，返回值即任务结果
+            title: 展示在历史任务列表中的简短说明
+            owner: 提交者标识，用于只列出自己的任务
+            error_message: 把执行函数抛出的异常转换为展示给用户的错误信息
+        """
+        job = Job(kind, title, owner)
+        with self._lock:
+            self._active[job.id] = job
+            self._save(job)
+        self._executor.submit(self._run, job, target, error_message)
+        return job.id
+
+    def _run(self, job: Job, target: Callable[[Job], Any], error_message: Callable[[Exception], str]) -> None:
+        job.status = "running"
+        job.started_at = time.time()
+        with self._lock:
+            self._save(job)
+
+        request_trace = None
+        try:
+            with trace(job.kind, job_id=job.id) as request_trace:
+                job.result = target(job)
+            status = "succeeded"
+        except Exception as e:
+            print(f"后台任务 {job.kind}（{job.id}）失败: {e}")
+            job.error = error_message(e)
+            status = "failed"
+        if request_trace is not None:
+            job.trace = request_trace.summary()
+        job.finished_at = time.time()
+
+        with self._lock:
+            # 最后才更新状态，轮询方看到任务结束时结果和追踪数据都已就绪
+            job.status = status
+            self._prune()
+            self._save(job)  # 同一事务中提交清理结果
+            self._active.pop(job.id, None)
+
+    def _save(self, job: Job) -> None:
+        """调用方持有 self._lock"""
+        self._conn.execute(
+            "INSERT OR REPLACE INTO jobs "
+            "(id, kind, title, owner, status, created_at, started_at, finished_at, output, result, error, trace) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                job.id, job.kind, job.title, job.owner, job.status, job.created_at, job.started_at, job.finished_at,
+                job.output,
+                None if job.result is None else json.dumps(job.result, ensure_ascii=False),
+                job.error,
+                None if job.trace is None else json.dumps(job.trace, ensure_ascii=False),
+            )
+        )
+        self._conn.commit()
+
+    def _prune(self) -> None:
+        """删除过期的已结束任务，并只保留最近 JOB_MAX_ENTRIES 条；调用方持有 self._lock 或在初始化中"""
+        self._conn.execute(
+            "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND finished_at < ?",
+            (time.time() - JOB_RETENTION_SECONDS,)
+        )
+        self._conn.execute(
+            "DELETE FROM jobs WHERE id IN ("
+            "SELECT id FROM jobs WHERE status IN ('succeeded', 'failed') ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (JOB_MAX_ENTRIES,)
+        )
+
+    @staticmethod
+    def _from_row(row: tuple) -> dict:
+        keys = ("id", "kind", "title", "owner", "status", "created_at", "started_at", "finished_at",
+                "output", "result", "error", "trace")
+        job = dict(zip(keys, row))
+        for key in ("result", "trace"):
+            if job[key] is not None:
+                job[key] = json.loads(job[key])
+        return job
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """任务的当前状态、部分输出和结果；任务不存在（或已被清理）时返回 None"""
+        with self._lock:
+            job = self._active.get(job_id)
+            if job is not None:
+                return job.snapshot()
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._from_row(row) if row else None
+
+    def list_jobs(self, owner: Optional[str] = None, limit: int = 20) -> List[dict]:
+        """最近提交的任务（新的在前）；列表中不含部分输出和结果，需要时用 get 读取"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, kind, title, status, created_at, finished_at FROM jobs "
+                "WHERE owner IS ? OR ? IS NULL ORDER BY created_at DESC LIMIT ?",
+                (owner, owner, limit)
+            ).fetchall()
+        keys = ("id", "kind", "title", "status", "created_at", "finished_at")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def stats(self) -> dict:
+        with self._lock:
+            running = sum(job.status == "running" for job in self._active.values())
+            return {"running": running, "queued": len(self._active) - running}
+
+
+def get_job_queue() -> JobQueue:
+    """获取进程内共享的任务队列，所有 Streamlit 会话共用同一个工作线程池"""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue(JOB_STORE_PATH, JOB_WORKERS)
+        return _job_queue
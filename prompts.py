@@ -1,4 +1,4 @@
-from langchain.prompts import PromptTemplate, ChatPromptTemplate
+from langchain_core.prompts import PromptTemplate, ChatPromptTemplate
 
 JD_ANALYSIS_TEMPLATE_WITH_RAG = [
     ("system", 
@@ -162,7 +162,7 @@ AGENT_PROMPT_TEMPLATE = """你是一个专业的求职助手Agent。请使用提
 
 Question: 用户的输入问题
 Thought: 我需要分析这个问题并决定使用哪个工具
-Action: 工具名称
+Action: 工具名称，必须是 [{tool_names}] 之一
 Action Input: {{"参数名1": "参数值1", "参数名2": "参数值2"}}
 Observation: 工具执行的结果
 ... (思考/行动/观察可以重复多次)
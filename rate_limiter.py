@@ -0,0 +1,115 @@
+import os
+import time
+import threading
+from typing import Any, Dict, Optional
+
+# 各接口的 (RPM, TPM) 额度，默认值对应 Moonshot / OpenAI 的一档账户，可通过环境变量覆盖
+RATE_LIMITS = {
+    "chat": (int(os.getenv("CHAT_RPM", 200)), int(os.getenv("CHAT_TPM", 128000))),
+    "embeddings": (int(os.getenv("EMBED_RPM", 3000)), int(os.getenv("EMBED_TPM", 1000000))),
+}
+
+_limiters: Dict[str, "RateLimiter"] = {}
+_limiters_lock = threading.Lock()
+_encoding = None
+
+
+class RateLimiter:
+    """
+    按每分钟请求数(RPM)和每分钟 token 数(TPM)限流的双令牌桶
+
+    两个桶都以“每分钟额度”为容量，按秒匀速补充；只有额度真正用完时 acquire 才会等待。
+    rpm / tpm 为 None 或 0 表示该维度不限流。
+    """
+
+    def __init__(self, rpm: Optional[int] = None, tpm: Optional[int] = None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm or 0)
+        self._tokens = float(tpm or 0)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def acquire(self, tokens: int = 0) -> float:
+        """
+        占用一次请求和 tokens 个 token 的额度，额度不足时阻塞等待
+
+        Returns:
+            实际等待的秒数
+        """
+        # 单次请求超过整桶容量时按整桶计，避免永远等不到
+        if self.tpm:
+            tokens = min(tokens, self.tpm)
+
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                wait = 0.0
+                if self.rpm and self._requests < 1:
+                    wait = max(wait, (1 - self._requests) * 60 / self.rpm)
+                if self.tpm and self._tokens < tokens:
+                    wait = max(wait, (tokens - self._tokens) * 60 / self.tpm)
+                if wait == 0.0:
+                    if self.rpm:
+                        self._requests -= 1
+                    if self.tpm:
+                        self._tokens -= tokens
+                    return waited
+            time.sleep(wait)
+            waited += wait
+
+
+def get_rate_limiter(endpoint: str) -> RateLimiter:
+    """获取进程内共享的接口限流器（chat / embeddings），同一接口的所有调用共用一份额度"""
+    with _limiters_lock:
+        if endpoint not in _limiters:
+            rpm, tpm = RATE_LIMITS[endpoint]
+            _limiters[endpoint] = RateLimiter(rpm=rpm, tpm=tpm)
+        return _limiters[endpoint]
+
+
+def estimate_tokens(text: str) -> int:
+    """用 tiktoken 估算 token 数；编码表不可用时按字符数估算（中文约一字一 token）"""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    if not _encoding:
+        return len(text)
+    return len(_encoding.encode_ordinary(text))
+
+
+def _content_tokens(content: Any) -> int:
+    """消息内容或 embedding 输入的 token 数：字符串按 estimate_tokens 估算，token id 列表直接计数"""
+    if isinstance(content, str):
+        return estimate_tokens(content)
+    if isinstance(content, dict):
+        return _content_tokens(content.get("text", ""))
+    if isinstance(content, (list, tuple)):
+        if content and all(isinstance(item, int) for item in content):
+            return len(content)
+        return sum(_content_tokens(item) for item in content)
+    return 0
+
+
+def request_tokens(request: Dict[str, Any]) -> int:
+    """
+    一次 openai 请求（chat.completions / embeddings 的 create 参数）需要预占的 token 额度
+
+    输入按消息内容或 input 估算；对话请求再加上 max_tokens，服务端同样按输入加最大输出长度计入 TPM。
+    """
+    tokens = sum(_content_tokens(message.get("content")) for message in request.get("messages") or [])
+    tokens += _content_tokens(request.get("input"))
+    return tokens + (request.get("max_tokens") or 0)
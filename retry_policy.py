@@ -0,0 +1,262 @@
+import os
+import time
+import random
+import threading
+import email.utils
+from typing import Any, Callable, Dict, Optional
+
+from rate_limiter import RateLimiter, request_tokens
+
+# 重试与熔断参数，可通过环境变量覆盖
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", 4))  # 含首次请求在内的最多尝试次数
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", 1.0))  # 指数退避的基础间隔（秒）
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", 20.0))  # 单次退避间隔上限（秒）
+RETRY_DEADLINE = float(os.getenv("RETRY_DEADLINE", 150.0))  # 单个请求（含全部重试）的总时限（秒）
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))  # 连续失败多少次后熔断
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", 30.0))  # 熔断后多久放行一次试探请求
+
+_policies: Dict[str, "RetryPolicy"] = {}
+_policies_lock = threading.Lock()
+
+
+class CircuitOpenError(Exception):
+    """接口处于熔断状态，请求未发出即失败"""
+
+    def __init__(self, endpoint: str, retry_in: float):
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+        super().__init__(f"{endpoint} 接口繁忙，已暂停请求，约 {max(1, round(retry_in))} 秒后恢复")
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _error_chain(error: BaseException):
+    """依次产出异常本身及其 __cause__ / __context__，LangChain 包装过的异常也能识别"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        error = error.__cause__ or error.__context__
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """是否为限流错误（HTTP 429 或熔断中），取代对异常文本做 "429" 子串匹配"""
+    for item in _error_chain(error):
+        if isinstance(item, CircuitOpenError) or _status_code(item) == 429:
+            return True
+        if type(item).__name__ == "RateLimitError":
+            return True
+    return False
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """
+    是否为值得重试的临时错误：限流、超时、连接失败和服务端 5xx
+
+    鉴权失败、参数错误等 4xx 重试也不会成功，直接抛出。
+    """
+    for item in _error_chain(error):
+        if isinstance(item, CircuitOpenError):
+            return True
+        status = _status_code(item)
+        if status is not None:
+            return status in (408, 409, 429) or status >= 500
+        if type(item).__name__ in ("APIConnectionError", "APITimeoutError", "ConnectError", "ReadTimeout", "ConnectTimeout"):
+            return True
+    return False
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """解析服务端返回的 retry-after-ms / retry-after 头（秒数或 HTTP 日期），没有时返回 None"""
+    for item in _error_chain(error):
+        headers = getattr(getattr(item, "response", None), "headers", None)
+        if not headers:
+            continue
+        try:
+            return max(0.0, float(headers["retry-after-ms"]) / 1000)
+        except (KeyError, TypeError, ValueError):
+            pass
+        value = headers.get("retry-after")
+        if value is None:
+            continue
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            parsed = email.utils.parsedate_tz(value)
+            if parsed is not None:
+                return max(0.0, email.utils.mktime_tz(parsed) - time.time())
+    return None
+
+
+class CircuitBreaker:
+    """
+    按接口计数的熔断器
+
+    连续 failure_threshold 次临时错误后进入熔断（open），期间请求直接失败；
+    reset_seconds 后放行一次试探请求（half-open），成功则恢复，失败则重新熔断。
+    服务端给出更长的 Retry-After 时按服务端要求延长熔断时间。
+    """
+
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_seconds: float = CIRCUIT_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self._opened_until = 0.0
+        self._probing = False
+        self._probe_owner = None  # 发出试探请求的线程
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.failures < self.failure_threshold:
+                return "closed"
+            return "open" if time.monotonic() < self._opened_until or self._probing else "half-open"
+
+    def retry_in(self) -> float:
+        """距离放行下一次试探请求还有多少秒"""
+        with self._lock:
+            return max(0.0, self._opened_until - time.monotonic())
+
+    def allow(self) -> bool:
+        """是否可以发出请求；半开状态下只放行一个试探请求"""
+        with self._lock:
+            if self.failures < self.failure_threshold:
+                return True
+            if time.monotonic() < self._opened_until or self._probing:
+                return False
+            self._probing = True
+            self._probe_owner = threading.get_ident()
+            return True
+
+    def release_probe(self) -> None:
+        """当前线程的试探请求没有结果就结束时（如被中断）交还试探名额，不计入成功或失败"""
+        with self._lock:
+            if self._probing and self._probe_owner == threading.get_ident():
+                self._probing = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self, retry_after: Optional[float] = None) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.failures >= self.failure_threshold:
+                self._opened_until = time.monotonic() + max(self.reset_seconds, retry_after or 0.0)
+
+
+class RetryPolicy:
+    """
+    所有 LLM / embedding 请求共用的重试层
+
+    - 临时错误按带随机抖动的指数退避重试（full jitter），服务端给出 Retry-After 时至少等待该时长
+    - 整个请求（含全部重试）不超过 deadline 秒，剩余时间不够下一次等待时立即放弃
+    - 同一接口共享一个熔断器，接口饱和时请求直接失败，由调用方降级或提示用户
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        max_attempts: int = RETRY_MAX_ATTEMPTS,
+        base_delay: float = RETRY_BASE_DELAY,
+        max_delay: float = RETRY_MAX_DELAY,
+        deadline: float = RETRY_DEADLINE,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        self.endpoint = endpoint
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.breaker = breaker or CircuitBreaker()
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """第 attempt 次失败后的等待秒数（attempt 从 1 开始）"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        return max(delay, retry_after or 0.0)
+
+    def call(self, func: Callable[..., Any], *args: Any, deadline: Optional[float] = None, **kwargs: Any) -> Any:
+        """
+        在重试策略下调用 func；deadline 为 time.monotonic() 的截止时刻，默认从现在起 self.deadline 秒
+
+        Raises:
+            CircuitOpenError: 接口处于熔断状态
+            Exception: 非临时错误、重试次数用尽或超过时限时抛出最后一次的异常
+        """
+        if deadline is None:
+            deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise CircuitOpenError(self.endpoint, self.breaker.retry_in())
+            attempt += 1
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if not is_transient_error(e):
+                    # 请求本身有问题，说明接口是通的
+                    self.breaker.record_success()
+                    raise
+                retry_after = retry_after_seconds(e)
+                self.breaker.record_failure(retry_after)
+                delay = self.backoff(attempt, retry_after)
+                if attempt >= self.max_attempts or time.monotonic() + delay > deadline:
+                    raise
+                print(f"⚠️ {self.endpoint} 请求失败（{type(e).__name__}），{delay:.1f} 秒后第 {attempt + 1} 次尝试")
+                time.sleep(delay)
+            else:
+                self.breaker.record_success()
+                return result
+            finally:
+                # KeyboardInterrupt、Streamlit 停止脚本等 BaseException 不经过上面的分支，
+                # 试探请求若不交还，熔断器会一直停在 open
+                self.breaker.release_probe()
+
+
+class RetryingResource:
+    """
+    给 openai 客户端的资源对象（client.chat.completions / client.embeddings）的 create 方法套上重试策略
+
+    作为 client 参数传给 ChatOpenAI / OpenAIEmbeddings，其余属性原样转发。
+    每次尝试的超时不超过剩余的请求时限；流式请求只重试建立连接阶段，已开始输出后不再重试。
+    传入 limiter 时每次尝试（包括重试）发出前都先申请额度，退避重试同样计入 RPM / TPM。
+    """
+
+    def __init__(self, resource: Any, policy: RetryPolicy, timeout: Optional[float] = None, limiter: Optional[RateLimiter] = None):
+        self._resource = resource
+        self._policy = policy
+        self._timeout = timeout
+        self._limiter = limiter
+
+    def create(self, **kwargs: Any) -> Any:
+        deadline = time.monotonic() + self._policy.deadline
+        tokens = request_tokens(kwargs) if self._limiter is not None else 0
+
+        def attempt() -> Any:
+            if self._limiter is not None:
+                self._limiter.acquire(tokens)
+            remaining = max(1.0, deadline - time.monotonic())
+            timeout = min(self._timeout, remaining) if self._timeout else remaining
+            return self._resource.create(**{"timeout": timeout, **kwargs})
+
+        return self._policy.call(attempt, deadline=deadline)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._resource, name)
+
+
+def get_retry_policy(endpoint: str) -> RetryPolicy:
+    """获取进程内共享的接口重试策略（chat / embeddings），同一接口的所有调用共用一个熔断器"""
+    with _policies_lock:
+        if endpoint not in _policies:
+            _policies[endpoint] = RetryPolicy(endpoint)
+        return _policies[endpoint]
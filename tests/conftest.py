@@ -0,0 +1,72 @@
+import os
+import sys
+import hashlib
+from typing import List
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+# 模块都在仓库根目录下，测试直接按顶层模块导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tracing
+
+
+class FakeClock:
+    """可手动推进的时钟，替换模块里的 time 以免测试真的等待"""
+
+    def __init__(self, start: float = 1000.0):
+        self.now = start
+        self.sleeps = []
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+class CountingEmbeddings(Embeddings):
+    """由文本哈希生成的确定性向量，记录每次被请求向量化的文本，代替远程 embedding 接口"""
+
+    model_name = "counting-embeddings"
+
+    def __init__(self, dim: int = 8):
+        self.dim = dim
+        self.documents: List[str] = []
+        self.queries: List[str] = []
+
+    def _vector(self, text: str) -> List[float]:
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [byte / 255 for byte in digest[:self.dim]]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.documents.extend(texts)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self.queries.append(text)
+        return self._vector(text)
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def embeddings():
+    return CountingEmbeddings()
+
+
+@pytest.fixture(autouse=True)
+def no_trace_files(monkeypatch):
+    # 追踪仍在内存中进行，只是不写 traces.jsonl / metrics.prom
+    monkeypatch.setattr(tracing, "TRACING_ENABLED", False)
@@ -0,0 +1,101 @@
+import threading
+import time
+from typing import Any, Callable
+
+import pytest
+from langchain_core.tools import BaseTool
+
+from agent_executor import JobSearchAgent, _knowledge_query
+
+ANALYSIS = "## 1. 岗位匹配度分析\n- **需要补充的技能差距：**\n  - LoRA\n  - 分布式训练\n## 2. 推荐重点准备的项目经验"
+
+
+class RecordingTool(BaseTool):
+    """记录调用顺序和输入的工具，reply 根据输入生成输出"""
+
+    name: str
+    description: str = "测试工具"
+    calls: Any = None
+    reply: Callable[..., str] = lambda **kwargs: "ok"
+    delay: float = 0.0
+
+    def _run(self, **kwargs: Any) -> str:
+        self.calls.append((self.name, kwargs, time.perf_counter()))
+        time.sleep(self.delay)
+        return self.reply(**kwargs)
+
+
+@pytest.fixture
+def make_agent():
+    def make(analysis: str = ANALYSIS, delay: float = 0.0, tools: tuple = None):
+        calls = []
+        replies = {
+            "jd_analysis": lambda **kwargs: analysis,
+            "interview_schedule": lambda **kwargs: f"计划（{kwargs['interview_date']}）",
+            "knowledge_base_query": lambda **kwargs: f"资料：{kwargs['query']}",
+            "progress_tracking": lambda **kwargs: "进度建议",
+        }
+        names = tools or tuple(replies)
+        agent = JobSearchAgent(None, [
+            RecordingTool(name=name, calls=calls, reply=replies[name], delay=0.0 if name == "jd_analysis" else delay)
+            for name in names
+        ], mode="pipeline")
+        return agent, calls
+    return make
+
+
+def test_pipeline_runs_analysis_then_dependent_tools(make_agent):
+    agent, calls = make_agent()
+    result = agent.analyze_jd_and_generate_plan("招聘大模型工程师", "简历", "2030-01-01")
+
+    assert result["success"]
+    assert calls[0][0] == "jd_analysis"
+    assert calls[0][1] == {"jd_content": "招聘大模型工程师", "resume_content": "简历"}
+    assert sorted(name for name, _, _ in calls[1:]) == ["interview_schedule", "knowledge_base_query", "progress_tracking"]
+    inputs = {name: kwargs for name, kwargs, _ in calls}
+    assert inputs["interview_schedule"] == {"jd_analysis_result": ANALYSIS, "interview_date": "2030-01-01"}
+    assert inputs["knowledge_base_query"] == {"query": "LoRA 分布式训练"}
+
+    assert result["iterations"] == 4
+    assert [step.split(":")[0] for step in result["steps"]] == ["步骤1", "步骤2", "步骤3", "步骤4"]
+    assert result["steps"][0].startswith("步骤1: jd_analysis")
+    titles = ["## 📊 JD 分析", "## 📅 面试冲刺计划", "## 📚 知识库参考", "## 📈 进度建议"]
+    positions = [result["result"].index(title) for title in titles]
+    assert positions == sorted(positions)
+    assert "计划（2030-01-01）" in result["result"]
+
+
+def test_pipeline_stops_when_analysis_fails(make_agent):
+    agent, calls = make_agent(analysis="分析失败：模型不可用")
+    result = agent.analyze_jd_and_generate_plan("JD", "简历", "2030-01-01")
+    assert not result["success"]
+    assert "JD分析失败" in result["error"]
+    assert [name for name, _, _ in calls] == ["jd_analysis"]
+
+
+def test_pipeline_skips_tools_that_are_not_registered(make_agent):
+    agent, calls = make_agent(tools=("jd_analysis", "interview_schedule"))
+    result = agent.analyze_jd_and_generate_plan("JD", "简历", "2030-01-01")
+    assert [name for name, _, _ in calls] == ["jd_analysis", "interview_schedule"]
+    assert "知识库参考" not in result["result"]
+
+
+def test_knowledge_query_prefers_skill_gaps():
+    assert _knowledge_query("招聘大模型工程师", ANALYSIS) == "LoRA 分布式训练"
+    assert _knowledge_query("  招聘大模型工程师  ", "没有差距章节") == "招聘大模型工程师"
+
+
+def test_independent_tools_run_concurrently(make_agent):
+    agent, calls = make_agent(delay=0.3)
+    start = time.perf_counter()
+    result = agent.analyze_jd_and_generate_plan("JD", "简历", "2030-01-01")
+    elapsed = time.perf_counter() - start
+
+    assert result["success"]
+    assert elapsed < 0.6  # 串行执行需要 0.9s 以上
+    branch_starts = [started for name, _, started in calls if name != "jd_analysis"]
+    assert max(branch_starts) - min(branch_starts) < 0.2
+    # 输出仍按固定顺序拼接，与完成先后无关
+    assert [step.split(" -> ")[0].split("（")[0] for step in result["steps"]] == [
+        "步骤1: jd_analysis", "步骤2: interview_schedule", "步骤3: knowledge_base_query", "步骤4: progress_tracking"
+    ]
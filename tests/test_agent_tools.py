@@ -0,0 +1,33 @@
+import agent_tools
+from agent_tools import JDAnalysisTool, ProgressTrackingTool, is_tool_error
+
+
+def test_react_string_input_is_parsed_as_json(monkeypatch):
+    calls = []
+
+    def fake_analyze(jd_content, resume_content, *args, **kwargs):
+        calls.append((jd_content, resume_content))
+        return "分析报告", None
+
+    monkeypatch.setattr(agent_tools, "analyze_job_description", fake_analyze)
+    # ReAct Agent 把 Action Input 原样作为字符串传给工具
+    output = JDAnalysisTool().run('{"jd_content": "招聘 Python 工程师", "resume_content": "熟悉 Python"}')
+    assert output == "分析报告"
+    assert calls == [("招聘 Python 工程师", "熟悉 Python")]
+
+
+def test_plain_string_input_fills_the_first_field():
+    output = ProgressTrackingTool().run("已完成 JD 分析")
+    assert "已完成 JD 分析" in output
+    assert not is_tool_error(output)
+
+
+def test_dict_input_still_works():
+    output = ProgressTrackingTool().run({"current_progress": "刷完 50 道题"})
+    assert "刷完 50 道题" in output
+
+
+def test_tool_errors_are_detected():
+    assert JDAnalysisTool().run('{"jd_content": "只有 JD"}').startswith("❌")
+    assert is_tool_error("  分析失败：超时")
+    assert not is_tool_error("## 1. 岗位匹配度分析")
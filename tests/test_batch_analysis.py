@@ -0,0 +1,61 @@
+import threading
+
+import utils
+
+
+def test_duplicate_jds_are_analyzed_once(monkeypatch):
+    calls = []
+    lock = threading.Lock()
+
+    def fake_analyze(jd_content, resume_content, *args, **kwargs):
+        with lock:
+            calls.append(jd_content)
+        return f"分析：{' '.join(jd_content.split())}（{resume_content}）", None
+
+    monkeypatch.setattr(utils, "analyze_job_description", fake_analyze)
+    jds = ["招聘 Python 工程师", "招聘 Java 工程师", "  招聘 Python\n工程师 ", "招聘 Python 工程师"]
+    results = utils.analyze_job_descriptions_batch(jds, "简历", max_concurrency=2)
+
+    assert sorted(calls) == ["招聘 Java 工程师", "招聘 Python 工程师"]
+    assert results == [
+        ("分析：招聘 Python 工程师（简历）", None),
+        ("分析：招聘 Java 工程师（简历）", None),
+        ("分析：招聘 Python 工程师（简历）", None),
+        ("分析：招聘 Python 工程师（简历）", None),
+    ]
+
+
+def test_one_failure_does_not_affect_other_jds(monkeypatch):
+    def fake_analyze(jd_content, resume_content, *args, **kwargs):
+        if "Java" in jd_content:
+            return None, "分析过程中出现错误"
+        return "ok", None
+
+    monkeypatch.setattr(utils, "analyze_job_description", fake_analyze)
+    results = utils.analyze_job_descriptions_batch(["Python", "Java", "Go"], "简历")
+    assert results == [("ok", None), (None, "分析过程中出现错误"), ("ok", None)]
+
+
+def test_batch_runs_concurrently(monkeypatch):
+    barrier = threading.Barrier(3, timeout=5)
+
+    def fake_analyze(jd_content, resume_content, *args, **kwargs):
+        barrier.wait()  # 三个分析都在途时才会同时放行，串行执行会超时
+        return jd_content, None
+
+    monkeypatch.setattr(utils, "analyze_job_description", fake_analyze)
+    assert utils.analyze_job_descriptions_batch(["a", "b", "c"], "简历", max_concurrency=3) == [
+        ("a", None), ("b", None), ("c", None)
+    ]
+
+
+def test_backend_is_forwarded(monkeypatch):
+    backends = []
+
+    def fake_analyze(jd_content, resume_content, temperature=0.7, use_cache=True, backend=None):
+        backends.append(backend)
+        return jd_content, None
+
+    monkeypatch.setattr(utils, "analyze_job_description", fake_analyze)
+    utils.analyze_job_descriptions_batch(["a", "b"], "简历", backend="fake")
+    assert backends == ["fake", "fake"]
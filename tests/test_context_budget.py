@@ -0,0 +1,66 @@
+import pytest
+from langchain_core.documents import Document
+
+import utils
+from utils import pack_context_documents, trim_to_token_budget
+
+
+@pytest.fixture(autouse=True)
+def char_tokens(monkeypatch):
+    # 按字符计 token，断言不依赖 tiktoken 编码表是否可用
+    monkeypatch.setattr(utils, "estimate_tokens", len)
+
+
+def make_doc(prefix: str, sentences: int, **metadata) -> Document:
+    """由 sentences 个 4 字符的句子组成，各文档的词项互不重复"""
+    return Document(page_content="".join(f"{prefix}{i:02d}。" for i in range(sentences)), metadata=metadata)
+
+
+def test_trim_keeps_text_within_budget():
+    text = "第一句。第二句。第三句。"
+    assert trim_to_token_budget(text, 100) == text
+    assert trim_to_token_budget(text, 12) == text
+
+
+def test_trim_cuts_at_sentence_boundary():
+    text = "第一句。第二句。第三句。"
+    assert trim_to_token_budget(text, 11) == "第一句。第二句。"
+    assert trim_to_token_budget(text, 4) == "第一句。"
+
+
+def test_trim_hard_cuts_when_first_sentence_is_too_long():
+    text = "这是一个没有标点的很长的句子"
+    trimmed = trim_to_token_budget(text, 5)
+    assert trimmed == text[:5]
+    assert trim_to_token_budget(text, 0) == ""
+
+
+def test_pack_keeps_documents_that_fit():
+    docs = [make_doc("a", 25), make_doc("b", 25)]
+    assert pack_context_documents(docs, 200) == docs
+
+
+def test_pack_truncates_last_document_to_remaining_budget():
+    docs = [make_doc("a", 25, source="a.pdf"), make_doc("b", 25), make_doc("c", 25, source="c.pdf", page=3)]
+    packed = pack_context_documents(docs, 280)
+
+    assert packed[:2] == docs[:2]
+    assert len(packed) == 3
+    assert len(packed[2].page_content) == 80  # 剩余 80 个 token，正好 20 个完整句子
+    assert docs[2].page_content.startswith(packed[2].page_content)
+    assert packed[2].metadata == {"source": "c.pdf", "page": 3}
+    assert sum(len(doc.page_content) for doc in packed) <= 280
+
+
+def test_pack_skips_document_when_remainder_is_too_small():
+    docs = [make_doc("a", 25), make_doc("b", 25), make_doc("c", 25)]
+    remaining = utils.CONTEXT_MIN_CHUNK_TOKENS - 1
+    packed = pack_context_documents(docs, 200 + remaining)
+    assert packed == docs[:2]
+
+
+def test_pack_drops_duplicate_chunks():
+    first = make_doc("a", 25)
+    duplicate = Document(page_content=first.page_content.replace("。", "。\n"), metadata={"source": "copy.pdf"})
+    packed = pack_context_documents([first, duplicate, make_doc("b", 25)], 1000)
+    assert [doc.page_content[:3] for doc in packed] == ["a00", "b00"]
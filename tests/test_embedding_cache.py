@@ -0,0 +1,87 @@
+import os
+import threading
+
+import numpy as np
+
+from utils import CachedEmbeddings
+
+
+def test_only_missing_texts_are_embedded(tmp_path, embeddings):
+    cache = CachedEmbeddings(embeddings, "test-model", cache_dir=str(tmp_path))
+    first = cache.embed_documents(["a", "b", "a"])
+    assert embeddings.documents == ["a", "b"]  # 同一批内的重复文本只请求一次
+    assert first[0] == first[2]
+
+    second = cache.embed_documents(["b", "c", "a"])
+    assert embeddings.documents == ["a", "b", "c"]
+    np.testing.assert_allclose(second, [first[1], embeddings.embed_query("c"), first[0]], rtol=1e-6)
+
+
+def test_cached_vectors_match_the_wrapped_model(tmp_path, embeddings):
+    cache = CachedEmbeddings(embeddings, "test-model", cache_dir=str(tmp_path))
+    texts = ["LoRA 的原理", "RAG 的检索流程"]
+    vectors = cache.embed_documents(texts)
+    np.testing.assert_allclose(vectors, [embeddings.embed_query(text) for text in texts], rtol=1e-6)
+
+
+def test_cache_persists_across_instances(tmp_path, embeddings):
+    CachedEmbeddings(embeddings, "test-model", cache_dir=str(tmp_path)).embed_documents(["a", "b"])
+    expected = embeddings.embed_documents(["a", "b"])
+    embeddings.documents.clear()
+
+    reopened = CachedEmbeddings(embeddings, "test-model", cache_dir=str(tmp_path))
+    np.testing.assert_allclose(reopened.embed_documents(["b", "a"]), expected[::-1], rtol=1e-6)
+    assert embeddings.documents == []
+
+    reopened.embed_documents(["c"])
+    assert embeddings.documents == ["c"]
+    CachedEmbeddings(embeddings, "test-model", cache_dir=str(tmp_path)).embed_documents(["a", "b", "c"])
+    assert embeddings.documents == ["c"]
+
+
+def test_models_do_not_share_entries(tmp_path, embeddings):
+    CachedEmbeddings(embeddings, "model-a", cache_dir=str(tmp_path)).embed_documents(["a"])
+    CachedEmbeddings(embeddings, "model-b", cache_dir=str(tmp_path)).embed_documents(["a"])
+    assert embeddings.documents == ["a", "a"]
+    assert sorted(os.listdir(tmp_path)) == ["model-a.bin", "model-a.json", "model-b.bin", "model-b.json"]
+
+
+def test_truncated_trailing_record_is_ignored(tmp_path, embeddings):
+    CachedEmbeddings(embeddings, "test-model", cache_dir=str(tmp_path)).embed_documents(["a", "b"])
+    with open(tmp_path / "test-model.bin", "ab") as f:
+        f.write(b"\x00" * 10)  # 进程中断时残留的半条记录
+
+    embeddings.documents.clear()
+    reopened = CachedEmbeddings(embeddings, "test-model", cache_dir=str(tmp_path))
+    reopened.embed_documents(["a", "b"])
+    assert embeddings.documents == []
+
+
+def test_concurrent_callers_embed_without_holding_the_lock(tmp_path, embeddings):
+    barrier = threading.Barrier(2, timeout=5)
+    embed = embeddings.embed_documents
+
+    def blocking_embed(texts):
+        barrier.wait()  # 远程调用期间持锁时第二个调用方进不来，这里会超时
+        return embed(texts)
+
+    embeddings.embed_documents = blocking_embed
+    cache = CachedEmbeddings(embeddings, "test-model", cache_dir=str(tmp_path))
+    results = {}
+    threads = [
+        threading.Thread(target=lambda text=text: results.setdefault(text, cache.embed_documents([text, "shared"])))
+        for text in ("a", "b")
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results) == ["a", "b"]
+    np.testing.assert_allclose(results["a"][1], results["b"][1], rtol=1e-6)
+    # 两个调用方都向量化了 "shared"，但缓存文件里只追加一次
+    record_size = 32 + 4 * embeddings.dim
+    assert os.path.getsize(tmp_path / "test-model.bin") == record_size * 3
+    embeddings.documents.clear()
+    CachedEmbeddings(embeddings, "test-model", cache_dir=str(tmp_path)).embed_documents(["a", "b", "shared"])
+    assert embeddings.documents == []
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+
+import utils
+from utils import FAISS_INDEX_TYPES, faiss_factory_string, load_search_vector_store, write_search_index
+
+
+def test_factory_strings():
+    assert faiss_factory_string("flat", 1000, 1536) == "Flat"
+    assert faiss_factory_string("fp16", 1000, 1536) == "SQfp16"
+    assert faiss_factory_string("hnsw", 1000, 1536) == f"HNSW{utils.FAISS_HNSW_M}"
+    assert faiss_factory_string("ivf", 10000, 1536) == "IVF256,Flat"  # 受每桶 39 个训练样本限制
+    assert faiss_factory_string("ivf", 100000, 1536) == "IVF1264,Flat"  # 4 * sqrt(n)
+    assert faiss_factory_string("ivf", 10, 1536) == "IVF1,Flat"
+    assert faiss_factory_string("pq", 10000, 1536) == "PQ96x8np"
+    assert faiss_factory_string("pq", 100, 1024) == "PQ64x6np"  # 样本不足 256 个时减少码本位数
+    assert faiss_factory_string("pq", 1, 1024) == "Flat"
+    with pytest.raises(ValueError):
+        faiss_factory_string("lsh", 1000, 1536)
+
+
+class Vectors(Embeddings):
+    """按文本查表返回预先生成的向量"""
+
+    def __init__(self, texts, vectors):
+        self.table = dict(zip(texts, vectors))
+
+    def embed_query(self, text):
+        return self.table[text]
+
+    def embed_documents(self, texts):
+        return [self.table[text] for text in texts]
+
+
+@pytest.fixture(scope="module")
+def flat_index_dir(tmp_path_factory):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(400, 64)).astype(np.float32).tolist()
+    texts = [f"chunk {i}" for i in range(400)]
+    store = FAISS.from_embeddings(list(zip(texts, vectors)), Vectors(texts, vectors), ids=[f"id-{i}" for i in range(400)])
+    index_dir = tmp_path_factory.mktemp("index")
+    store.save_local(str(index_dir))
+    return index_dir, texts, vectors
+
+
+@pytest.mark.parametrize("index_type", FAISS_INDEX_TYPES)
+def test_build_and_mmap_load_round_trip(flat_index_dir, index_type):
+    index_dir, texts, vectors = flat_index_dir
+    write_search_index(str(index_dir), index_type)
+    store = load_search_vector_store(str(index_dir), Vectors(texts, vectors), index_type)
+
+    assert store.index.ntotal == len(texts)
+    hits = 0
+    for i in range(0, 400, 20):
+        results = store.similarity_search(texts[i], k=3)
+        assert len(results) == 3
+        hits += results[0].page_content == texts[i]
+    # pq 是有损压缩，其余类型在测试规模下应精确找回自身
+    assert hits >= (15 if index_type == "pq" else 20)
+
+
+def test_missing_index_type_is_trained_on_load(flat_index_dir, tmp_path):
+    index_dir, texts, vectors = flat_index_dir
+    for name in ("index.faiss", "index.pkl"):
+        (tmp_path / name).write_bytes((index_dir / name).read_bytes())
+
+    store = load_search_vector_store(str(tmp_path), Vectors(texts, vectors), "hnsw")
+    assert (tmp_path / "index_hnsw.faiss").is_file()
+    assert store.similarity_search(texts[7], k=1)[0].page_content == texts[7]
@@ -0,0 +1,94 @@
+from langchain_core.messages import HumanMessage
+
+import agent_executor
+import utils
+from fake_llm import FakeChatModel, extract_skills, fake_reply
+from prompts import jd_analysis_prompt, jd_analysis_prompt_legacy, task_generation_prompt
+
+JD = "招聘大模型算法工程师：熟悉 Python、PyTorch 和 LoRA 微调，有分布式训练经验"
+RESUME = "硕士，熟悉 Python 与 PyTorch，负责过文本分类项目；在某公司实习期间做过数据标注平台"
+
+
+def test_extract_skills_in_order():
+    assert extract_skills(JD) == ["大模型", "算法", "Python", "PyTorch", "LoRA", "微调", "分布式"]
+
+
+def test_jd_analysis_reply_follows_report_structure():
+    for prompt in (
+        jd_analysis_prompt_legacy.format(jd_content=JD, resume_content=RESUME),
+        "\n".join(m.content for m in jd_analysis_prompt.format_messages(context="", jd_content=JD, resume_content=RESUME)),
+    ):
+        reply = fake_reply(prompt)
+        headings = [line for line in reply.splitlines() if line.startswith("## ")]
+        assert headings == ["## 1. 岗位匹配度分析", "## 2. 推荐重点准备的项目经验", "## 3. 面试重点准备方向",
+                            "## 4. 学习资源推荐", "## 5. 差异化竞争建议"]
+        assert "技能匹配度评分：29/100" in reply  # 7 个技能中命中 Python、PyTorch
+        assert "**匹配的关键技能：** Python、PyTorch" in reply
+        assert "  - LoRA" in reply and "  - 分布式" in reply
+        assert "负责过文本分类项目" in reply
+
+
+def test_interview_plan_reply_lists_each_day():
+    prompt = task_generation_prompt.format(
+        jd_analysis_result=fake_reply(jd_analysis_prompt_legacy.format(jd_content=JD, resume_content=RESUME)),
+        days_to_interview=4, today_date="2030年01月01日 星期二", interview_date="2030年01月04日 星期五"
+    )
+    reply = fake_reply(prompt)
+    assert reply.startswith("### 🚨 面试倒计时：4 天 🚨")
+    days = [line for line in reply.splitlines() if line.startswith("#### ")]
+    assert [day.split("（")[0] for day in days] == ["#### 2030年01月01日 星期二", "#### 2030年01月02日 星期三", "#### 2030年01月03日 星期四"]
+    assert "技能差距：大模型" in reply
+
+
+def test_model_is_deterministic_and_streams_the_same_text():
+    model = FakeChatModel()
+    messages = [HumanMessage(content=jd_analysis_prompt_legacy.format(jd_content=JD, resume_content=RESUME))]
+    text = model.invoke(messages).content
+    assert model.invoke(messages).content == text
+    chunks = [chunk.content for chunk in model.stream(messages)]
+    assert len(chunks) > 10
+    assert "".join(chunks) == text
+
+
+def test_react_reply_calls_jd_analysis_then_answers():
+    prompt = "Action Input ... Final Answer\nQuestion: \n职位描述：招聘 Python 工程师\n简历内容：熟悉 Python\n"
+    first = fake_reply(prompt)
+    assert first.startswith("Thought:")
+    assert "Action: jd_analysis" in first
+    assert '"jd_content": "招聘 Python 工程师"' in first
+
+    second = fake_reply(prompt + first + "\nObservation: 分析报告\nThought:")
+    assert second.endswith("Final Answer: 分析报告")
+    assert FakeChatModel().invoke(prompt, stop=["\nAction Input"]).content.endswith("Action: jd_analysis")
+
+
+def _offline(monkeypatch, tmp_path):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.setattr(utils, "KB_PATH", str(tmp_path / "empty_kb"))
+    monkeypatch.setattr(utils, "INDEX_ROOT", str(tmp_path / "vector_store"))
+    monkeypatch.setattr(utils, "RESPONSE_CACHE_PATH", str(tmp_path / "responses.sqlite3"))
+    monkeypatch.setattr(utils, "_response_cache", None)
+
+
+def test_pipeline_runs_end_to_end_on_fake_backend(monkeypatch, tmp_path):
+    _offline(monkeypatch, tmp_path)
+    agent = agent_executor.create_job_search_agent(mode="pipeline", backend="fake")
+    result = agent.analyze_jd_and_generate_plan(JD, RESUME, "2099-01-01")
+
+    assert result["success"], result
+    assert [step.split("（")[0] for step in result["steps"]] == [
+        "步骤1: jd_analysis", "步骤2: interview_schedule", "步骤3: knowledge_base_query", "步骤4: progress_tracking"
+    ]
+    assert "## 1. 岗位匹配度分析" in result["result"]
+    assert "面试倒计时" in result["result"]
+    assert "知识库不可用：知识库为空" in result["result"]
+
+
+def test_react_agent_runs_on_fake_backend(monkeypatch, tmp_path):
+    _offline(monkeypatch, tmp_path)
+    agent = agent_executor.create_job_search_agent(mode="react", backend="fake")
+    result = agent.analyze_jd_and_generate_plan(JD, RESUME, "2099-01-01")
+
+    assert result["success"], result
+    assert result["iterations"] == 1
+    assert "岗位匹配度分析" in result["result"]
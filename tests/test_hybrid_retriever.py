@@ -0,0 +1,65 @@
+from langchain_core.documents import Document
+
+from utils import HybridRetriever, KeywordIndex
+
+DOCS = {
+    "lora": "LoRA 低秩适配：冻结原模型权重，只训练低秩矩阵",
+    "rag": "RAG-Fusion 对多路查询的检索结果做倒数排名融合",
+    "transformer": "Transformer 的自注意力机制与位置编码",
+    "cpp": "C++ 虚函数表与多态的实现原理",
+}
+
+
+class FakeDocstore:
+    def search(self, doc_id):
+        return Document(page_content=DOCS[doc_id], metadata={"chunk_id": doc_id})
+
+
+class FakeVectorStore:
+    """按预设的 L2 距离返回向量检索结果"""
+
+    def __init__(self, distances):
+        self.distances = distances
+        self.docstore = FakeDocstore()
+
+    def similarity_search_with_score(self, query, k):
+        ranked = sorted(self.distances.items(), key=lambda item: item[1])[:k]
+        return [(self.docstore.search(doc_id), distance) for doc_id, distance in ranked]
+
+
+def make_retriever(distances, **kwargs):
+    return HybridRetriever(
+        vector_store=FakeVectorStore(distances),
+        keyword_index=KeywordIndex.build(list(DOCS), list(DOCS.values())),
+        **kwargs
+    )
+
+
+def ids(documents):
+    return [doc.metadata["chunk_id"] for doc in documents]
+
+
+def test_document_found_by_both_paths_ranks_first():
+    # 向量检索最接近的是 transformer，关键词只命中 lora；两路都靠前的 lora 融合后排第一
+    retriever = make_retriever({"transformer": 0.2, "lora": 0.3, "cpp": 0.9}, k=3)
+    assert ids(retriever.invoke("LoRA 低秩")) == ["lora", "transformer", "cpp"]
+
+
+def test_keyword_only_hits_are_fetched_from_docstore():
+    retriever = make_retriever({"transformer": 0.1, "cpp": 0.5}, dense_k=2, k=3)
+    documents = retriever.invoke("RAG-Fusion")
+    assert "rag" in ids(documents)
+    assert documents[ids(documents).index("rag")].page_content == DOCS["rag"]
+
+
+def test_alpha_weights_the_two_paths():
+    distances = {"transformer": 0.1, "cpp": 0.5, "lora": 0.8}
+    assert ids(make_retriever(distances, alpha=1.0, k=1).invoke("LoRA"))[0] == "transformer"
+    assert ids(make_retriever(distances, alpha=0.0, k=1).invoke("LoRA"))[0] == "lora"
+
+
+def test_results_are_deduplicated_and_truncated_to_k():
+    retriever = make_retriever({"lora": 0.1, "rag": 0.2, "transformer": 0.3}, k=2)
+    documents = retriever.invoke("LoRA RAG-Fusion Transformer")
+    assert len(documents) == 2
+    assert len(set(ids(documents))) == 2
@@ -0,0 +1,116 @@
+import os
+
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+import utils
+
+
+def _read_text(file_path):
+    with open(file_path, "r", encoding="utf-8") as f:
+        return [Document(page_content=f.read(), metadata={"source": file_path})]
+
+
+@pytest.fixture
+def kb(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "INDEX_ROOT", str(tmp_path / "vector_store"))
+    # .md 的 Unstructured 加载器需要联网下载模型，测试中按纯文本读取
+    monkeypatch.setattr(utils, "_load_file", _read_text)
+    kb_path = tmp_path / "knowledge_base"
+    kb_path.mkdir()
+    return kb_path
+
+
+def write(kb_path, name, topic):
+    paragraphs = [f"{topic} 第 {i} 段：" + "面试题与参考答案。" * 40 for i in range(3)]
+    (kb_path / name).write_text("\n\n".join(paragraphs), encoding="utf-8")
+
+
+def latest_manifest():
+    manifests = [utils._read_manifest(os.path.join(utils.INDEX_ROOT, name)) for name in os.listdir(utils.INDEX_ROOT)]
+    return max((m for m in manifests if m), key=lambda m: m["created_at"])
+
+
+def chunk_ids(manifest):
+    return {name: record["chunk_ids"] for name, record in manifest["files"].items()}
+
+
+def stored_ids(manifest, embeddings):
+    index_dir = os.path.join(utils.INDEX_ROOT, manifest["kb_version"])
+    store = FAISS.load_local(index_dir, embeddings, allow_dangerous_deserialization=True)
+    return set(store.index_to_docstore_id.values())
+
+
+def test_only_changed_files_are_reindexed(kb, embeddings):
+    for name, topic in (("a.md", "Transformer"), ("b.md", "LoRA"), ("c.md", "RAG")):
+        write(kb, name, topic)
+    utils.load_or_build_vector_store(str(kb), embeddings)
+    first = latest_manifest()
+    before = chunk_ids(first)
+    assert set(before) == {"a.md", "b.md", "c.md"}
+    assert all(len(ids) > 1 for ids in before.values())
+
+    embeddings.documents.clear()
+    write(kb, "b.md", "QLoRA")   # 修改
+    os.remove(kb / "c.md")       # 删除
+    write(kb, "d.md", "Agent")   # 新增
+    utils.load_or_build_vector_store(str(kb), embeddings)
+    second = latest_manifest()
+    after = chunk_ids(second)
+
+    assert second["kb_version"] != first["kb_version"]
+    assert set(after) == {"a.md", "b.md", "d.md"}
+    assert after["a.md"] == before["a.md"]
+    assert not set(after["b.md"]) & set(before["b.md"])
+    # 只有修改和新增的文件重新向量化
+    assert all("QLoRA" in text or "Agent" in text for text in embeddings.documents)
+    assert len(embeddings.documents) == len(after["b.md"]) + len(after["d.md"])
+    assert stored_ids(second, embeddings) == {chunk_id for ids in after.values() for chunk_id in ids}
+
+
+def test_unchanged_knowledge_base_loads_existing_version(kb, embeddings):
+    write(kb, "a.md", "Transformer")
+    utils.load_or_build_vector_store(str(kb), embeddings)
+    first = latest_manifest()
+
+    embeddings.documents.clear()
+    utils.load_or_build_vector_store(str(kb), embeddings)
+    assert embeddings.documents == []
+    assert latest_manifest() == first
+    assert os.listdir(utils.INDEX_ROOT) == [first["kb_version"]]
+
+
+def test_version_depends_on_content_and_settings(kb):
+    write(kb, "a.md", "Transformer")
+    files = utils.scan_knowledge_base(str(kb))
+    settings = {"chunk_size": 1000, "chunk_overlap": 200}
+    version = utils.compute_kb_version(files, settings)
+
+    assert utils.compute_kb_version(utils.scan_knowledge_base(str(kb), files), settings) == version
+    assert utils.compute_kb_version(files, dict(settings, chunk_size=500)) != version
+    write(kb, "a.md", "BERT")
+    assert utils.compute_kb_version(utils.scan_knowledge_base(str(kb)), settings) != version
+
+
+def test_retriever_reloads_when_knowledge_base_changes(kb, embeddings, monkeypatch):
+    monkeypatch.setattr(utils, "KB_PATH", str(kb))
+    monkeypatch.setattr(utils, "_create_embeddings", lambda: embeddings)
+    for name in ("_retriever_cache", "_kb_version_cache", "_kb_files_cache", "_kb_settings_cache"):
+        monkeypatch.setattr(utils, name, None)
+    monkeypatch.setattr(utils, "KB_CHECK_INTERVAL", 0)
+    write(kb, "a.md", "Transformer")
+
+    first = utils.get_retriever()
+    version = utils._kb_version_cache
+    assert utils.get_retriever() is first  # 目录没有变化，不重新加载
+
+    monkeypatch.setattr(utils, "KB_CHECK_INTERVAL", 3600)
+    write(kb, "b.md", "LoRA")
+    assert utils.get_retriever() is first  # 检查间隔内不扫描目录
+
+    monkeypatch.setattr(utils, "KB_CHECK_INTERVAL", 0)
+    second = utils.get_retriever()
+    assert second is not first
+    assert utils._kb_version_cache != version
+    assert set(utils._kb_files_cache) == {"a.md", "b.md"}
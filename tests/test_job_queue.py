@@ -0,0 +1,116 @@
+import threading
+import time
+
+import pytest
+
+from job_queue import JobQueue
+
+
+@pytest.fixture
+def store(tmp_path):
+    return str(tmp_path / "jobs.sqlite3")
+
+
+def wait_for(queue: JobQueue, job_id: str, *statuses: str, timeout: float = 5.0) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"任务 {job_id} 未在 {timeout} 秒内进入 {statuses}，当前为 {queue.get(job_id)['status']}")
+
+
+def test_status_transitions_and_partial_output(store):
+    queue = JobQueue(store, max_workers=1)
+    started, release = threading.Event(), threading.Event()
+
+    def target(job):
+        job.write("第一段")
+        started.set()
+        release.wait(5)
+        return {"answer": job.stream(["，第二段"])}
+
+    first = queue.submit("jd_analysis", target, title="分析", owner="alice")
+    second = queue.submit("jd_analysis", lambda job: "done", owner="alice")
+    started.wait(5)
+
+    running = queue.get(first)
+    assert running["status"] == "running"
+    assert running["started_at"] is not None
+    assert running["output"] == "第一段"
+    assert queue.get(second)["status"] == "queued"  # 唯一的工作线程被占用
+    assert queue.stats() == {"running": 1, "queued": 1}
+
+    release.set()
+    finished = wait_for(queue, first, "succeeded", "failed")
+    assert finished["status"] == "succeeded"
+    assert finished["output"] == "第一段，第二段"
+    assert finished["result"] == {"answer": "第一段，第二段"}
+    assert finished["error"] is None
+    assert finished["trace"]["name"] == "jd_analysis"
+    assert wait_for(queue, second, "succeeded")["result"] == "done"
+    assert queue.stats() == {"running": 0, "queued": 0}
+
+
+def test_failed_job_keeps_partial_output_and_user_error(store):
+    queue = JobQueue(store, max_workers=1)
+
+    def target(job):
+        job.write("部分结果")
+        raise RuntimeError("HTTP 500")
+
+    job_id = queue.submit("agent_pipeline", target, error_message=lambda e: f"执行失败：{e}")
+    job = wait_for(queue, job_id, "succeeded", "failed")
+    assert job["status"] == "failed"
+    assert job["error"] == "执行失败：HTTP 500"
+    assert job["output"] == "部分结果"
+    assert job["result"] is None
+
+
+def test_finished_jobs_survive_restart(store):
+    queue = JobQueue(store, max_workers=1)
+    job_id = queue.submit("interview_schedule", lambda job: job.stream(["计划"]), title="冲刺计划", owner="alice")
+    wait_for(queue, job_id, "succeeded")
+
+    reopened = JobQueue(store, max_workers=1)
+    job = reopened.get(job_id)
+    assert job["status"] == "succeeded"
+    assert job["output"] == "计划"
+    assert job["result"] == "计划"
+    assert reopened.get("missing") is None
+
+
+def test_restart_marks_unfinished_jobs_failed(store):
+    queue = JobQueue(store, max_workers=1)
+    started, release = threading.Event(), threading.Event()
+
+    def target(job):
+        started.set()
+        release.wait(5)
+
+    running = queue.submit("jd_analysis", target)
+    queued = queue.submit("jd_analysis", lambda job: None)
+    started.wait(5)
+
+    try:
+        reopened = JobQueue(store, max_workers=1)
+        for job_id in (running, queued):
+            job = reopened.get(job_id)
+            assert job["status"] == "failed"
+            assert "服务已重启" in job["error"]
+    finally:
+        release.set()
+        wait_for(queue, queued, "succeeded")
+
+
+def test_list_jobs_filters_by_owner_newest_first(store):
+    queue = JobQueue(store, max_workers=2)
+    ids = []
+    for owner in ("alice", "bob", "alice"):
+        ids.append(queue.submit("jd_analysis", lambda job: None, title=owner, owner=owner))
+        wait_for(queue, ids[-1], "succeeded")
+
+    assert [job["id"] for job in queue.list_jobs(owner="alice")] == [ids[2], ids[0]]
+    assert [job["id"] for job in queue.list_jobs()] == ids[::-1]
+    assert [job["id"] for job in queue.list_jobs(limit=1)] == [ids[2]]
@@ -0,0 +1,53 @@
+from utils import KeywordIndex, tokenize_for_search
+
+
+def test_tokenize_mixed_chinese_and_english():
+    assert tokenize_for_search("熟悉C++、RAG-Fusion 和 Node.js，精通Python3 大模型") == [
+        "熟悉", "c++", "rag-fusion", "rag", "fusion", "和", "node.js", "node", "js", "精通", "python3", "大模", "模型"
+    ]
+
+
+def test_tokenize_keeps_symbols_in_terms():
+    assert tokenize_for_search("C# / c++ / C") == ["c#", "c++", "c"]
+    assert tokenize_for_search("，。！") == []
+
+
+def build_index():
+    docs = {
+        "pytorch": "大模型训练：熟悉 PyTorch 分布式训练，有 PyTorch 调优经验",
+        "python": "后端开发：熟悉 Python 和 Django，了解 PyTorch",
+        "java": "Java 后端开发，熟悉 Spring 和 MySQL",
+        "frontend": "前端开发：熟悉 React 和 TypeScript",
+    }
+    return KeywordIndex.build(list(docs), list(docs.values()))
+
+
+def test_search_ranks_by_bm25():
+    index = build_index()
+    results = index.search("PyTorch 训练", k=4)
+    assert [doc_id for doc_id, _ in results] == ["pytorch", "python"]
+    assert results[0][1] > results[1][1] > 0
+
+
+def test_rare_terms_outweigh_common_terms():
+    index = build_index()
+    # “熟悉”出现在所有文档里，idf 很低；“spring”只出现在一篇里
+    results = index.search("熟悉 Spring", k=4)
+    assert results[0][0] == "java"
+    assert results[0][1] > 2 * results[1][1]
+
+
+def test_search_only_returns_matching_documents():
+    index = build_index()
+    assert [doc_id for doc_id, _ in index.search("React", k=10)] == ["frontend"]
+    assert index.search("golang", k=10) == []
+    assert len(index.search("开发", k=2)) == 2
+
+
+def test_save_and_load_round_trip(tmp_path):
+    index = build_index()
+    index.save(str(tmp_path))
+    loaded = KeywordIndex.load(str(tmp_path))
+    assert loaded.doc_ids == index.doc_ids
+    assert loaded.search("PyTorch 训练", k=4) == index.search("PyTorch 训练", k=4)
+    assert KeywordIndex.load(str(tmp_path / "missing")) is None
@@ -0,0 +1,60 @@
+import numpy as np
+
+import utils
+from utils import HashedNgramEmbeddings
+
+
+def cosine(a, b):
+    return float(np.dot(a, b))  # 向量已 L2 归一化
+
+
+def test_dimension_and_normalization():
+    embeddings = HashedNgramEmbeddings(dim=256)
+    vectors = np.array(embeddings.embed_documents(["大模型微调", "LoRA fine-tuning", "x"]))
+    assert vectors.shape == (3, 256)
+    np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1.0, rtol=1e-5)
+    assert len(embeddings.embed_query("大模型微调")) == 256
+    assert embeddings.model_name == "local-hashed-ngram-13-256"
+
+
+def test_deterministic_across_instances_and_batches():
+    texts = [f"第 {i} 个文档：RAG 检索增强生成" for i in range(7)]
+    one = HashedNgramEmbeddings(dim=128, batch_size=2).embed_documents(texts)
+    other = HashedNgramEmbeddings(dim=128, batch_size=512).embed_documents(texts)
+    np.testing.assert_array_equal(one, other)
+    np.testing.assert_array_equal(one[3], HashedNgramEmbeddings(dim=128).embed_query(texts[3]))
+
+
+def test_whitespace_and_case_are_normalized():
+    embeddings = HashedNgramEmbeddings(dim=128)
+    np.testing.assert_array_equal(
+        embeddings.embed_query("Python  工程师\n"),
+        embeddings.embed_query("python 工程师")
+    )
+
+
+def test_similar_texts_are_closer():
+    embeddings = HashedNgramEmbeddings()
+    query, near, far = embeddings.embed_documents([
+        "大模型参数高效微调 LoRA 的原理",
+        "LoRA 是一种大模型参数高效微调方法",
+        "操作系统的进程调度算法",
+    ])
+    assert cosine(query, near) > cosine(query, far) + 0.2
+
+
+def test_empty_text_is_zero_vector():
+    vector = HashedNgramEmbeddings(dim=64).embed_query("")
+    assert vector == [0.0] * 64
+
+
+def test_local_backend_needs_no_api_key(monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.setattr(utils, "EMBEDDING_BACKEND", "auto")
+    assert utils.resolve_embedding_backend() == "local"
+    assert isinstance(utils._create_embeddings(), HashedNgramEmbeddings)
+
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    assert utils.resolve_embedding_backend() == "openai"
+    monkeypatch.setattr(utils, "EMBEDDING_BACKEND", "local")
+    assert utils.resolve_embedding_backend() == "local"
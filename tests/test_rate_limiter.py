@@ -0,0 +1,66 @@
+import pytest
+
+import rate_limiter
+from rate_limiter import RateLimiter, request_tokens
+
+
+@pytest.fixture(autouse=True)
+def fake_time(monkeypatch, clock):
+    monkeypatch.setattr(rate_limiter, "time", clock)
+    return clock
+
+
+def test_full_bucket_does_not_wait(clock):
+    limiter = RateLimiter(rpm=60, tpm=6000)
+    for _ in range(60):
+        assert limiter.acquire(100) == 0.0
+    assert clock.sleeps == []
+
+
+def test_waits_for_request_bucket_to_refill(clock):
+    limiter = RateLimiter(rpm=60)  # 每秒补充 1 次请求额度
+    for _ in range(60):
+        limiter.acquire()
+    assert limiter.acquire() == pytest.approx(1.0)
+
+    clock.advance(5)
+    for _ in range(5):
+        assert limiter.acquire() == 0.0
+    assert limiter.acquire() == pytest.approx(1.0)
+
+
+def test_waits_for_token_bucket_to_refill(clock):
+    limiter = RateLimiter(tpm=600)  # 每秒补充 10 个 token
+    assert limiter.acquire(600) == 0.0
+    assert limiter.acquire(50) == pytest.approx(5.0)
+
+
+def test_refill_is_capped_at_bucket_size(clock):
+    limiter = RateLimiter(rpm=10)
+    clock.advance(3600)
+    for _ in range(10):
+        assert limiter.acquire() == 0.0
+    assert limiter.acquire() == pytest.approx(6.0)
+
+
+def test_oversized_request_is_clamped_to_bucket(clock):
+    limiter = RateLimiter(tpm=100)
+    assert limiter.acquire(10_000) == 0.0  # 超过整桶时按整桶计，不会永远等待
+    assert limiter.acquire(100) == pytest.approx(60.0)
+
+
+def test_unlimited_dimensions_never_wait(clock):
+    limiter = RateLimiter(rpm=None, tpm=0)
+    for _ in range(1000):
+        assert limiter.acquire(10_000) == 0.0
+
+
+def test_request_tokens_reserve_prompt_and_max_tokens(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "estimate_tokens", len)
+    chat = {
+        "messages": [{"role": "system", "content": "你是助手"}, {"role": "user", "content": [{"type": "text", "text": "分析JD"}]}],
+        "max_tokens": 4096,
+    }
+    assert request_tokens(chat) == 4 + 4 + 4096
+    assert request_tokens({"input": ["LoRA", "RAG"]}) == 7
+    assert request_tokens({"input": [[1, 2, 3], [4, 5]]}) == 5  # OpenAIEmbeddings 发送的 token id
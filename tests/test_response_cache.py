@@ -0,0 +1,73 @@
+import pytest
+
+import utils
+from utils import ResponseCache
+
+
+@pytest.fixture
+def make_cache(tmp_path, monkeypatch, clock):
+    monkeypatch.setattr(utils, "time", clock)
+
+    def make(ttl: int = 3600, max_entries: int = 100) -> ResponseCache:
+        return ResponseCache(str(tmp_path / "responses.sqlite3"), ttl=ttl, max_entries=max_entries)
+    return make
+
+
+def test_hit_and_miss_are_counted(make_cache):
+    cache = make_cache()
+    assert cache.get("a") is None
+    cache.put("a", "answer")
+    assert cache.get("a") == "answer"
+    assert cache.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+
+def test_entries_expire_after_ttl(make_cache, clock):
+    cache = make_cache(ttl=60)
+    cache.put("a", "answer")
+    clock.advance(60)
+    assert cache.get("a") == "answer"
+
+    clock.advance(1)
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0  # 过期条目在读取时删除
+
+
+def test_ttl_counts_from_write_not_last_access(make_cache, clock):
+    cache = make_cache(ttl=60)
+    cache.put("a", "answer")
+    for _ in range(3):
+        clock.advance(30)
+        cache.get("a")
+    assert cache.get("a") is None
+
+
+def test_evicts_least_recently_used(make_cache, clock):
+    cache = make_cache(max_entries=3)
+    for key in ("a", "b", "c"):
+        cache.put(key, key)
+        clock.advance(1)
+
+    assert cache.get("a") == "a"  # a 最近被访问，b 成为最久未访问的条目
+    clock.advance(1)
+    cache.put("d", "d")
+
+    assert cache.stats()["size"] == 3
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in ("a", "c", "d")] == ["a", "c", "d"]
+
+
+def test_put_overwrites_and_refreshes_entry(make_cache, clock):
+    cache = make_cache(ttl=60, max_entries=2)
+    cache.put("a", "old")
+    clock.advance(50)
+    cache.put("b", "b")
+    cache.put("a", "new")
+    clock.advance(50)
+
+    assert cache.get("a") == "new"
+    assert cache.get("b") == "b"
+
+
+def test_entries_persist_across_instances(make_cache):
+    make_cache().put("a", "answer")
+    assert make_cache().get("a") == "answer"
@@ -0,0 +1,208 @@
+import pytest
+
+import retry_policy
+from retry_policy import CircuitBreaker, CircuitOpenError, RetryPolicy, RetryingResource
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, headers: dict = None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeAPIError(Exception):
+    def __init__(self, status_code: int, headers: dict = None):
+        super().__init__(f"HTTP {status_code}")
+        self.response = FakeResponse(status_code, headers)
+
+
+@pytest.fixture(autouse=True)
+def fake_time(monkeypatch, clock):
+    monkeypatch.setattr(retry_policy, "time", clock)
+    return clock
+
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=30)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.retry_in() == pytest.approx(30)
+
+
+def test_breaker_half_open_admits_single_probe(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10)
+    breaker.record_failure()
+    clock.advance(10)
+    assert breaker.state == "half-open"
+
+    assert breaker.allow()
+    assert not breaker.allow()  # 试探请求未返回前不再放行
+    assert breaker.state == "open"
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_breaker_reopens_when_probe_fails(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10)
+    breaker.record_failure()
+    clock.advance(10)
+    assert breaker.allow()
+
+    breaker.record_failure(retry_after=60)
+    assert breaker.state == "open"
+    assert breaker.retry_in() == pytest.approx(60)  # 服务端要求的等待更长时按服务端的来
+
+
+
+def test_interrupted_probe_is_released(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10)
+    policy = RetryPolicy("chat", breaker=breaker)
+    breaker.record_failure()
+    clock.advance(10)
+
+    def interrupted():
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        policy.call(interrupted)
+    # 试探请求没有结果，熔断器仍为半开，下一个请求可以继续试探
+    assert breaker.state == "half-open"
+    assert policy.call(lambda: "ok") == "ok"
+    assert breaker.state == "closed"
+
+def test_backoff_is_capped_and_honours_retry_after(monkeypatch):
+    monkeypatch.setattr(retry_policy.random, "uniform", lambda low, high: high)
+    policy = RetryPolicy("chat", base_delay=1.0, max_delay=5.0, breaker=CircuitBreaker())
+    assert [policy.backoff(attempt) for attempt in (1, 2, 3, 4)] == [1.0, 2.0, 4.0, 5.0]
+    assert policy.backoff(1, retry_after=12.0) == 12.0
+
+    monkeypatch.setattr(retry_policy.random, "uniform", lambda low, high: low)
+    assert policy.backoff(3) == 0.0
+    assert policy.backoff(3, retry_after=2.5) == 2.5
+
+
+def test_call_retries_transient_errors_until_success(clock):
+    policy = RetryPolicy("chat", max_attempts=4, base_delay=1.0, breaker=CircuitBreaker(failure_threshold=10))
+    calls = []
+
+    def flaky():
+        calls.append(clock.now)
+        if len(calls) < 3:
+            raise FakeAPIError(429, {"retry-after": "2"})
+        return "ok"
+
+    assert policy.call(flaky) == "ok"
+    assert len(calls) == 3
+    assert len(clock.sleeps) == 2
+    assert all(delay >= 2 for delay in clock.sleeps)
+    assert policy.breaker.failures == 0
+
+
+
+def test_every_attempt_acquires_rate_limit(monkeypatch, clock):
+    monkeypatch.setattr(retry_policy, "request_tokens", lambda request: len(request["messages"][0]["content"]) + request["max_tokens"])
+
+    class RecordingLimiter:
+        def __init__(self):
+            self.acquired = []
+
+        def acquire(self, tokens=0):
+            self.acquired.append(tokens)
+            return 0.0
+
+    class FlakyCompletions:
+        def __init__(self):
+            self.calls = 0
+
+        def create(self, **kwargs):
+            self.calls += 1
+            if self.calls < 3:
+                raise FakeAPIError(429)
+            return "ok"
+
+    limiter = RecordingLimiter()
+    resource = RetryingResource(
+        FlakyCompletions(), RetryPolicy("chat", base_delay=0.1, breaker=CircuitBreaker(failure_threshold=10)), limiter=limiter
+    )
+    assert resource.create(messages=[{"role": "user", "content": "分析JD"}], max_tokens=100) == "ok"
+    # 退避重试同样占用额度，每次都按输入加 max_tokens 预占
+    assert limiter.acquired == [104, 104, 104]
+
+def test_call_gives_up_after_max_attempts(clock):
+    policy = RetryPolicy("chat", max_attempts=3, base_delay=0.1, breaker=CircuitBreaker(failure_threshold=10))
+    calls = []
+
+    def down():
+        calls.append(1)
+        raise FakeAPIError(503)
+
+    with pytest.raises(FakeAPIError):
+        policy.call(down)
+    assert len(calls) == 3
+
+
+def test_call_does_not_retry_client_errors(clock):
+    breaker = CircuitBreaker(failure_threshold=1)
+    policy = RetryPolicy("chat", max_attempts=4, breaker=breaker)
+    calls = []
+
+    def bad_request():
+        calls.append(1)
+        raise FakeAPIError(400)
+
+    with pytest.raises(FakeAPIError):
+        policy.call(bad_request)
+    assert len(calls) == 1
+    assert breaker.state == "closed"
+
+
+def test_call_fails_fast_while_circuit_is_open(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30)
+    policy = RetryPolicy("chat", max_attempts=5, base_delay=0.1, breaker=breaker)
+    calls = []
+
+    def down():
+        calls.append(1)
+        raise FakeAPIError(500)
+
+    with pytest.raises(CircuitOpenError):
+        policy.call(down)
+    assert len(calls) == 2  # 第二次失败后熔断，不再发出第三次请求
+
+    with pytest.raises(CircuitOpenError):
+        policy.call(down)
+    assert len(calls) == 2
+
+
+def test_deadline_stops_retrying(clock):
+    policy = RetryPolicy("chat", max_attempts=10, base_delay=1.0, deadline=5.0, breaker=CircuitBreaker(failure_threshold=10))
+    calls = []
+
+    def slow_down():
+        calls.append(1)
+        raise FakeAPIError(429, {"retry-after": "10"})
+
+    with pytest.raises(FakeAPIError):
+        policy.call(slow_down)
+    assert len(calls) == 1
+    assert clock.sleeps == []
+
+
+def test_transient_error_classification():
+    assert retry_policy.is_transient_error(FakeAPIError(429))
+    assert retry_policy.is_transient_error(FakeAPIError(502))
+    assert not retry_policy.is_transient_error(FakeAPIError(401))
+    assert not retry_policy.is_transient_error(ValueError("bad input"))
+
+    wrapped = RuntimeError("chain failed")
+    wrapped.__cause__ = FakeAPIError(429)
+    assert retry_policy.is_rate_limit_error(wrapped)
+    assert retry_policy.retry_after_seconds(FakeAPIError(429, {"retry-after-ms": "1500"})) == 1.5
@@ -0,0 +1,134 @@
+import json
+import threading
+import contextvars
+from uuid import uuid4
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+import tracing
+from tracing import TracingCallbackHandler, current_trace, llm_cost, render_metrics, span, trace
+
+
+@pytest.fixture(autouse=True)
+def fresh_metrics(monkeypatch):
+    monkeypatch.setattr(tracing, "_stage_totals", {})
+    monkeypatch.setattr(tracing, "_token_totals", {})
+    monkeypatch.setattr(tracing, "_request_totals", {})
+    monkeypatch.setattr(tracing, "_cost_total", 0.0)
+
+
+def test_spans_nest_under_the_request_trace():
+    with trace("jd_analysis", job_id="42") as request_trace:
+        with span("retrieve", k=4) as retrieve:
+            retrieve["chunk_ids"] = ["a", "b"]
+            with span("retrieve.embed"):
+                pass
+        with span("llm", model="moonshot-v1-8k", prompt_tokens=1000, completion_tokens=500, cost=0.018):
+            pass
+
+    assert current_trace() is None
+    spans = {record["name"]: record for record in request_trace.spans}
+    assert spans["retrieve.embed"]["parent"] == "retrieve"
+    assert spans["retrieve"]["parent"] is None
+    assert spans["retrieve"]["chunk_ids"] == ["a", "b"]
+    assert spans["retrieve"]["duration"] >= spans["retrieve.embed"]["duration"]
+    # 子 span 先结束，先记入追踪
+    assert [record["name"] for record in request_trace.spans] == ["retrieve.embed", "retrieve", "llm"]
+
+    summary = request_trace.summary()
+    assert summary["name"] == "jd_analysis"
+    assert set(summary["stages"]) == {"retrieve", "retrieve.embed", "llm"}
+    assert summary["prompt_tokens"] == 1000
+    assert summary["completion_tokens"] == 500
+    assert summary["cost"] == pytest.approx(0.018)
+    assert request_trace.to_record()["job_id"] == "42"
+
+
+def test_nested_trace_reuses_outer_trace():
+    with trace("agent_pipeline") as outer:
+        with trace("jd_analysis") as inner:
+            with span("llm"):
+                pass
+    assert inner is outer
+    assert [record["name"] for record in outer.spans] == ["llm"]
+
+
+def test_spans_from_copied_context_join_the_same_trace():
+    with trace("agent_pipeline") as request_trace:
+        with span("fan_out"):
+            def work():
+                with span("tool.x"):
+                    pass
+            worker = threading.Thread(target=contextvars.copy_context().run, args=(work,))
+            worker.start()
+            worker.join()
+    spans = {record["name"]: record for record in request_trace.spans}
+    assert spans["tool.x"]["parent"] == "fan_out"
+
+
+def test_errors_are_recorded():
+    with pytest.raises(RuntimeError):
+        with trace("jd_analysis") as request_trace:
+            with span("llm"):
+                raise RuntimeError("boom")
+    assert request_trace.error == "RuntimeError: boom"
+    assert request_trace.spans[0]["error"] == "RuntimeError: boom"
+    assert 'jobsearch_request_errors_total{request="jd_analysis"} 1' in render_metrics()
+
+
+def test_render_metrics_accumulates_stages_tokens_and_cost():
+    for _ in range(2):
+        with trace("jd_analysis"):
+            with span("retrieve"):
+                pass
+            with span("llm", model="moonshot-v1-8k", prompt_tokens=1000, completion_tokens=500,
+                      cost=llm_cost("moonshot-v1-8k", 1000, 500)):
+                pass
+    with span("ingest.embed"):  # 请求之外的 span 单独记为一条追踪
+        pass
+
+    lines = render_metrics().splitlines()
+    assert 'jobsearch_stage_seconds_count{stage="retrieve"} 2' in lines
+    assert 'jobsearch_stage_seconds_count{stage="llm"} 2' in lines
+    assert 'jobsearch_stage_seconds_count{stage="ingest.embed"} 1' in lines
+    assert 'jobsearch_requests_total{request="jd_analysis"} 2' in lines
+    assert 'jobsearch_requests_total{request="ingest.embed"} 1' in lines
+    assert 'jobsearch_request_errors_total{request="jd_analysis"} 0' in lines
+    assert 'jobsearch_llm_tokens_total{model="moonshot-v1-8k",type="prompt"} 2000' in lines
+    assert 'jobsearch_llm_tokens_total{model="moonshot-v1-8k",type="completion"} 1000' in lines
+    assert "jobsearch_llm_cost_yuan_total 0.036000" in lines
+    assert "# TYPE jobsearch_stage_seconds summary" in lines
+
+
+def test_trace_file_and_metrics_file_are_written(tmp_path, monkeypatch):
+    monkeypatch.setattr(tracing, "TRACING_ENABLED", True)
+    monkeypatch.setattr(tracing, "TRACE_LOG_PATH", str(tmp_path / "traces.jsonl"))
+    monkeypatch.chdir(tmp_path)  # METRICS_PATH 默认是相对路径
+    with trace("jd_analysis"):
+        with span("llm"):
+            pass
+
+    record = json.loads((tmp_path / "traces.jsonl").read_text(encoding="utf-8"))
+    assert record["name"] == "jd_analysis"
+    assert [item["name"] for item in record["spans"]] == ["llm"]
+    assert 'jobsearch_requests_total{request="jd_analysis"} 1' in (tmp_path / "metrics.prom").read_text(encoding="utf-8")
+
+
+def test_callback_handler_records_llm_span_with_estimated_tokens():
+    handler = TracingCallbackHandler()
+    run_id = uuid4()
+    with trace("jd_analysis") as request_trace:
+        handler.on_chat_model_start({}, [[HumanMessage(content="你好")]], run_id=run_id,
+                                    invocation_params={"model_name": "moonshot-v1-8k"})
+        handler.on_llm_new_token("你", run_id=run_id)
+        handler.on_llm_end(LLMResult(generations=[[ChatGeneration(message=AIMessage(content="你好呀"))]]), run_id=run_id)
+
+    record = request_trace.spans[0]
+    assert record["name"] == "llm"
+    assert record["model"] == "moonshot-v1-8k"
+    assert record["tokens_estimated"] is True
+    assert record["prompt_tokens"] > 0 and record["completion_tokens"] > 0
+    assert "first_token_seconds" in record
+    assert record["cost"] == pytest.approx(llm_cost("moonshot-v1-8k", record["prompt_tokens"], record["completion_tokens"]))
@@ -0,0 +1,326 @@
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import LLMResult
+from rate_limiter import estimate_tokens
+
+# 每个请求一行 JSON 的追踪日志，以及 Prometheus 文本格式的指标文件（可由 node_exporter textfile collector 采集）
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "1") != "0"
+TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH", "traces.jsonl")
+METRICS_PATH = os.getenv("METRICS_PATH", "metrics.prom")
+METRICS_PREFIX = "jobsearch"
+
+# 各模型每 1K token 的价格（元），(输入, 输出)
+MODEL_PRICES = {
+    "moonshot-v1-8k": (0.012, 0.012),
+    "moonshot-v1-32k": (0.024, 0.024),
+    "moonshot-v1-128k": (0.06, 0.06),
+}
+
+_current_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("current_trace", default=None)
+_current_span: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_span", default=None)
+_write_lock = threading.Lock()
+
+# 进程内累计指标：阶段 -> [次数, 总耗时]，(模型, prompt/completion) -> token 数，请求名 -> [次数, 失败次数]
+_stage_totals: Dict[str, List[float]] = {}
+_token_totals: Dict[tuple, int] = {}
+_cost_total = 0.0
+_request_totals: Dict[str, List[int]] = {}
+_metrics_lock = threading.Lock()
+
+
+def llm_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """按 MODEL_PRICES 估算一次调用的费用（元），未知模型计为 0"""
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+
+class Trace:
+    """
+    一次用户请求（JD 分析、冲刺计划、Agent 运行）的追踪记录
+
+    各阶段以 span 的形式追加进来：名称、父 span、开始时间、耗时及 token、文档块 ID 等属性。
+    多个线程可以同时向同一个 Trace 追加 span。
+    """
+
+    def __init__(self, name: str, **attrs: Any):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.time()
+        self.duration = None
+        self.error = None
+        self.spans: List[dict] = []
+        self._lock = threading.Lock()
+
+    def add_span(self, span: dict) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def summary(self) -> dict:
+        """按阶段汇总的耗时、token 和费用，供侧边栏展示"""
+        stages = {}
+        prompt_tokens = completion_tokens = 0
+        cost = 0.0
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            stage = stages.setdefault(span["name"], {"count": 0, "seconds": 0.0})
+            stage["count"] += 1
+            stage["seconds"] += span["duration"]
+            prompt_tokens += span.get("prompt_tokens", 0)
+            completion_tokens += span.get("completion_tokens", 0)
+            cost += span.get("cost", 0.0)
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "duration": self.duration,
+            "error": self.error,
+            "stages": stages,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cost": cost,
+        }
+
+    def to_record(self) -> dict:
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration": self.duration,
+            "error": self.error,
+            **self.attrs,
+            "spans": spans,
+        }
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def trace(name: str, **attrs: Any) -> Iterator[Trace]:
+    """
+    开始一次请求追踪；结束时把整条记录追加到 TRACE_LOG_PATH 并刷新 METRICS_PATH
+
+    嵌套调用时复用外层的 Trace，不会重复记录。
+    """
+    outer = _current_trace.get()
+    if outer is not None:
+        yield outer
+        return
+
+    request_trace = Trace(name, **attrs)
+    token = _current_trace.set(request_trace)
+    start = time.perf_counter()
+    try:
+        yield request_trace
+    except BaseException as e:
+        request_trace.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        request_trace.duration = time.perf_counter() - start
+        _current_trace.reset(token)
+        _finish(request_trace)
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[dict]:
+    """
+    记录一个阶段的耗时；产出的 dict 即该 span 的属性，可在阶段内补充 token 数、文档块 ID 等
+
+    不在任何请求追踪内时，该 span 单独记为一条追踪（例如启动时的知识库构建）。
+    """
+    record = {"name": name, "parent": _current_span.get(), "started_at": time.time(), **attrs}
+    token = _current_span.set(name)
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record["duration"] = time.perf_counter() - start
+        _current_span.reset(token)
+        record_span(record)
+
+
+def record_span(record: dict) -> None:
+    """把已完成的 span 记入当前请求追踪（没有时单独记为一条追踪）"""
+    request_trace = _current_trace.get()
+    if request_trace is not None:
+        request_trace.add_span(record)
+        return
+    standalone = Trace(record["name"])
+    standalone.started_at = record["started_at"]
+    standalone.duration = record["duration"]
+    standalone.error = record.get("error")
+    standalone.add_span(record)
+    _finish(standalone)
+
+
+def _finish(request_trace: Trace) -> None:
+    global _cost_total
+
+    with _metrics_lock:
+        totals = _request_totals.setdefault(request_trace.name, [0, 0])
+        totals[0] += 1
+        totals[1] += request_trace.error is not None
+        for record in request_trace.spans:
+            stage = _stage_totals.setdefault(record["name"], [0, 0.0])
+            stage[0] += 1
+            stage[1] += record["duration"]
+            model = record.get("model")
+            if model:
+                for kind in ("prompt", "completion"):
+                    key = (model, kind)
+                    _token_totals[key] = _token_totals.get(key, 0) + record.get(f"{kind}_tokens", 0)
+                _cost_total += record.get("cost", 0.0)
+
+    if not TRACING_ENABLED:
+        return
+    try:
+        with _write_lock:
+            with open(TRACE_LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps(request_trace.to_record(), ensure_ascii=False) + "\n")
+            write_metrics()
+    except OSError as e:
+        print(f"⚠️ 追踪记录写入失败: {e}")
+
+
+def render_metrics() -> str:
+    """以 Prometheus 文本格式输出进程内累计的指标"""
+    lines = [
+        f"# HELP {METRICS_PREFIX}_stage_seconds 各阶段耗时（秒）",
+        f"# TYPE {METRICS_PREFIX}_stage_seconds summary",
+    ]
+    with _metrics_lock:
+        for stage, (count, seconds) in sorted(_stage_totals.items()):
+            lines.append(f'{METRICS_PREFIX}_stage_seconds_count{{stage="{stage}"}} {count}')
+            lines.append(f'{METRICS_PREFIX}_stage_seconds_sum{{stage="{stage}"}} {seconds:.6f}')
+        lines += [
+            f"# HELP {METRICS_PREFIX}_requests_total 请求次数",
+            f"# TYPE {METRICS_PREFIX}_requests_total counter",
+        ]
+        for name, (count, _) in sorted(_request_totals.items()):
+            lines.append(f'{METRICS_PREFIX}_requests_total{{request="{name}"}} {count}')
+        lines += [
+            f"# HELP {METRICS_PREFIX}_request_errors_total 失败的请求次数",
+            f"# TYPE {METRICS_PREFIX}_request_errors_total counter",
+        ]
+        for name, (_, errors) in sorted(_request_totals.items()):
+            lines.append(f'{METRICS_PREFIX}_request_errors_total{{request="{name}"}} {errors}')
+        lines += [
+            f"# HELP {METRICS_PREFIX}_llm_tokens_total 模型调用的 token 数",
+            f"# TYPE {METRICS_PREFIX}_llm_tokens_total counter",
+        ]
+        for (model, kind), count in sorted(_token_totals.items()):
+            lines.append(f'{METRICS_PREFIX}_llm_tokens_total{{model="{model}",type="{kind}"}} {count}')
+        lines += [
+            f"# HELP {METRICS_PREFIX}_llm_cost_yuan_total 按 MODEL_PRICES 估算的模型调用费用（元）",
+            f"# TYPE {METRICS_PREFIX}_llm_cost_yuan_total counter",
+            f"{METRICS_PREFIX}_llm_cost_yuan_total {_cost_total:.6f}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path: str = METRICS_PATH) -> None:
+    """先写临时文件再原子替换，采集方不会读到写了一半的文件"""
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(render_metrics())
+    os.replace(tmp_path, path)
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    把每次模型调用记为一个 llm span：耗时、首 token 延迟、prompt / completion token 数和估算费用
+
+    流式调用拿不到服务端的 token 用量，改用 estimate_tokens 估算并标记 tokens_estimated。
+    llm=False, tools=True 时只记录工具调用，用于 ReAct Agent（其工具调用不经过 JobSearchAgent._call_tool，
+    模型调用已由 ChatOpenAI 自带的回调记录）。
+    """
+
+    def __init__(self, llm: bool = True, tools: bool = False):
+        self.llm = llm
+        self.tools = tools
+        self._runs: Dict[UUID, dict] = {}
+
+    def _start(self, run_id: UUID, record: dict) -> None:
+        record.update(parent=_current_span.get(), started_at=time.time(), _start=time.perf_counter())
+        self._runs[run_id] = record
+
+    def _end(self, run_id: UUID, **attrs: Any) -> None:
+        record = self._runs.pop(run_id, None)
+        if record is None:
+            return
+        record["duration"] = time.perf_counter() - record.pop("_start")
+        record.pop("_first_token", None)
+        record.update(attrs)
+        record_span(record)
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[BaseMessage]], *, run_id: UUID, **kwargs: Any) -> None:
+        if not self.llm:
+            return
+        params = kwargs.get("invocation_params") or {}
+        self._start(run_id, {
+            "name": "llm",
+            "model": params.get("model_name") or params.get("model", ""),
+            "prompt_tokens": sum(
+                estimate_tokens(message.content) for batch in messages for message in batch
+                if isinstance(message.content, str)
+            ),
+        })
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        record = self._runs.get(run_id)
+        if record is not None and "_first_token" not in record:
+            record["_first_token"] = True
+            record["first_token_seconds"] = time.perf_counter() - record["_start"]
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        record = self._runs.get(run_id)
+        if record is None:
+            return
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if usage.get("prompt_tokens"):
+            prompt_tokens, completion_tokens = usage["prompt_tokens"], usage.get("completion_tokens", 0)
+            estimated = False
+        else:
+            prompt_tokens = record["prompt_tokens"]
+            completion_tokens = sum(
+                estimate_tokens(generation.text) for generations in response.generations for generation in generations
+            )
+            estimated = True
+        self._end(
+            run_id,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            tokens_estimated=estimated,
+            cost=llm_cost(record["model"], prompt_tokens, completion_tokens),
+        )
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, error=f"{type(error).__name__}: {error}", completion_tokens=0, cost=0.0)
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, **kwargs: Any) -> None:
+        if self.tools:
+            self._start(run_id, {"name": f"tool.{serialized.get('name', 'unknown')}"})
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        if self.tools:
+            self._end(run_id)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        if self.tools:
+            self._end(run_id, error=f"{type(error).__name__}: {error}")
@@ -1,225 +1,1750 @@
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain.prompts import PromptTemplate
-from typing import Optional, List
+from langchain_core.prompts import PromptTemplate, ChatPromptTemplate
+from typing import Any, Optional, List, Iterator, TYPE_CHECKING
 import os
+import re
+import json
+import math
+import time
+import shutil
+import pickle
+import hashlib
+import threading
+import multiprocessing
+import sqlite3
+import unicodedata
+from collections import OrderedDict, Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import date
-from langchain_community.document_loaders import PyPDFLoader, UnstructuredMarkdownLoader
 from langchain_core.documents import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain.chains import create_retrieval_chain
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+# 重量级依赖（文档加载器、FAISS、分割器、检索链、OpenAI 客户端、numpy、tiktoken）只在用到的函数里导入，
+# 避免拖慢 app.py 的首次渲染；这里仅用于类型标注
+if TYPE_CHECKING:
+    import httpx
+    import numpy as np
+    from langchain_openai import ChatOpenAI
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_community.vectorstores import FAISS
 # --- 导入新的 prompt ---
 from prompts import jd_analysis_prompt, jd_analysis_prompt_legacy
+from rate_limiter import get_rate_limiter, estimate_tokens
+from retry_policy import RetryingResource, get_retry_policy, is_rate_limit_error, is_transient_error
+from tracing import TracingCallbackHandler, span, trace
+from fake_llm import FAKE_CHAT_MODEL, FakeChatModel
 
 # === 全局RAG链缓存 ===
-_rag_chain_cache = None
+_rag_chain_cache = OrderedDict()  # (prompt 哈希, 温度, 模型) -> RAG 链
 _retriever_cache = None
+_kb_version_cache = None
+_kb_files_cache = None     # 已加载版本对应的知识库文件记录，检查目录变化时复用其中的哈希
+_kb_settings_cache = None  # 已加载版本的索引参数
+_kb_checked_at = 0.0       # 上次检查知识库目录的时间（time.monotonic）
+_rag_chain_lock = threading.RLock()
+RAG_CHAIN_CACHE_SIZE = 16
+_kb_query_cache = OrderedDict()  # (知识库版本, 归一化查询, k) -> 检索结果片段
 
-def load_knowledge_base(kb_path: str) -> List[Document]:
+# === 全局 LLM 客户端池 ===
+_http_client = None
+_llm_clients = {}
+_llm_clients_lock = threading.Lock()
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 20))
+
+# === 知识库索引配置 ===
+KB_PATH = os.path.join(os.path.dirname(__file__), 'knowledge_base')
+INDEX_ROOT = os.path.join(os.path.dirname(__file__), 'vector_store')
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 1000))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", 200))
+# 长时间运行的进程每隔多少秒检查一次知识库目录是否变化（只比较文件大小和修改时间，变化的文件才重新计算哈希）
+KB_CHECK_INTERVAL = float(os.getenv("KB_CHECK_INTERVAL", 10))
+# 分割方式："default" 为 LangChain 默认的英文分隔符；"zh" 先清洗 PDF 文本，再按章节标题和中文句末标点分割
+CHUNK_SPLITTER = os.getenv("CHUNK_SPLITTER", "default")
+EMBEDDING_MODEL = "text-embedding-3-small"
+# embedding 后端：openai（远程）、local（本地 CPU 字符 n-gram 哈希）、auto（有 OPENAI_API_KEY 时用 openai，否则用 local）
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "auto")
+LOCAL_EMBEDDING_DIM = int(os.getenv("LOCAL_EMBEDDING_DIM", 1024))
+# 检索配置：hybrid（BM25 关键词 + 向量融合）或 dense（纯向量）；关键词检索补充召回，向量检索的 top-k 可以更小
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+RETRIEVER_K = 4
+HYBRID_DENSE_K = 3
+HYBRID_KEYWORD_K = 3
+HYBRID_ALPHA = 0.5  # 融合时向量得分的权重，关键词得分权重为 1 - HYBRID_ALPHA
+KEYWORD_INDEX_NAME = "keyword_index.npz"
+CHAT_MODEL = "moonshot-v1-8k"
+# 对话模型后端：moonshot（远程 API）、fake（本地确定性模型，用于离线模式、基准测试和压测）
+LLM_BACKEND = os.getenv("LLM_BACKEND", "moonshot")
+LLM_BACKENDS = ("moonshot", "fake")
+CHAT_CONTEXT_WINDOW = 8192  # moonshot-v1-8k 的上下文窗口（输入 + 输出）
+CHAT_MAX_TOKENS = 4096  # 为模型输出预留的 token 数
+CONTEXT_SAFETY_MARGIN = 256  # 消息格式开销，以及 tiktoken 与 Moonshot 分词器的计数误差
+CONTEXT_MMR_LAMBDA = 0.7  # MMR 中相关性的权重，其余权重用于惩罚与已选片段的重复
+CONTEXT_DUPLICATE_THRESHOLD = 0.85  # 与已选片段的词集合 Jaccard 相似度达到该值视为重复
+CONTEXT_MIN_CHUNK_TOKENS = 64  # 剩余预算少于该值时不再截断补入片段
+MOONSHOT_API_BASE = "https://api.moonshot.cn/v1"
+MANIFEST_NAME = "manifest.json"
+# 查询用的向量索引类型：flat（精确检索）、ivf（倒排）、hnsw（图索引）、pq（乘积量化）、fp16（半精度）
+# 增量更新始终基于 index.faiss 中的 flat 索引，其他类型在保存时由全部向量训练生成，切换类型不需要重新向量化
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")
+FAISS_INDEX_TYPES = ("flat", "ivf", "hnsw", "pq", "fp16")
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", 8))  # ivf 查询时访问的倒排桶数
+FAISS_HNSW_M = 32
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", 64))  # hnsw 查询时的候选队列长度
+KEEP_INDEX_VERSIONS = 3
+# 并行解析知识库文件的进程数，可通过环境变量 KB_INGEST_WORKERS 调整
+INGEST_WORKERS = int(os.getenv("KB_INGEST_WORKERS", os.cpu_count() or 1))
+# embedding 并发配置：同时在途的批次数、每批 token 上限（RPM / TPM 额度见 rate_limiter.RATE_LIMITS）
+EMBED_MAX_CONCURRENCY = int(os.getenv("EMBED_MAX_CONCURRENCY", 4))
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", 8000))
+EMBED_BATCH_MAX_TEXTS = 2048  # OpenAI embeddings 接口单次请求的输入条数上限
+EMBEDDING_CACHE_DIR = os.path.join(os.path.dirname(__file__), 'embedding_cache')
+QUERY_CACHE_SIZE = 256
+# 响应缓存：SQLite 文件、过期时间（秒）与最大条目数
+RESPONSE_CACHE_PATH = os.path.join(os.path.dirname(__file__), 'response_cache.sqlite3')
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 7 * 24 * 3600))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 512))
+# 批量分析时同时进行的分析数，实际请求速率仍由共享限流器控制
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", 4))
+
+KB_QUERY_CACHE_SIZE = int(os.getenv("KB_QUERY_CACHE_SIZE", 128))
+KB_SNIPPET_CHARS = 300  # 知识库查询工具返回的每个片段的最大字符数
+
+def _load_file(file_path: str) -> List[Document]:
+    """按扩展名选择加载器，加载单个知识库文件"""
+    if file_path.endswith(".pdf"):
+        from langchain_community.document_loaders import PyPDFLoader
+        return PyPDFLoader(file_path).load()
+    if file_path.endswith(".md"):
+        from langchain_community.document_loaders import UnstructuredMarkdownLoader
+        return UnstructuredMarkdownLoader(file_path).load()
+    return []
+
+def _load_file_timed(file_path: str) -> tuple[List[Document], float]:
+    """在工作进程中解析单个文件，同时返回解析耗时"""
+    start = time.perf_counter()
+    documents = _load_file(file_path)
+    return documents, time.perf_counter() - start
+
+def parse_files(file_paths: List[str], max_workers: Optional[int] = None) -> List[List[Document]]:
+    """
+    用进程池并行解析知识库文件（pypdf 解析是 CPU 密集型），并打印每个文件的解析耗时
+    
+    Args:
+        file_paths: 待解析的文件路径
+        max_workers: 工作进程数；为 None 时使用 INGEST_WORKERS，<= 1 时在当前进程串行解析
+        
+    Returns:
+        与 file_paths 一一对应的文档列表，顺序固定
+    """
+    if max_workers is None:
+        max_workers = INGEST_WORKERS
+    max_workers = min(max_workers, len(file_paths))
+
+    if max_workers <= 1:
+        results = [_load_file_timed(path) for path in file_paths]
+    else:
+        # executor.map 按提交顺序返回结果，保证输出顺序与输入一致；
+        # 调用方（Streamlit 服务、后台任务线程）是多线程进程，fork 出的子进程可能卡在 fork 时被其他线程持有的锁上，
+        # 因此用 spawn 启动全新的解释器
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            results = list(executor.map(_load_file_timed, file_paths))
+
+    timings = sorted(
+        ((elapsed, os.path.basename(path), len(documents)) for path, (documents, elapsed) in zip(file_paths, results)),
+        reverse=True
+    )
+    if timings:
+        print(f"⏱️ 文件解析耗时（{len(timings)} 个文件，{max(max_workers, 1)} 个进程）：")
+        for elapsed, filename, page_count in timings:
+            print(f"  - {elapsed:6.2f}s  {page_count:4d} 页  {filename}")
+
+    return [documents for documents, _ in results]
+
+def load_knowledge_base(
+    kb_path: str,
+    filenames: Optional[List[str]] = None,
+    max_workers: Optional[int] = None
+) -> List[Document]:
     """
     加载知识库文件（支持 .pdf 和 .md）
     
     Args:
         kb_path: 知识库目录路径
+        filenames: 只加载这些文件；为 None 时加载目录下全部文件
+        max_workers: 并行解析的工作进程数，见 parse_files
         
     Returns:
-        加载的文档列表
+        加载的文档列表，按文件名排序
     """
     documents = []
     if not os.path.isdir(kb_path):
         print(f"警告: 知识库目录 '{kb_path}' 不存在。")
         return documents
 
-    for filename in os.listdir(kb_path):
-        file_path = os.path.join(kb_path, filename)
-        if filename.endswith(".pdf"):
-            loader = PyPDFLoader(file_path)
-            documents.extend(loader.load())
-        elif filename.endswith(".md"):
-            loader = UnstructuredMarkdownLoader(file_path)
-            documents.extend(loader.load())
+    if filenames is None:
+        filenames = os.listdir(kb_path)
+    filenames = sorted(name for name in filenames if name.endswith((".pdf", ".md")))
+
+    for file_documents in parse_files([os.path.join(kb_path, name) for name in filenames], max_workers):
+        documents.extend(file_documents)
     
     print(f"成功从 '{kb_path}' 加载了 {len(documents)} 个文档片段。")
     return documents
 
-def create_rag_chain(prompt_template: ChatPromptTemplate, temperature: float = 0.7):
+def _index_settings(embedding_model: str = EMBEDDING_MODEL) -> dict:
+    """影响向量内容的索引参数，任何一项变化都必须全量重建"""
+    return {
+        "splitter": CHUNK_SPLITTER,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "embedding_model": embedding_model,
+    }
+
+def _file_sha256(file_path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def scan_knowledge_base(kb_path: str, known_files: Optional[dict] = None) -> dict:
+    """
+    扫描知识库目录，返回 {文件名: {path, size, mtime, sha256}}
+    
+    Args:
+        kb_path: 知识库目录路径
+        known_files: 上一版清单中的文件记录；大小和修改时间都没变时直接复用其哈希，不再读取文件
+    """
+    known_files = known_files or {}
+    files = {}
+    if not os.path.isdir(kb_path):
+        return files
+
+    for filename in sorted(os.listdir(kb_path)):
+        if not filename.endswith((".pdf", ".md")):
+            continue
+        file_path = os.path.join(kb_path, filename)
+        stat = os.stat(file_path)
+        known = known_files.get(filename)
+        if known and known["size"] == stat.st_size and known["mtime"] == stat.st_mtime:
+            sha256 = known["sha256"]
+        else:
+            sha256 = _file_sha256(file_path)
+        files[filename] = {
+            "path": file_path,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "sha256": sha256,
+        }
+    return files
+
+def compute_kb_version(files: dict, settings: dict) -> str:
+    """
+    计算知识库索引版本号：知识库文件内容 + 分割参数 + embedding 模型的哈希
+    
+    任何一项变化都会得到新的版本号，从而触发索引更新。
+    """
+    hasher = hashlib.sha256()
+    hasher.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    for filename in sorted(files):
+        hasher.update(filename.encode("utf-8"))
+        hasher.update(files[filename]["sha256"].encode("ascii"))
+    return hasher.hexdigest()[:16]
+
+def _read_manifest(index_dir: str) -> Optional[dict]:
+    manifest_path = os.path.join(index_dir, MANIFEST_NAME)
+    if not os.path.isfile(manifest_path):
+        return None
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def find_latest_manifest(settings: dict) -> Optional[dict]:
+    """在已保存的索引版本中找出参数相同、最近生成的一版清单，作为增量更新的基线"""
+    if not os.path.isdir(INDEX_ROOT):
+        return None
+
+    latest = None
+    for name in os.listdir(INDEX_ROOT):
+        if ".tmp-" in name:
+            continue
+        manifest = _read_manifest(os.path.join(INDEX_ROOT, name))
+        if not manifest or manifest.get("settings") != settings:
+            continue
+        if latest is None or manifest["created_at"] > latest["created_at"]:
+            latest = manifest
+    return latest
+
+# 面试篇 PDF 的章节标题："一、"、"2.1 "、"2.1.1.1 "、"6、"、"Q4." 等出现在行首
+ZH_SEPARATORS = [
+    r"\n(?=[一二三四五六七八九十]+、)",
+    r"\n(?=(?:\d+\.)+\d*\s|\d+、|Q\d+\.)",
+    r"\n\n",
+    r"(?<=[。！？；!?;])",
+    r"\n",
+    r"(?<=[，,])",
+    r" ",
+    r"",
+]
+_PDF_BOILERPLATE_PATTERN = re.compile(r"^https?://\S+ \d+/\d+$\n?|^\d{4}/\d{1,2}/\d{1,2} \d{1,2}:\d{2} ", re.M)
+_CJK_PATTERN = re.compile(r"[\u4e00-\u9fff]")
+WRAPPED_LINE_MIN_CHARS = 30  # 达到该长度、以汉字结尾的行视为 PDF 排版折行，与下一行直接拼接
+
+def clean_pdf_text(text: str) -> str:
+    """
+    清洗 PDF 抽取出的中文文本
+    
+    - NFKC 归一化：部分 PDF 用康熙部首（⼀、⽤ 等）代替常用汉字，不归一化会破坏检索
+    - 控制字符换成空格，去掉知识星球导出页眉的时间戳和页脚链接
+    - 拼接被排版折断的中文行，避免一个词被换行拆开
+    """
+    text = unicodedata.normalize("NFKC", text)
+    text = re.sub(r"[\x00-\x08\x0b-\x1f]", " ", text)
+    text = _PDF_BOILERPLATE_PATTERN.sub("", text)
+
+    lines = text.split("\n")
+    merged = [lines[0]]
+    for line in lines[1:]:
+        previous = merged[-1]
+        if (
+            len(previous) >= WRAPPED_LINE_MIN_CHARS
+            and _CJK_PATTERN.match(previous[-1:])
+            and _CJK_PATTERN.match(line[:1])
+        ):
+            merged[-1] = previous + line
+        else:
+            merged.append(line)
+    return "\n".join(merged)
+
+def make_text_splitter(
+    splitter: str = CHUNK_SPLITTER,
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP
+):
+    """按分割方式创建文本分割器（"default" 或 "zh"）"""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    if splitter == "zh":
+        return RecursiveCharacterTextSplitter(
+            separators=ZH_SEPARATORS,
+            is_separator_regex=True,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap
+        )
+    if splitter == "default":
+        return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    raise ValueError(f"未知的分割方式: {splitter}（可选 default、zh）")
+
+def split_documents(
+    documents: List[Document],
+    splitter: str = CHUNK_SPLITTER,
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP
+) -> List[Document]:
+    """按分割方式分割文档；"zh" 模式先用 clean_pdf_text 清洗每页文本"""
+    if splitter == "zh":
+        documents = [
+            Document(page_content=clean_pdf_text(doc.page_content), metadata=dict(doc.metadata))
+            for doc in documents
+        ]
+    return make_text_splitter(splitter, chunk_size, chunk_overlap).split_documents(documents)
+
+def split_file_documents(filename: str, documents: List[Document], sha256: str) -> tuple[List[Document], List[str]]:
+    """分割单个文件的文档，并为每个块生成稳定的 ID（文件名 + 内容哈希 + 序号）"""
+    split_docs = split_documents(documents)
+    chunk_ids = [f"{filename}::{sha256[:12]}::{i}" for i in range(len(split_docs))]
+    for doc, chunk_id in zip(split_docs, chunk_ids):
+        doc.metadata["chunk_id"] = chunk_id
+    return split_docs, chunk_ids
+
+def embed_into_vector_store(
+    vector_store: Optional["FAISS"],
+    split_docs: List[Document],
+    chunk_ids: List[str],
+    embeddings: Embeddings
+) -> Optional["FAISS"]:
+    """一次性向量化全部文档块，再整体写入向量库；vector_store 为 None 时新建"""
+    if not split_docs:
+        return vector_store
+
+    from langchain_community.vectorstores import FAISS
+
+    print(f"正在为 {len(split_docs)} 个文档块创建向量索引...")
+    texts = [doc.page_content for doc in split_docs]
+    vectors = embeddings.embed_documents(texts)
+    text_embeddings = list(zip(texts, vectors))
+    metadatas = [doc.metadata for doc in split_docs]
+
+    if vector_store is None:
+        vector_store = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas, ids=chunk_ids)
+    else:
+        vector_store.add_embeddings(text_embeddings, metadatas=metadatas, ids=chunk_ids)
+    
+    print("向量索引创建完成！")
+    return vector_store
+
+def update_vector_store(
+    kb_path: str,
+    embeddings: Embeddings,
+    files: dict,
+    base_manifest: Optional[dict]
+) -> tuple[Optional["FAISS"], dict]:
+    """
+    基于上一版索引做增量更新：只加载、分割并向量化新增或修改的文件，删除已移除文件的向量
+    
+    Args:
+        kb_path: 知识库目录路径
+        embeddings: embedding 模型
+        files: scan_knowledge_base 的扫描结果
+        base_manifest: 上一版清单；为 None 时全量构建
+        
+    Returns:
+        (向量库, 新清单中的文件记录)；知识库为空时向量库为 None
+    """
+    from langchain_community.vectorstores import FAISS
+
+    vector_store = None
+    base_files = {}
+    if base_manifest is not None:
+        base_dir = os.path.join(INDEX_ROOT, base_manifest["kb_version"])
+        vector_store = FAISS.load_local(base_dir, embeddings, allow_dangerous_deserialization=True)
+        base_files = base_manifest["files"]
+
+    unchanged = [name for name in files if name in base_files and base_files[name]["sha256"] == files[name]["sha256"]]
+    changed = [name for name in files if name not in unchanged]
+    removed = [name for name in base_files if name not in unchanged]
+    print(f"知识库变更：新增/修改 {len(changed)} 个文件，移除/修改 {len(removed)} 个文件，未变 {len(unchanged)} 个文件")
+
+    # 1. 删除已移除或已修改文件的旧向量
+    stale_ids = [chunk_id for name in removed for chunk_id in base_files[name]["chunk_ids"]]
+    if stale_ids:
+        vector_store.delete(stale_ids)
+
+    new_files = {name: dict(files[name], chunk_ids=base_files[name]["chunk_ids"]) for name in unchanged}
+
+    # 2. 只对新增或修改的文件执行加载 -> 分割 -> 向量化
+    all_docs, all_ids = [], []
+    with span("ingest.load", files=len(changed)):
+        parsed = parse_files([os.path.join(kb_path, name) for name in changed])
+    with span("ingest.split") as split_span:
+        for name, documents in zip(changed, parsed):
+            split_docs, chunk_ids = split_file_documents(name, documents, files[name]["sha256"])
+            all_docs.extend(split_docs)
+            all_ids.extend(chunk_ids)
+            new_files[name] = dict(files[name], chunk_ids=chunk_ids)
+        split_span["chunks"] = len(all_docs)
+
+    with span("ingest.embed", chunks=len(all_docs)):
+        vector_store = embed_into_vector_store(vector_store, all_docs, all_ids, embeddings)
+
+    if not any(record["chunk_ids"] for record in new_files.values()):
+        print("警告: 知识库为空或分割后无内容。")
+        return None, new_files
+    return vector_store, new_files
+
+def save_vector_store(
+    vector_store: "FAISS",
+    index_dir: str,
+    manifest: dict,
+    keyword_index: Optional["KeywordIndex"] = None
+) -> None:
+    """先写入临时目录再原子重命名，避免并发启动的进程读到写了一半的索引"""
+    tmp_dir = f"{index_dir}.tmp-{os.getpid()}"
+    vector_store.save_local(tmp_dir)
+    write_search_index(tmp_dir, FAISS_INDEX_TYPE, vector_store.index)
+    if keyword_index is not None:
+        keyword_index.save(tmp_dir)
+    with open(os.path.join(tmp_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    try:
+        os.replace(tmp_dir, index_dir)
+    except OSError:
+        # 其他进程已抢先写入同一版本，丢弃本次结果即可
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    print(f"💾 向量索引已保存到 '{index_dir}'")
+
+def faiss_factory_string(index_type: str, ntotal: int, dim: int) -> str:
+    """按向量条数和维度生成 faiss.index_factory 的描述串"""
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "fp16":
+        return "SQfp16"
+    if index_type == "hnsw":
+        return f"HNSW{FAISS_HNSW_M}"
+    if index_type == "ivf":
+        # 经验值 4 * sqrt(n) 个桶，同时保证每个桶至少有 39 个训练样本
+        nlist = max(1, min(int(4 * math.sqrt(ntotal)), ntotal // 39))
+        return f"IVF{nlist},Flat"
+    if index_type == "pq":
+        if ntotal < 2:
+            return "Flat"  # 码本至少需要 2 个训练样本
+        # 每个向量压缩到约 dim / 16 字节（子空间数需整除维度），样本不足 256 个时减少码本位数；
+        # np 关闭 index_factory 默认开启的 polysemous 训练，它对查询无用却让训练慢上百倍
+        m = max(d for d in range(1, dim // 16 + 1) if dim % d == 0)
+        nbits = max(1, min(8, int(math.log2(max(ntotal, 2)))))
+        return f"PQ{m}x{nbits}np"
+    raise ValueError(f"未知的向量索引类型: {index_type}（可选 {', '.join(FAISS_INDEX_TYPES)}）")
+
+def build_search_index(vectors: "np.ndarray", index_type: str = FAISS_INDEX_TYPE):
+    """用全部向量训练并构建指定类型的 faiss 索引，向量顺序即索引中的位置"""
+    import faiss
+
+    ntotal, dim = vectors.shape
+    index = faiss.index_factory(dim, faiss_factory_string(index_type, ntotal, dim))
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+def _search_index_path(index_dir: str, index_type: str) -> str:
+    name = "index.faiss" if index_type == "flat" else f"index_{index_type}.faiss"
+    return os.path.join(index_dir, name)
+
+def write_search_index(index_dir: str, index_type: str = FAISS_INDEX_TYPE, flat_index=None) -> None:
+    """由 flat 索引中的原始向量训练指定类型的索引并写入 index_dir（先写临时文件再原子重命名）"""
+    import faiss
+
+    if index_type == "flat":
+        return
+    if flat_index is None:
+        flat_index = faiss.read_index(os.path.join(index_dir, "index.faiss"), faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+    start = time.perf_counter()
+    index = build_search_index(flat_index.reconstruct_n(0, flat_index.ntotal), index_type)
+    path = _search_index_path(index_dir, index_type)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, path)
+    print(f"🧮 已训练 {index_type} 向量索引（{index.ntotal} 条，{time.perf_counter() - start:.2f}s）")
+
+def load_search_vector_store(index_dir: str, embeddings: Embeddings, index_type: str = FAISS_INDEX_TYPE) -> "FAISS":
     """
-    创建并返回一个完整的 RAG (Retrieval-Augmented Generation) 链。
-    使用全局缓存避免重复创建，解决Agent模式下的API限流问题。
+    以只读内存映射方式加载查询用的向量库
+    
+    索引文件由操作系统按需换页，不会整体读入进程内存；多个进程加载同一版本时共享页缓存。
+    该类型的索引文件不存在时（例如刚切换 FAISS_INDEX_TYPE）先由 flat 索引训练生成。
+    """
+    import faiss
+    from langchain_community.vectorstores import FAISS
+
+    path = _search_index_path(index_dir, index_type)
+    if not os.path.isfile(path):
+        write_search_index(index_dir, index_type)
+
+    # IO_FLAG_MMAP 映射 ivf 的倒排表，IO_FLAG_MMAP_IFC 映射 flat / pq / fp16 / hnsw 的向量编码（两者不能同时使用）
+    mmap_flag = faiss.IO_FLAG_MMAP if index_type == "ivf" else faiss.IO_FLAG_MMAP_IFC
+    index = faiss.read_index(path, mmap_flag | faiss.IO_FLAG_READ_ONLY)
+    if index_type == "ivf":
+        faiss.extract_index_ivf(index).nprobe = FAISS_NPROBE
+    elif index_type == "hnsw":
+        index.hnsw.efSearch = FAISS_EF_SEARCH
+
+    # docstore 由本进程自己写入，可以安全反序列化
+    with open(os.path.join(index_dir, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+def prune_index_versions(keep: int = KEEP_INDEX_VERSIONS) -> None:
+    """只保留最近的若干个索引版本，避免磁盘无限增长"""
+    manifests = []
+    for name in os.listdir(INDEX_ROOT):
+        manifest = _read_manifest(os.path.join(INDEX_ROOT, name))
+        if manifest:
+            manifests.append(manifest)
+    manifests.sort(key=lambda m: m["created_at"], reverse=True)
+    for manifest in manifests[keep:]:
+        shutil.rmtree(os.path.join(INDEX_ROOT, manifest["kb_version"]), ignore_errors=True)
+
+def load_or_build_vector_store(kb_path: str, embeddings: Embeddings) -> tuple[Optional["FAISS"], str]:
     """
-    global _rag_chain_cache, _retriever_cache
+    按知识库版本号从磁盘加载向量索引；版本不存在时基于上一版增量更新并保存为新版本
     
-    # 检查缓存
-    if _rag_chain_cache is not None and _retriever_cache is not None:
-        print("✅ 使用缓存的RAG链，避免重复向量化")
-        return _rag_chain_cache, _retriever_cache
+    Args:
+        kb_path: 知识库目录路径
+        embeddings: 用于查询向量化（以及必要时构建索引）的 embedding 模型
+        
+    Returns:
+        (FAISS 向量库, 知识库版本号)；知识库为空时向量库为 None
+    """
+    settings = _index_settings(getattr(embeddings, "model_name", EMBEDDING_MODEL))
+    base_manifest = find_latest_manifest(settings)
+    files = scan_knowledge_base(kb_path, base_manifest["files"] if base_manifest else None)
+    kb_version = compute_kb_version(files, settings)
+    index_dir = os.path.join(INDEX_ROOT, kb_version)
+
+    if os.path.isdir(index_dir):
+        print(f"✅ 从磁盘加载向量索引 (版本 {kb_version}，{FAISS_INDEX_TYPE})，跳过向量化")
+        with span("index.load", kb_version=kb_version, index_type=FAISS_INDEX_TYPE):
+            return load_search_vector_store(index_dir, embeddings), kb_version
+
+    if base_manifest is not None:
+        print(f"🔄 基于版本 {base_manifest['kb_version']} 增量更新向量索引到版本 {kb_version}...")
+    else:
+        print(f"🔄 未找到可用的向量索引，开始全量构建版本 {kb_version}...")
+    vector_store, indexed_files = update_vector_store(kb_path, embeddings, files, base_manifest)
+    if vector_store is None:
+        return None, kb_version
+
+    manifest = {
+        "kb_version": kb_version,
+        "settings": settings,
+        "created_at": time.time(),
+        "files": indexed_files,
+    }
+    # 关键词倒排索引基于最终的全部文档块构建，与向量索引一起保存
+    with span("ingest.index", kb_version=kb_version, index_type=FAISS_INDEX_TYPE, vectors=vector_store.index.ntotal):
+        keyword_index = KeywordIndex.from_vector_store(vector_store)
+        os.makedirs(INDEX_ROOT, exist_ok=True)
+        save_vector_store(vector_store, index_dir, manifest, keyword_index)
+        prune_index_versions()
+    # 构建用的 flat 索引常驻内存，改为加载刚保存的只读映射版本
+    with span("index.load", kb_version=kb_version, index_type=FAISS_INDEX_TYPE):
+        return load_search_vector_store(index_dir, embeddings), kb_version
+
+class CachedEmbeddings(Embeddings):
+    """
+    按 (embedding 模型, 文本 sha256) 做内容寻址缓存的 embedding 包装器
     
-    print("🔄 首次创建RAG链...")
+    每个模型一个追加写入的记录文件，每条记录为 32 字节摘要 + float32 向量，
+    可以直接用 np.memmap 只读映射。索引重建、调整分割参数时，已经向量化过的文本不再请求 API。
+    """
+
+    def __init__(self, embeddings: Embeddings, model_name: str, cache_dir: Optional[str] = None):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        cache_dir = cache_dir or EMBEDDING_CACHE_DIR
+        os.makedirs(cache_dir, exist_ok=True)
+        safe_name = model_name.replace("/", "_")
+        self._data_path = os.path.join(cache_dir, f"{safe_name}.bin")
+        self._meta_path = os.path.join(cache_dir, f"{safe_name}.json")
+        self._lock = threading.Lock()
+        self._dim = None
+        self._vectors = None  # 磁盘记录的只读内存映射
+        self._rows = {}       # 摘要 -> 映射中的行号
+        self._pending = {}    # 本进程新写入、尚未映射的向量
+        self._queries = OrderedDict()  # 查询文本的内存 LRU，同一 JD 反复检索时不再请求 API
+        self._load()
+
+    def _record_dtype(self) -> "np.dtype":
+        import numpy as np
+
+        return np.dtype([("key", "S32"), ("vec", "<f4", (self._dim,))])
+
+    def _load(self) -> None:
+        if not os.path.isfile(self._meta_path):
+            return
+        with open(self._meta_path, "r", encoding="utf-8") as f:
+            self._dim = json.load(f)["dim"]
+
+        dtype = self._record_dtype()
+        count = os.path.getsize(self._data_path) // dtype.itemsize if os.path.isfile(self._data_path) else 0
+        if count == 0:
+            return
+        import numpy as np
+
+        # 只映射完整的记录，忽略进程中断时可能残留的半条记录
+        self._vectors = np.memmap(self._data_path, dtype=dtype, mode="r", shape=(count,))
+        self._rows = {bytes(key): row for row, key in enumerate(self._vectors["key"])}
+        print(f"📦 已加载 {len(self._rows)} 条 embedding 缓存 ({self.model_name})")
+
+    def _lookup(self, digest: bytes) -> Optional["np.ndarray"]:
+        if digest in self._pending:
+            return self._pending[digest]
+        row = self._rows.get(digest)
+        if row is None:
+            return None
+        return self._vectors["vec"][row]
+
+    def _append(self, digests: List[bytes], vectors: List[List[float]]) -> None:
+        import numpy as np
+
+        matrix = np.asarray(vectors, dtype="<f4")
+        if self._dim is None:
+            self._dim = matrix.shape[1]
+            with open(self._meta_path, "w", encoding="utf-8") as f:
+                json.dump({"model": self.model_name, "dim": self._dim}, f)
+
+        records = np.empty(len(digests), dtype=self._record_dtype())
+        records["key"] = digests
+        records["vec"] = matrix
+        # 单次追加写入整批记录，多个进程共享同一缓存文件时记录不会交错
+        with open(self._data_path, "ab") as f:
+            f.write(records.tobytes())
+        for digest, vector in zip(digests, matrix):
+            self._pending[digest] = vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        digests = [hashlib.sha256(text.encode("utf-8")).digest() for text in texts]
+
+        with self._lock:
+            missing = {}
+            for digest, text in zip(digests, texts):
+                if digest not in missing and self._lookup(digest) is None:
+                    missing[digest] = text
+
+        # 远程请求期间不持有锁，并发调用方（如 ConcurrentEmbeddings 的多个批次）互不阻塞
+        vectors = self.embeddings.embed_documents(list(missing.values())) if missing else []
+
+        with self._lock:
+            # 其他调用方可能同时向量化了相同文本，只追加仍然缺失的记录
+            new = [(digest, vector) for digest, vector in zip(missing, vectors) if self._lookup(digest) is None]
+            if new:
+                self._append([digest for digest, _ in new], [vector for _, vector in new])
+            if missing:
+                print(f"  - embedding 缓存命中 {len(texts) - len(missing)} 条，新增 {len(missing)} 条")
+
+            return [self._lookup(digest).tolist() for digest in digests]
+
+    def embed_query(self, text: str) -> List[float]:
+        with self._lock:
+            if text in self._queries:
+                self._queries.move_to_end(text)
+                return self._queries[text]
+        vector = self.embeddings.embed_query(text)
+        with self._lock:
+            self._queries[text] = vector
+            if len(self._queries) > QUERY_CACHE_SIZE:
+                self._queries.popitem(last=False)
+        return vector
+
+class ConcurrentEmbeddings(Embeddings):
+    """
+    按 token 数切分批次、在 RPM / TPM 额度内并发请求的 embedding 包装器
     
-    # 1. 加载知识库文档
-    kb_path = os.path.join(os.path.dirname(__file__), 'knowledge_base')
-    documents = load_knowledge_base(kb_path)
+    批次大小由 tiktoken 计算的 token 数决定，而不是固定条数；多个批次同时在途，
+    每个批次的请求（包括重试）发送前由 RetryingResource 向限流器申请额度，从而在不触发 429 的前提下用满配额。
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str,
+        max_concurrency: int = EMBED_MAX_CONCURRENCY,
+        batch_tokens: int = EMBED_BATCH_TOKENS
+    ):
+        self.embeddings = embeddings
+        self.max_concurrency = max_concurrency
+        self.batch_tokens = batch_tokens
+        import tiktoken
+
+        try:
+            self._encoding = tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            self._encoding = tiktoken.get_encoding("cl100k_base")
+
+    def _make_batches(self, texts: List[str]) -> List[tuple[List[str], int]]:
+        """把文本按顺序贪心地装进不超过 batch_tokens 的批次，返回 [(文本列表, token 数)]"""
+        token_counts = [len(tokens) for tokens in self._encoding.encode_ordinary_batch(texts)]
+        batches = []
+        current, current_tokens = [], 0
+        for text, count in zip(texts, token_counts):
+            if current and (current_tokens + count > self.batch_tokens or len(current) >= EMBED_BATCH_MAX_TEXTS):
+                batches.append((current, current_tokens))
+                current, current_tokens = [], 0
+            current.append(text)
+            current_tokens += count
+        if current:
+            batches.append((current, current_tokens))
+        return batches
+
+    def _embed_batch(self, batch: tuple[List[str], int]) -> List[List[float]]:
+        texts, _ = batch
+        return self.embeddings.embed_documents(texts)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        batches = self._make_batches(texts)
+        print(f"  - 共 {len(texts)} 条文本，{len(batches)} 个批次，最多 {self.max_concurrency} 个并发请求")
+
+        # executor.map 按批次顺序返回结果，拼接后与输入一一对应
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            results = list(executor.map(self._embed_batch, batches))
+        return [vector for batch_vectors in results for vector in batch_vectors]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+class HashedNgramEmbeddings(Embeddings):
+    """
+    本地 CPU embedding：字符 n-gram 特征哈希 + 次线性词频 + L2 归一化
     
-    if not documents:
-        print("知识库为空，无法创建 RAG 链。")
-        return None, None # 返回 None 表示无法创建
+    按字符而不是按词切分，中文无需分词也能得到有效特征。整批文本拼接成一个码点数组，
+    n-gram 哈希、分桶计数和归一化全部用 NumPy 向量运算完成，不需要网络和 API Key。
+    """
+
+    def __init__(self, dim: int = LOCAL_EMBEDDING_DIM, ngram_range: tuple[int, int] = (1, 3), batch_size: int = 512):
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self.batch_size = batch_size
+        self.model_name = f"local-hashed-ngram-{ngram_range[0]}{ngram_range[1]}-{dim}"
+
+    def _embed_batch(self, texts: List[str]) -> "np.ndarray":
+        import numpy as np
+
+        texts = [" ".join(text.lower().split()) for text in texts]
+        lengths = np.array([len(text) for text in texts], dtype=np.int64)
+        codes = np.frombuffer("".join(texts).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        char_rows = np.repeat(np.arange(len(texts)), lengths)
+        counts = np.zeros(len(texts) * self.dim, dtype=np.float64)
 
-    # 2. 文本分割
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    split_docs = text_splitter.split_documents(documents)
+        for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+            m = len(codes) - n + 1
+            if m <= 0:
+                continue
+            # 对每个起点的 n 个码点做 FNV-1a 哈希（uint64 运算自然溢出回绕），n 参与初值以区分不同阶
+            hashes = np.full(m, 14695981039346656037 ^ n, dtype=np.uint64)
+            for k in range(n):
+                hashes = (hashes ^ codes[k:k + m]) * np.uint64(1099511628211)
+            # 丢弃跨越两段文本边界的 n-gram
+            valid = char_rows[:m] == char_rows[n - 1:n - 1 + m]
+            hashes = hashes[valid]
+            buckets = (hashes % np.uint64(self.dim)).astype(np.int64)
+            # 用哈希最高位决定符号，抵消桶冲突带来的偏差
+            signs = np.where(hashes >> np.uint64(63), -1.0, 1.0)
+            counts += np.bincount(char_rows[:m][valid] * self.dim + buckets, weights=signs, minlength=counts.size)
+
+        matrix = counts.reshape(len(texts), self.dim)
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (matrix / norms).astype(np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for i in range(0, len(texts), self.batch_size):
+            vectors.extend(self._embed_batch(texts[i:i + self.batch_size]).tolist())
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed_batch([text])[0].tolist()
+
+def resolve_embedding_backend() -> str:
+    """解析实际使用的 embedding 后端（openai / local）"""
+    if EMBEDDING_BACKEND == "auto":
+        return "openai" if os.getenv("OPENAI_API_KEY") else "local"
+    return EMBEDDING_BACKEND
+
+def _create_embeddings() -> Optional[Embeddings]:
+    """
+    按 EMBEDDING_BACKEND 创建 embedding 模型
+    
+    local 后端直接在本地 CPU 上计算；openai 后端带缓存、并发与限流，缺少 OPENAI_API_KEY 时返回 None。
+    """
+    if resolve_embedding_backend() == "local":
+        print("使用本地 CPU embedding（字符 n-gram 哈希），无需网络和 API Key。")
+        return HashedNgramEmbeddings()
 
-    # 3. 创建 Embedding 模型
     # 使用 OpenAI 专门的 embedding 模型，效果和兼容性更好
     openai_api_key = os.getenv("OPENAI_API_KEY")
     if not openai_api_key:
         # 如果没有找到 OpenAI API Key，我们可以打印一个更友好的错误提示，而不是让程序崩溃
-        print("错误: 未找到 OPENAI_API_KEY 环境变量。RAG 功能需要此密钥。")
-        print("将回退到无知识库的普通分析模式。")
-        return None, None # 返回 None 表示无法创建 RAG 链
+        print("错误: 未找到 OPENAI_API_KEY 环境变量。openai embedding 后端需要此密钥。")
+        print("可设置 EMBEDDING_BACKEND=local 使用本地 embedding，本次将回退到无知识库的普通分析模式。")
+        return None
+
+    import openai
+    from langchain_openai import OpenAIEmbeddings
 
-    embeddings = OpenAIEmbeddings(
-        model="text-embedding-3-small",
-        openai_api_key=openai_api_key
+    return CachedEmbeddings(
+        ConcurrentEmbeddings(
+            OpenAIEmbeddings(
+                # 重试统一由 retry_policy 负责，关闭 openai SDK 自带的重试，避免重试次数层层相乘
+                # 每次请求（包括重试）都先向共享限流器申请额度
+                client=RetryingResource(
+                    openai.OpenAI(api_key=openai_api_key, max_retries=0, http_client=get_http_client()).embeddings,
+                    get_retry_policy("embeddings"),
+                    limiter=get_rate_limiter("embeddings")
+                ),
+                model=EMBEDDING_MODEL,
+                openai_api_key=openai_api_key
+            ),
+            EMBEDDING_MODEL
+        ),
+        EMBEDDING_MODEL
     )
 
-    # 4. 创建向量数据库和检索器
-    # 采用分批处理的方式，防止一次性发送过多token导致API错误
-    if not split_docs:
-        print("警告: 知识库为空或分割后无内容。")
-        return None, None
+_SEARCH_TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9+#]*(?:[.\-][a-z0-9+#]+)*|[\u4e00-\u9fff]+")
+
+def tokenize_for_search(text: str) -> List[str]:
+    """
+    面向中英文混排的关键词切分
+    
+    英文/数字按词切分并保留 c++、c#、rag-fusion 这类写法（带连字符或点号的词额外拆出各部分），
+    中文连续片段切成字符二元组（单字片段保留单字），无需分词词典。
+    """
+    tokens = []
+    for match in _SEARCH_TOKEN_PATTERN.findall(text.lower()):
+        if match[0] < "\u4e00":
+            tokens.append(match)
+            if "-" in match or "." in match:
+                tokens.extend(part for part in re.split(r"[.\-]", match) if part)
+        elif len(match) == 1:
+            tokens.append(match)
+        else:
+            tokens.extend(match[i:i + 2] for i in range(len(match) - 1))
+    return tokens
+
+def _pack_strings(strings: List[str]) -> "np.ndarray":
+    """把字符串列表存成换行分隔的 UTF-8 字节数组；定长 unicode 数组会按最长的词项给每项分配空间"""
+    import numpy as np
+
+    return np.frombuffer("\n".join(strings).encode("utf-8"), dtype=np.uint8)
+
+def _unpack_strings(array: "np.ndarray") -> List[str]:
+    text = array.tobytes().decode("utf-8")
+    return text.split("\n") if text else []
+
+class KeywordIndex:
+    """
+    基于 BM25 的倒排索引，在入库时对全部文档块构建并与向量索引一起保存
+    
+    每个词项的倒排表预先算好 BM25 权重，查询时只需按词项把权重累加到得分数组上。
+    """
+
+    def __init__(self, doc_ids: List[str], terms: List[str], offsets: "np.ndarray", postings: "np.ndarray", weights: "np.ndarray"):
+        self.doc_ids = list(doc_ids)
+        self._term_rows = {term: row for row, term in enumerate(terms)}
+        self._offsets = offsets
+        self._postings = postings
+        self._weights = weights
+
+    @classmethod
+    def build(cls, doc_ids: List[str], texts: List[str], k1: float = 1.5, b: float = 0.75) -> "KeywordIndex":
+        import numpy as np
+
+        term_postings = {}
+        lengths = []
+        for doc_index, text in enumerate(texts):
+            tokens = tokenize_for_search(text)
+            lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                term_postings.setdefault(term, []).append((doc_index, tf))
+
+        lengths = np.array(lengths, dtype=np.float32)
+        avg_length = float(lengths.mean()) if len(lengths) and lengths.mean() > 0 else 1.0
+        terms = sorted(term_postings)
+        offsets = [0]
+        postings, weights = [], []
+        for term in terms:
+            entries = np.array(term_postings[term], dtype=np.float32)
+            doc_indices = entries[:, 0].astype(np.int32)
+            tf = entries[:, 1]
+            idf = math.log(1 + (len(texts) - len(doc_indices) + 0.5) / (len(doc_indices) + 0.5))
+            weights.append(idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths[doc_indices] / avg_length)))
+            postings.append(doc_indices)
+            offsets.append(offsets[-1] + len(doc_indices))
+
+        return cls(
+            doc_ids,
+            terms,
+            np.array(offsets, dtype=np.int64),
+            np.concatenate(postings) if postings else np.zeros(0, dtype=np.int32),
+            np.concatenate(weights).astype(np.float32) if weights else np.zeros(0, dtype=np.float32)
+        )
+
+    @classmethod
+    def from_vector_store(cls, vector_store: "FAISS") -> "KeywordIndex":
+        """对向量库中的全部文档块构建关键词索引，文档 ID 与向量库的 docstore ID 一致"""
+        doc_ids = list(vector_store.index_to_docstore_id.values())
+        texts = [vector_store.docstore.search(doc_id).page_content for doc_id in doc_ids]
+        return cls.build(doc_ids, texts)
+
+    def save(self, index_dir: str) -> None:
+        import numpy as np
+
+        terms = [""] * len(self._term_rows)
+        for term, row in self._term_rows.items():
+            terms[row] = term
+        np.savez(
+            os.path.join(index_dir, KEYWORD_INDEX_NAME),
+            doc_ids=_pack_strings(self.doc_ids),
+            terms=_pack_strings(terms),
+            offsets=self._offsets,
+            postings=self._postings,
+            weights=self._weights
+        )
+
+    @classmethod
+    def load(cls, index_dir: str) -> Optional["KeywordIndex"]:
+        import numpy as np
+
+        path = os.path.join(index_dir, KEYWORD_INDEX_NAME)
+        if not os.path.isfile(path):
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                _unpack_strings(data["doc_ids"]), _unpack_strings(data["terms"]),
+                data["offsets"], data["postings"], data["weights"]
+            )
+
+    def search(self, query: str, k: int) -> List[tuple[str, float]]:
+        """返回 BM25 得分最高的 k 个 (文档 ID, 得分)，只包含至少命中一个词项的文档"""
+        import numpy as np
+
+        scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+        for term in set(tokenize_for_search(query)):
+            row = self._term_rows.get(term)
+            if row is None:
+                continue
+            start, end = self._offsets[row], self._offsets[row + 1]
+            # 同一词项的倒排表中文档不重复，可以直接用花式索引累加
+            scores[self._postings[start:end]] += self._weights[start:end]
+
+        k = min(k, int(np.count_nonzero(scores)))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.doc_ids[i], float(scores[i])) for i in top]
+
+def _min_max(scores: dict) -> dict:
+    if not scores:
+        return {}
+    low, high = min(scores.values()), max(scores.values())
+    if high == low:
+        return {key: 1.0 for key in scores}
+    return {key: (value - low) / (high - low) for key, value in scores.items()}
+
+class HybridRetriever(BaseRetriever):
+    """
+    BM25 关键词检索与 FAISS 向量检索的融合检索器
+    
+    两路结果的得分分别做 min-max 归一化后按 alpha 加权求和，取前 k 个文档块。
+    关键词检索能补上 "LoRA"、"RAG-Fusion"、"C++ 虚函数" 这类精确术语，向量检索的 top-k 可以更小。
+    """
+
+    vector_store: Any
+    keyword_index: Any
+    k: int = RETRIEVER_K
+    dense_k: int = HYBRID_DENSE_K
+    keyword_k: int = HYBRID_KEYWORD_K
+    alpha: float = HYBRID_ALPHA
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        documents = {}
+        dense_scores = {}
+        for doc, distance in self.vector_store.similarity_search_with_score(query, k=self.dense_k):
+            doc_id = _doc_id(doc)
+            documents[doc_id] = doc
+            # FAISS 返回 L2 距离，取负数作为相似度
+            dense_scores[doc_id] = -float(distance)
+
+        keyword_scores = dict(self.keyword_index.search(query, self.keyword_k))
+        for doc_id in keyword_scores:
+            if doc_id not in documents:
+                doc = self.vector_store.docstore.search(doc_id)
+                if isinstance(doc, Document):
+                    documents[doc_id] = doc
+
+        dense_norm = _min_max(dense_scores)
+        keyword_norm = _min_max(keyword_scores)
+        fused = {
+            doc_id: self.alpha * dense_norm.get(doc_id, 0.0) + (1 - self.alpha) * keyword_norm.get(doc_id, 0.0)
+            for doc_id in documents
+        }
+        ranked = sorted(fused, key=fused.get, reverse=True)[:self.k]
+        return [documents[doc_id] for doc_id in ranked]
+
+def build_retriever(vector_store: "FAISS", index_dir: str) -> BaseRetriever:
+    """按 RETRIEVAL_MODE 创建检索器；旧版本索引缺少关键词索引时现场构建并补存"""
+    if RETRIEVAL_MODE != "hybrid":
+        return vector_store.as_retriever(search_kwargs={"k": RETRIEVER_K})
+
+    keyword_index = KeywordIndex.load(index_dir)
+    if keyword_index is None:
+        keyword_index = KeywordIndex.from_vector_store(vector_store)
+        keyword_index.save(index_dir)
+    return HybridRetriever(vector_store=vector_store, keyword_index=keyword_index)
+
+def _kb_version_changed() -> bool:
+    """重新扫描知识库目录（大小和修改时间没变的文件复用已知哈希），判断版本是否与已加载的索引不同"""
+    files = scan_knowledge_base(KB_PATH, _kb_files_cache)
+    return compute_kb_version(files, _kb_settings_cache) != _kb_version_cache
+
+def get_retriever():
+    """
+    获取进程内共享的知识库检索器，向量索引每个知识库版本只加载一次
+    
+    每隔 KB_CHECK_INTERVAL 秒检查一次知识库目录，版本变化时加载（或增量构建）新索引并清空 RAG 链缓存，
+    长时间运行的进程不需要重启就能用上新增或修改的资料。
         
-    print("正在分批为知识库文档创建向量索引...")
-    # 先用第一个文档块初始化 FAISS 索引
-    vector_store = FAISS.from_documents([split_docs[0]], embeddings)
+    Returns:
+        检索器；知识库为空（或 EMBEDDING_BACKEND=openai 却缺少 OPENAI_API_KEY）时返回 None
+    """
+    global _retriever_cache, _kb_version_cache, _kb_files_cache, _kb_settings_cache, _kb_checked_at
+
+    if _retriever_cache is not None and time.monotonic() - _kb_checked_at < KB_CHECK_INTERVAL:
+        return _retriever_cache
+
+    # 批量分析时多个线程可能同时首次调用，加锁保证索引只加载/构建一次
+    with _rag_chain_lock:
+        if _retriever_cache is not None:
+            if time.monotonic() - _kb_checked_at < KB_CHECK_INTERVAL:
+                return _retriever_cache
+            _kb_checked_at = time.monotonic()
+            if not _kb_version_changed():
+                return _retriever_cache
+            print("🔄 知识库目录有变化，重新加载向量索引")
+
+        embeddings = _create_embeddings()
+        if embeddings is None:
+            return None
+
+        # 加载持久化的向量索引（版本变化时才重新加载、分割和向量化知识库）
+        vector_store, kb_version = load_or_build_vector_store(KB_PATH, embeddings)
+        if vector_store is None:
+            return None
+
+        if kb_version != _kb_version_cache:
+            index_dir = os.path.join(INDEX_ROOT, kb_version)
+            _retriever_cache = build_retriever(vector_store, index_dir)
+            _kb_version_cache = kb_version
+            _kb_files_cache = _read_manifest(index_dir)["files"]
+            _kb_settings_cache = _index_settings(getattr(embeddings, "model_name", EMBEDDING_MODEL))
+            _rag_chain_cache.clear()
+            _kb_query_cache.clear()
+        _kb_checked_at = time.monotonic()
+        return _retriever_cache
+
+_SENTENCE_PATTERN = re.compile(r".*?(?:[。！？；!?;\n]|\.(?=\s)|$)\s*", re.S)
+
+def trim_to_token_budget(text: str, max_tokens: int) -> str:
+    """在句子边界处截断文本使其不超过 max_tokens；第一句就超出预算时按字符比例硬截断"""
+    total = estimate_tokens(text)
+    if total <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+
+    kept = []
+    used = 0
+    for sentence in _SENTENCE_PATTERN.findall(text):
+        if not sentence:
+            continue
+        tokens = estimate_tokens(sentence)
+        if used + tokens > max_tokens:
+            break
+        kept.append(sentence)
+        used += tokens
+    if kept:
+        return "".join(kept).rstrip()
+    return text[:len(text) * max_tokens // total]
+
+def _prompt_tokens(prompt_template, inputs: dict) -> int:
+    """估算 prompt 渲染后的 token 数（对话消息每条额外计 4 个 token 的格式开销）"""
+    if isinstance(prompt_template, ChatPromptTemplate):
+        return sum(estimate_tokens(message.content) + 4 for message in prompt_template.format_messages(**inputs))
+    return estimate_tokens(prompt_template.format(**inputs))
+
+def prompt_token_budget(prompt_template, inputs: dict) -> int:
+    """
+    prompt 渲染后剩余可用的输入 token 数
+    
+    窗口大小减去预留的输出 token、安全余量和当前 prompt 本身的 token 数；为负数表示已经超出窗口。
+    """
+    return CHAT_CONTEXT_WINDOW - CHAT_MAX_TOKENS - CONTEXT_SAFETY_MARGIN - _prompt_tokens(prompt_template, inputs)
+
+def fit_prompt_inputs(prompt_template, inputs: dict, fields: List[str]) -> dict:
+    """
+    prompt 超出窗口时，从 fields 中最长的字段开始在句子边界处截断，直到放得下为止
     
-    # 定义一个合理的批处理大小
-    batch_size = 32 
+    Returns:
+        截断后的输入副本；不超出窗口时原样返回
+    """
+    inputs = dict(inputs)
+    overflow = -prompt_token_budget(prompt_template, inputs)
+    while overflow > 0:
+        lengths = {field: estimate_tokens(inputs[field]) for field in fields if inputs[field]}
+        if not lengths:
+            break
+        field = max(lengths, key=lengths.get)
+        inputs[field] = trim_to_token_budget(inputs[field], lengths[field] - overflow)
+        print(f"⚠️ 输入超出模型上下文窗口，已截断 {field}（约 {lengths[field]} -> {estimate_tokens(inputs[field])} tokens）")
+        overflow = -prompt_token_budget(prompt_template, inputs)
+    return inputs
+
+def _jaccard(a: set, b: set) -> float:
+    union = a | b
+    return len(a & b) / len(union) if union else 1.0
+
+def select_context_documents(documents: List[Document], lambda_mult: float = CONTEXT_MMR_LAMBDA) -> List[Document]:
+    """
+    对检索结果去重并按 MMR 重新排序
     
-    # 循环处理剩余的文档块
-    for i in range(1, len(split_docs), batch_size):
-        batch = split_docs[i:i + batch_size]
-        if batch:
-            vector_store.add_documents(batch)
-            print(f"  - 已处理批次 {i // batch_size + 1}")
+    documents 按相关性降序排列，相关性按名次线性递减；片段之间的相似度用 tokenize_for_search
+    词集合的 Jaccard 系数计算，不需要额外调用 embedding 接口。内容相同或高度重复的片段只保留一个。
+    """
+    candidates = []
+    seen = set()
+    for rank, doc in enumerate(documents):
+        content = _normalize_text(doc.page_content)
+        if not content or content in seen:
+            continue
+        seen.add(content)
+        candidates.append((1 - rank / len(documents), doc, set(tokenize_for_search(content))))
+
+    selected = []
+    while candidates:
+        redundancy = [max((_jaccard(terms, chosen) for _, chosen in selected), default=0.0) for _, _, terms in candidates]
+        best = max(range(len(candidates)), key=lambda i: lambda_mult * candidates[i][0] - (1 - lambda_mult) * redundancy[i])
+        _, doc, terms = candidates.pop(best)
+        if redundancy[best] < CONTEXT_DUPLICATE_THRESHOLD:
+            selected.append((doc, terms))
+    return [doc for doc, _ in selected]
+
+def pack_context_documents(documents: List[Document], budget: int) -> List[Document]:
+    """
+    在 token 预算内打包上下文：去重、MMR 排序后依次放入，放不下的片段在句子边界处截断
     
-    print("向量索引创建完成！")
-    retriever = vector_store.as_retriever()
+    Args:
+        documents: 检索结果，按相关性降序
+        budget: 上下文可用的 token 数，通常来自 prompt_token_budget
+        
+    Returns:
+        打包后的文档块；被截断的片段是保留原 metadata 的新 Document
+    """
+    packed = []
+    remaining = budget
+    for doc in select_context_documents(documents):
+        tokens = estimate_tokens(doc.page_content)
+        if tokens <= remaining:
+            packed.append(doc)
+            remaining -= tokens
+        elif remaining >= CONTEXT_MIN_CHUNK_TOKENS:
+            content = trim_to_token_budget(doc.page_content, remaining)
+            packed.append(Document(page_content=content, metadata=dict(doc.metadata)))
+            remaining -= estimate_tokens(content)
+    return packed
 
-    # 5. 创建并返回 RAG 链
-    llm = init_moonshot_llm(temperature)
+def create_rag_chain(prompt_template: ChatPromptTemplate, temperature: float = 0.7, backend: Optional[str] = None):
+    """
+    创建并返回 RAG (Retrieval-Augmented Generation) 链及共享的检索器。
     
-    # 这个链负责将检索到的文档"塞入"提示词
-    question_answer_chain = create_stuff_documents_chain(llm, prompt_template)
+    检索与生成拆开：调用方先用检索器取回文档块，经 pack_context_documents 按 token 预算打包后
+    作为 context 传给链，避免检索两次，也避免上下文超出模型窗口。
+    
+    向量索引和检索器按知识库版本只加载一次；链本身很轻量，按 (prompt 哈希, 温度, 模型) 
+    缓存在一个小型 LRU 中，切换 prompt 或调整温度不需要重建索引。
+    """
+    # 1. 获取共享的检索器（首次调用时加载持久化索引）
+    retriever = get_retriever()
+    if retriever is None:
+        return None, None # 返回 None 表示无法创建 RAG 链
+
+    # 2. 检查链缓存
+    key = (_prompt_hash(prompt_template), round(temperature, 3), chat_model_name(backend))
+    with _rag_chain_lock:
+        if key in _rag_chain_cache:
+            _rag_chain_cache.move_to_end(key)
+            return _rag_chain_cache[key], retriever
+
+    # 3. 创建并返回 RAG 链
+    from langchain.chains.combine_documents import create_stuff_documents_chain
+
+    llm = init_moonshot_llm(temperature, backend)
     
-    # 这个链负责"检索"->"塞入"->"生成"的完整流程
-    rag_chain = create_retrieval_chain(retriever, question_answer_chain)
+    # 这个链负责将打包好的文档"塞入"提示词并生成回答
+    rag_chain = create_stuff_documents_chain(llm, prompt_template)
     
     # 缓存结果
-    _rag_chain_cache = rag_chain
-    _retriever_cache = retriever
+    with _rag_chain_lock:
+        _rag_chain_cache[key] = rag_chain
+        if len(_rag_chain_cache) > RAG_CHAIN_CACHE_SIZE:
+            _rag_chain_cache.popitem(last=False)
     
-    print("✅ RAG链创建完成并已缓存")
     return rag_chain, retriever # 同时返回检索器，方便调试
 
-def init_moonshot_llm(temperature: float = 0.7) -> ChatOpenAI:
-    """初始化 Moonshot API 客户端"""
+def _snippet(text: str, max_chars: int = KB_SNIPPET_CHARS) -> str:
+    text = _normalize_text(text)
+    return text if len(text) <= max_chars else text[:max_chars].rstrip() + "…"
+
+def query_knowledge_base(query: str, k: int = RETRIEVER_K) -> tuple[Optional[List[dict]], Optional[str]]:
+    """
+    直接查询知识库检索器，不经过 LLM，返回前 k 个文档块片段及其来源
+    
+    与 RAG 链共用 get_retriever() 加载的持久化索引；结果按 (知识库版本, 归一化查询, k)
+    缓存在进程内 LRU 中，知识库版本变化时随检索器一起失效。
+    
+    Args:
+        query: 查询内容
+        k: 返回的片段数，最多为检索器的 top-k
+        
+    Returns:
+        (片段列表, 错误信息)；每个片段包含 source（文件名）、page（从 1 开始，非 PDF 为 None）、
+        chunk_id 和 content
+    """
+    query = _normalize_text(query)
+    if not query:
+        return None, "查询内容不能为空"
+
+    retriever = get_retriever()
+    if retriever is None:
+        if resolve_embedding_backend() == "openai" and not os.getenv("OPENAI_API_KEY"):
+            return None, "知识库不可用：EMBEDDING_BACKEND=openai 需要设置 OPENAI_API_KEY"
+        return None, "知识库不可用：知识库为空"
+
+    key = (_kb_version_cache, query.lower(), k)
+    with _rag_chain_lock:
+        if key in _kb_query_cache:
+            _kb_query_cache.move_to_end(key)
+            return list(_kb_query_cache[key]), None
+
+    try:
+        with span("retrieval", k=k) as retrieval_span:
+            documents = retriever.invoke(query)[:k]
+            retrieval_span["chunk_ids"] = [_doc_id(doc) for doc in documents]
+    except Exception as e:
+        return None, f"知识库检索失败：{str(e)}"
+
+    results = []
+    for doc in documents:
+        page = doc.metadata.get("page")
+        results.append({
+            "source": os.path.basename(doc.metadata.get("source", "")),
+            "page": page + 1 if isinstance(page, int) else None,
+            "chunk_id": _doc_id(doc),
+            "content": _snippet(doc.page_content),
+        })
+
+    with _rag_chain_lock:
+        _kb_query_cache[key] = tuple(results)
+        if len(_kb_query_cache) > KB_QUERY_CACHE_SIZE:
+            _kb_query_cache.popitem(last=False)
+    return results, None
+
+class ResponseCache:
+    """
+    基于 SQLite 的 LRU + TTL 响应缓存
+    
+    条目超过 ttl 秒即视为过期；总数超过 max_entries 时淘汰最久未访问的条目。
+    命中/未命中次数按进程统计，供侧边栏调试信息展示。
+    """
+
+    def __init__(self, path: str, ttl: int = RESPONSE_CACHE_TTL, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "size": size}
+
+_response_cache = None
+
+def get_response_cache() -> ResponseCache:
+    """获取进程内共享的响应缓存"""
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache(RESPONSE_CACHE_PATH)
+    return _response_cache
+
+def _normalize_text(text: str) -> str:
+    """合并空白字符，避免仅因换行、缩进不同而缓存未命中"""
+    return " ".join(text.split())
+
+def _prompt_hash(prompt_template) -> str:
+    return hashlib.sha256(prompt_template.pretty_repr().encode("utf-8")).hexdigest()[:16]
+
+def _doc_id(doc: Document) -> str:
+    """文档块 ID：入库时写入的 chunk_id，旧索引中没有时退化为内容哈希"""
+    return doc.metadata.get("chunk_id") or hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()[:16]
+
+def make_response_cache_key(
+    kind: str,
+    inputs: dict,
+    temperature: float,
+    prompt_template,
+    context_ids: Optional[List[str]] = None,
+    model: str = CHAT_MODEL
+) -> str:
+    """
+    生成响应缓存的键：归一化后的输入 + 温度 + 模型名 + prompt 模板哈希 + 检索到的文档块 ID
+    """
+    payload = {
+        "kind": kind,
+        "inputs": {name: _normalize_text(str(value)) for name, value in inputs.items()},
+        "temperature": round(temperature, 3),
+        "model": model,
+        "prompt": _prompt_hash(prompt_template),
+        "context_ids": context_ids or [],
+    }
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+def get_http_client() -> "httpx.Client":
+    """进程内共享的 keep-alive HTTP 连接池，所有 LLM / embedding 客户端复用，避免重复 TLS 握手"""
+    global _http_client
+    import httpx
+
+    with _llm_clients_lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_CONNECTIONS)
+            )
+        return _http_client
+
+def get_moonshot_llm(
+    temperature: float = 0.7,
+    request_timeout: int = 120,
+    model_name: str = CHAT_MODEL
+) -> "ChatOpenAI":
+    """
+    按 (模型, 温度, 超时) 复用 Moonshot 客户端
+    
+    同一组参数在进程内只创建一次 ChatOpenAI，所有客户端共享同一个 HTTP 连接池；
+    重试、退避和熔断统一由 retry_policy 的 chat 策略负责，request_timeout 为单次尝试的超时。
+    """
     api_key = os.getenv("MOONSHOT_API_KEY")
     if not api_key:
         raise ValueError("请设置 MOONSHOT_API_KEY 环境变量")
+
+    import openai
+    from langchain_openai import ChatOpenAI
+
+    key = (model_name, round(temperature, 3), request_timeout)
+    http_client = get_http_client()
+    with _llm_clients_lock:
+        if key not in _llm_clients:
+            # 直接传入基于共享连接池的同步客户端（langchain-openai 会把 http_client 参数同时用于异步客户端）
+            client = openai.OpenAI(
+                api_key=api_key,
+                base_url=MOONSHOT_API_BASE,
+                timeout=request_timeout,
+                max_retries=0,  # 关闭 SDK 自带的重试，避免与统一重试层叠加
+                http_client=http_client
+            )
+            _llm_clients[key] = ChatOpenAI(
+                # 共享限流额度，额度用完才等待；每次尝试（包括重试）按输入 token 加 max_tokens 预占额度
+                client=RetryingResource(
+                    client.chat.completions, get_retry_policy("chat"), request_timeout, get_rate_limiter("chat")
+                ),
+                temperature=temperature,
+                model_name=model_name,
+                openai_api_key=api_key,
+                openai_api_base=MOONSHOT_API_BASE,
+                max_tokens=CHAT_MAX_TOKENS,  # 提升最大输出长度，解决内容截断问题
+                request_timeout=request_timeout,
+                max_retries=0,
+                # 每次调用记为一个 llm span
+                callbacks=[TracingCallbackHandler()]
+            )
+        return _llm_clients[key]
+
+def resolve_llm_backend(backend: Optional[str] = None) -> str:
+    """解析实际使用的对话模型后端（moonshot / fake），未指定时使用 LLM_BACKEND"""
+    backend = backend or LLM_BACKEND
+    if backend not in LLM_BACKENDS:
+        raise ValueError(f"不支持的 LLM 后端: {backend}，可选: {', '.join(LLM_BACKENDS)}")
+    return backend
+
+def chat_model_name(backend: Optional[str] = None) -> str:
+    """后端对应的模型名，用于链缓存和响应缓存的键，本地模型的结果不会混入真实模型的缓存"""
+    return FAKE_CHAT_MODEL if resolve_llm_backend(backend) == "fake" else CHAT_MODEL
+
+def get_fake_llm(temperature: float = 0.7) -> FakeChatModel:
+    """按温度复用本地确定性模型；不占用 API 限流额度，调用同样记为 llm span"""
+    key = (FAKE_CHAT_MODEL, round(temperature, 3))
+    with _llm_clients_lock:
+        if key not in _llm_clients:
+            _llm_clients[key] = FakeChatModel(temperature=temperature, callbacks=[TracingCallbackHandler()])
+        return _llm_clients[key]
+
+def init_moonshot_llm(
+    temperature: float = 0.7,
+    backend: Optional[str] = None,
+    request_timeout: int = 120  # 增加超时时间到2分钟
+) -> "BaseChatModel":
+    """初始化对话模型：默认为 Moonshot API 客户端，backend（或 LLM_BACKEND）为 fake 时返回本地确定性模型"""
+    if resolve_llm_backend(backend) == "fake":
+        return get_fake_llm(temperature)
+    return get_moonshot_llm(temperature, request_timeout=request_timeout)
+
+def analysis_error_message(e: Exception, stage: str = "分析") -> str:
+    """把分析 / 任务生成过程中的异常转换为展示给用户的错误信息，限流（429 或熔断中）时附带提示"""
+    error_msg = f"{stage}过程中出现错误: {str(e)}"
+    if is_rate_limit_error(e):
+        error_msg += "\n\n💡 提示：API限流，请等待1-2分钟后重试"
+    return error_msg
+
+def stream_job_description_analysis(
+    jd_content: str,
+    resume_content: str,
+    temperature: float = 0.7,
+    use_cache: bool = True,
+    backend: Optional[str] = None
+) -> Iterator[str]:
+    """
+    流式分析职位描述和简历内容，模型输出的 token 到达即产出
     
-    return ChatOpenAI(
-        temperature=temperature,
-        model_name="moonshot-v1-8k",
-        openai_api_key=api_key,
-        openai_api_base="https://api.moonshot.cn/v1",
-        max_tokens=4096,  # 提升最大输出长度，解决内容截断问题
-        request_timeout=120,  # 增加超时时间到2分钟
-        max_retries=5  # 增加重试次数
-    )
+    命中响应缓存时一次性产出完整结果；完整消费后才写入缓存。出错时直接抛出异常。
+    接口饱和（重试耗尽或熔断）时降级：检索失败改走不带知识库的普通流程，
+    模型调用失败时返回同一输入最近一次成功的分析结果（不论是否带知识库），都没有时才抛出异常。
+    """
+    cache = get_response_cache()
+    inputs = {"jd_content": jd_content, "resume_content": resume_content}
+    model = chat_model_name(backend)
+    legacy_cache_key = make_response_cache_key("jd_analysis", inputs, temperature, jd_analysis_prompt_legacy, model=model)
+    # 与检索结果无关的“最近一次成功结果”，RAG 流程的答案也会写入，接口饱和时作为降级结果
+    last_good_key = make_response_cache_key("jd_analysis_last_good", inputs, temperature, jd_analysis_prompt, model=model)
+    pieces = []
+
+    # 1. 尝试创建 RAG 链（现在有缓存，不会重复向量化）
+    rag_chain, retriever = create_rag_chain(jd_analysis_prompt, temperature, backend)
+    documents = None
+    if rag_chain:
+        # 将JD作为核心输入检索知识库，再按 token 预算打包上下文（预留输出空间，JD 和简历过长时先截断它们）
+        prompt_inputs = fit_prompt_inputs(jd_analysis_prompt, {**inputs, "context": ""}, ["resume_content", "jd_content"])
+        try:
+            with span("retrieval") as retrieval_span:
+                documents = retriever.invoke(jd_content)
+                retrieval_span["chunk_ids"] = [_doc_id(doc) for doc in documents]
+        except Exception as e:
+            if not is_transient_error(e):
+                raise
+            print(f"⚠️ 知识库检索暂不可用（{e}），降级为普通分析流程")
+    
+    # 2. 如果 RAG 链创建成功，则使用 RAG 流程
+    if documents is not None:
+        with span("prompt_build") as prompt_span:
+            budget = prompt_token_budget(jd_analysis_prompt, prompt_inputs)
+            context = pack_context_documents(documents, budget)
+            context_tokens = sum(estimate_tokens(doc.page_content) for doc in context)
+            # 缓存键覆盖实际用到的知识库片段
+            context_ids = [_doc_id(doc) for doc in context]
+            prompt_span.update(
+                chunk_ids=context_ids, context_tokens=context_tokens, budget=budget,
+                prompt_tokens_estimate=_prompt_tokens(jd_analysis_prompt, prompt_inputs) + context_tokens
+            )
+        print(f"上下文打包：{len(context)}/{len(documents)} 个片段，约 {context_tokens} / {budget} tokens")
+
+        cache_key = make_response_cache_key("jd_analysis", inputs, temperature, jd_analysis_prompt, context_ids, model)
+        if use_cache:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                print("✅ 命中响应缓存，直接返回分析结果")
+                yield cached
+                return
+
+        print("正在使用 RAG 流程进行分析...")
+        tokens = rag_chain.stream({**prompt_inputs, "context": context})
+        
+    # 3. 如果 RAG 链创建失败（如知识库为空），则回退到普通流程
+    else:
+        cache_key = legacy_cache_key
+        if use_cache:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                print("✅ 命中响应缓存，直接返回分析结果")
+                yield cached
+                return
+
+        print("知识库为空或加载失败，回退到普通分析流程...")
+        llm = init_moonshot_llm(temperature, backend)
+        chain = jd_analysis_prompt_legacy | llm
+        
+        with span("prompt_build") as prompt_span:
+            prompt_inputs = fit_prompt_inputs(jd_analysis_prompt_legacy, inputs, ["resume_content", "jd_content"])
+            prompt_span["prompt_tokens_estimate"] = _prompt_tokens(jd_analysis_prompt_legacy, prompt_inputs)
+        tokens = (chunk.content for chunk in chain.stream(prompt_inputs))
+
+    try:
+        for token in tokens:
+            if token:
+                pieces.append(token)
+                yield token
+    except Exception as e:
+        # 已经输出了部分内容，或者不是接口饱和导致的错误，都不能再换成别的结果
+        if pieces or not is_transient_error(e):
+            raise
+        cached = cache.get(last_good_key)
+        if cached is None:
+            raise
+        print(f"⚠️ 模型接口暂不可用（{e}），返回该输入最近一次成功的分析结果")
+        yield cached
+        return
+
+    answer = "".join(pieces)
+    if answer:
+        cache.put(cache_key, answer)
+        cache.put(last_good_key, answer)
 
 def analyze_job_description(
     jd_content: str,
     resume_content: str,
-    temperature: float = 0.7
+    temperature: float = 0.7,
+    use_cache: bool = True,
+    backend: Optional[str] = None
 ) -> tuple[Optional[str], Optional[str]]:
     """
     分析职位描述和简历内容
     (已更新为 LangChain 最新语法，并集成 RAG 功能)
+    
+    相同输入、设置和检索结果的分析直接从响应缓存返回；use_cache=False 时跳过缓存读取，
+    重新生成并刷新缓存。backend 为 fake 时使用本地确定性模型（见 init_moonshot_llm）。
     """
-    try:
-        # 减少延迟，因为现在有缓存机制
-        import time
-        time.sleep(1)  # 从5秒减少到1秒
-        
-        # 1. 尝试创建 RAG 链（现在有缓存，不会重复向量化）
-        rag_chain, retriever = create_rag_chain(jd_analysis_prompt, temperature)
-        
-        # 2. 如果 RAG 链创建成功，则使用 RAG 流程
-        if rag_chain:
-            print("正在使用 RAG 流程进行分析...")
-            # 将JD作为核心输入，用于检索知识库
-            input_dict = {
-                "input": jd_content, 
-                "jd_content": jd_content,
-                "resume_content": resume_content
-            }
-            response = rag_chain.invoke(input_dict)
-            return response.get("answer"), None
-            
-        # 3. 如果 RAG 链创建失败（如知识库为空），则回退到普通流程
-        else:
-            print("知识库为空或加载失败，回退到普通分析流程...")
-            llm = init_moonshot_llm(temperature)
-            chain = jd_analysis_prompt_legacy | llm
-            
-            response = chain.invoke({
-                "jd_content": jd_content,
-                "resume_content": resume_content
-            })
-            
-            return response.content, None
+    with trace("jd_analysis") as request_trace:
+        try:
+            return "".join(stream_job_description_analysis(
+                jd_content, resume_content, temperature, use_cache, backend
+            )), None
+        except Exception as e:
+            request_trace.error = f"{type(e).__name__}: {e}"
+            return None, analysis_error_message(e)
+
+def analyze_job_descriptions_batch(
+    jd_contents: List[str],
+    resume_content: str,
+    temperature: float = 0.7,
+    max_concurrency: int = BATCH_MAX_CONCURRENCY,
+    use_cache: bool = True,
+    backend: Optional[str] = None
+) -> List[tuple[Optional[str], Optional[str]]]:
+    """
+    用同一份简历批量分析多个职位描述
+    
+    内容相同（忽略空白差异）的 JD 只检索、分析一次；不同 JD 在 max_concurrency 个线程中并发执行，
+    所有模型调用共享同一个 chat 限流器，吞吐量只受 API 额度限制。
+    
+    Args:
+        jd_contents: 职位描述列表
+        resume_content: 简历内容
+        temperature: 模型温度
+        max_concurrency: 同时进行的分析数
+        use_cache: 是否读取响应缓存
+        backend: 模型后端，为 None 时按 LLM_BACKEND 环境变量选择（见 resolve_llm_backend）
         
-    except Exception as e:
-        error_msg = f"分析过程中出现错误: {str(e)}"
-        if "429" in str(e) or "rate_limit" in str(e):
-            error_msg += "\n\n💡 提示：API限流，请等待1-2分钟后重试"
-        return None, error_msg
+    Returns:
+        与 jd_contents 顺序一致的 (分析结果, 错误信息) 列表，单个 JD 失败不影响其他 JD
+    """
+    distinct = OrderedDict()
+    for jd_content in jd_contents:
+        distinct.setdefault(_normalize_text(jd_content), jd_content)
+    print(f"批量分析：{len(jd_contents)} 个 JD，去重后 {len(distinct)} 个，并发数 {max_concurrency}")
 
-def generate_interview_schedule(
+    def analyze(jd_content: str) -> tuple[Optional[str], Optional[str]]:
+        return analyze_job_description(jd_content, resume_content, temperature, use_cache, backend)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+        results = dict(zip(distinct.keys(), executor.map(analyze, distinct.values())))
+
+    return [results[_normalize_text(jd_content)] for jd_content in jd_contents]
+
+def stream_interview_schedule(
     prompt_template: PromptTemplate,
     interview_date: date,
-    jd_analysis_result: str,  # 新增参数
-    temperature: float = 0.7
-) -> tuple[Optional[str], Optional[str]]:
-    """根据面试日期和JD分析报告，生成个性化的准备计划"""
-    try:
-        today = date.today()
-        days_diff = (interview_date - today).days
-        
-        if days_diff < 0:
-            return None, "面试日期不能早于今天。"
-        if days_diff == 0:
-            return "就是今天！祝你面试顺利，发挥出最佳水平！", None
+    jd_analysis_result: str,
+    temperature: float = 0.7,
+    use_cache: bool = True,
+    backend: Optional[str] = None
+) -> Iterator[str]:
+    """流式生成冲刺计划，模型输出的 token 到达即产出；面试日期早于今天时抛出 ValueError"""
+    today = date.today()
+    days_diff = (interview_date - today).days
+    
+    if days_diff < 0:
+        raise ValueError("面试日期不能早于今天。")
+    if days_diff == 0:
+        yield "就是今天！祝你面试顺利，发挥出最佳水平！"
+        return
 
-        llm = init_moonshot_llm(temperature)
-        chain = prompt_template | llm
+    weekdays = ["星期一", "星期二", "星期三", "星期四", "星期五", "星期六", "星期日"]
+    
+    inputs = {
+        "jd_analysis_result": jd_analysis_result,  # 传入新参数
+        "days_to_interview": days_diff + 1,
+        "today_date": today.strftime("%Y年%m月%d日") + " " + weekdays[today.weekday()],
+        "interview_date": interview_date.strftime("%Y年%m月%d日") + " " + weekdays[interview_date.weekday()]
+    }
 
-        weekdays = ["星期一", "星期二", "星期三", "星期四", "星期五", "星期六", "星期日"]
-        
-        response = chain.invoke({
-            "jd_analysis_result": jd_analysis_result,  # 传入新参数
-            "days_to_interview": days_diff + 1,
-            "today_date": today.strftime("%Y年%m月%d日") + " " + weekdays[today.weekday()],
-            "interview_date": interview_date.strftime("%Y年%m月%d日") + " " + weekdays[interview_date.weekday()]
-        })
+    cache = get_response_cache()
+    cache_key = make_response_cache_key(
+        "interview_schedule", inputs, temperature, prompt_template, model=chat_model_name(backend)
+    )
+    if use_cache:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            print("✅ 命中响应缓存，直接返回冲刺计划")
+            yield cached
+            return
 
-        return response.content, None
+    llm = init_moonshot_llm(temperature, backend)
+    chain = prompt_template | llm
 
-    except Exception as e:
-        error_msg = f"任务生成过程中出现错误: {str(e)}"
-        return None, error_msg
+    with span("prompt_build") as prompt_span:
+        prompt_inputs = fit_prompt_inputs(prompt_template, inputs, ["jd_analysis_result"])
+        prompt_span["prompt_tokens_estimate"] = _prompt_tokens(prompt_template, prompt_inputs)
+
+    pieces = []
+    for chunk in chain.stream(prompt_inputs):
+        if chunk.content:
+            pieces.append(chunk.content)
+            yield chunk.content
+
+    plan = "".join(pieces)
+    if plan:
+        cache.put(cache_key, plan)
+
+def generate_interview_schedule(
+    prompt_template: PromptTemplate,
+    interview_date: date,
+    jd_analysis_result: str,  # 新增参数
+    temperature: float = 0.7,
+    use_cache: bool = True,
+    backend: Optional[str] = None
+) -> tuple[Optional[str], Optional[str]]:
+    """根据面试日期和JD分析报告，生成个性化的准备计划（命中响应缓存时直接返回）"""
+    if interview_date < date.today():
+        return None, "面试日期不能早于今天。"
+    with trace("interview_schedule") as request_trace:
+        try:
+            return "".join(stream_interview_schedule(
+                prompt_template, interview_date, jd_analysis_result, temperature, use_cache, backend
+            )), None
+        except Exception as e:
+            request_trace.error = f"{type(e).__name__}: {e}"
+            return None, analysis_error_message(e, "任务生成")
 
 def validate_inputs(jd_content: str, resume_content: str) -> tuple[bool, str]:
     """验证输入内容